@@ -16,6 +16,12 @@ LEADS_CSV = TMP_DIR / "leads.csv"
 LEADS_JSON = TMP_DIR / "filtered_cars.json"
 STATUS_FILE = TMP_DIR / "lead_status.json"
 
+# Shared with the CRM (repo root) so titles are read the same way everywhere
+REPO_ROOT = BASE_DIR.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+from execution.vehicle_matching import parse_title  # noqa: E402
+
 # In-memory cache — loaded once at startup
 _cached_listings = []
 
@@ -61,10 +67,7 @@ def normalize_apify_item(item):
         )
 
     # ── Year (parse from title) ────────────────────────────────────────────
-    year = None
-    parts = title.split()
-    if parts and parts[0].isdigit() and len(parts[0]) == 4:
-        year = int(parts[0])
+    year = parse_title(title)[2]
 
     # ── Mileage from subtitles ─────────────────────────────────────────────
     # New format: customSubTitlesWithRenderingFlags
@@ -376,18 +379,8 @@ def api_bridge_match():
     title = data.get("title", "")
     
     # Parse brand/model/year from the FB listing title (e.g. "2020 Toyota Corolla")
-    parts = title.strip().split()
-    year = None
-    brand = ""
-    model = ""
-    
-    if parts and parts[0].isdigit() and len(parts[0]) == 4:
-        year = int(parts[0])
-        brand = parts[1] if len(parts) > 1 else ""
-        model = " ".join(parts[2:]) if len(parts) > 2 else ""
-    elif parts:
-        brand = parts[0]
-        model = " ".join(parts[1:]) if len(parts) > 1 else ""
+    brand, model, year = parse_title(title.strip())
+    brand, model = brand or "", model or ""
     
     # Parse mileage (remove "km", commas, etc)
     import re
@@ -7,16 +7,20 @@ Run:
 Then open: http://127.0.0.1:5001
 """
 
+import hashlib
 import io
 import json
 import os
 import sys
+import threading
 import time as _time
-from datetime import date, datetime
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 
 import requests as _requests
 from flask import Flask, jsonify, render_template, request, session, send_file
+from flask.json.provider import DefaultJSONProvider
 
 ROOT = Path(__file__).parent
 if str(ROOT) not in sys.path:
@@ -34,29 +38,14 @@ if env_file.exists():
 # db.py provides get_conn/get_db/get_crm_conn/row_to_dict that talk to Supabase
 # using the same .execute()/.fetchone()/.fetchall() interface as sqlite3.
 from db import get_conn, get_db, get_crm_conn, row_to_dict
+import db as _db
 
+from execution.appointments_mirror import AppointmentMirror, fetch_range as fetch_appointments_range
 from execution.consignment_logic import calculate_commission
+from execution.vehicle_matching import VehicleIndex, parse_title
 from execution.validate_dte_schema import validate as validate_schema
 
 
-def _parse_car_from_title(title):
-    """Parse car_make, car_model, car_year from a FB Marketplace title like '2025 Hyundai Creta'."""
-    import re as _re
-    if not title:
-        return None, None, None
-    parts = title.split()
-    car_year = None
-    # Strip leading year (e.g. "2025 Hyundai Creta" → ["Hyundai", "Creta"])
-    year_match = _re.search(r'\b(19|20)\d{2}\b', title)
-    if year_match:
-        car_year = int(year_match.group())
-    if parts and parts[0].isdigit() and len(parts[0]) == 4:
-        parts = parts[1:]  # remove year from front
-    car_make = parts[0] if len(parts) > 0 else None
-    car_model = " ".join(parts[1:]) if len(parts) > 1 else None
-    return car_make, car_model, car_year
-
-
 def log_to_file(msg):
     """Simple logger — prints to stdout and appends to simply_sync.log."""
     print(msg, flush=True)
@@ -66,9 +55,39 @@ def log_to_file(msg):
     except Exception:
         pass
 
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify()/request.json through db.py's codec (orjson when installed)."""
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # e.g. indent= from a caller: keep Flask's exact behaviour
+            return super().dumps(obj, **kwargs)
+        return _db.json_dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return _db.json_loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(_db.json_dumps(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get("SECRET_KEY", "autodirecto-crm-secret-2026")
 
+
+@app.errorhandler(_db.SupabaseUnavailable)
+def supabase_unavailable(e):
+    """Supabase down or circuit open: say so instead of rendering empty data."""
+    print(f"[db] {e}", flush=True)
+    resp = jsonify({"error": "Base de datos no disponible, reintenta en unos segundos"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(int(_db.SUPABASE_BREAKER_COOLDOWN))
+    return resp
+
 # ─── Mount Funnels Dashboard as Blueprint ─────────────────────────────────────
 FUNNELS_DIR = ROOT / "Funnels" / "dashboard"
 if FUNNELS_DIR.exists():
@@ -173,14 +192,10 @@ if FUNNELS_DIR.exists():
         if not url:
             return jsonify({"error": "Missing url"}), 400
         now_ts = int(_time.time())
-        # Upsert into Supabase
+        # Upsert into Supabase — only the fields being changed are sent, the
+        # rest of an existing row is kept (new rows get the column defaults)
         try:
-            with get_db() as conn:
-                existing = conn.execute(
-                    "SELECT * FROM funnel_lead_status WHERE url=?", (url,)
-                ).fetchone()
-            entry = row_to_dict(existing) if existing else {"url": url, "status": "new"}
-            entry["updated_at"] = now_ts
+            entry = {"url": url, "updated_at": now_ts}
             if status:
                 entry["status"] = status
                 if status == "contacted":
@@ -255,7 +270,7 @@ if FUNNELS_DIR.exists():
                                     break
 
                             title = (listing or {}).get("title", "") if listing else ""
-                            car_make, car_model, car_year = _parse_car_from_title(title)
+                            car_make, car_model, car_year = parse_title(title)
                             if listing and listing.get("year") and not car_year:
                                 car_year = int(listing["year"])
 
@@ -300,21 +315,25 @@ if FUNNELS_DIR.exists():
                                      title, valuation.get("market_price", "?")))
                             )
                             print(f"[funnels_api_update_status] Auto-created CRM lead #{lead_id} for {url}")
+                            _calendar_invalidate()   # a new Funnels lead can be suggested anywhere
 
                         crm.commit()
                 except Exception as e:
                     print(f"[funnels_api_update_status] Error syncing to crm_leads: {e}")
 
             with get_db() as conn:
-                if existing:
-                    set_clause = ", ".join(f"{k}=?" for k in entry if k != "url")
-                    vals = [entry[k] for k in entry if k != "url"] + [url]
-                    conn.execute(f"UPDATE funnel_lead_status SET {set_clause} WHERE url=?", vals)
-                else:
-                    cols = ", ".join(entry.keys())
-                    placeholders = ", ".join("?" for _ in entry)
-                    conn.execute(f"INSERT INTO funnel_lead_status ({cols}) VALUES ({placeholders})", list(entry.values()))
+                cols = ", ".join(entry.keys())
+                placeholders = ", ".join("?" for _ in entry)
+                set_clause = ", ".join(f"{k}=excluded.{k}" for k in entry if k != "url")
+                row = conn.execute(
+                    f"INSERT INTO funnel_lead_status ({cols}) VALUES ({placeholders}) "
+                    f"ON CONFLICT(url) DO UPDATE SET {set_clause} RETURNING *",
+                    list(entry.values())
+                ).fetchone()
                 conn.commit()
+            if row:
+                entry = row_to_dict(row)
+                entry.pop("id", None)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         # Also write to local file as backup
@@ -323,6 +342,8 @@ if FUNNELS_DIR.exists():
                 status_map = {}
                 if funnels_module.STATUS_FILE.exists():
                     status_map = json.loads(funnels_module.STATUS_FILE.read_text())
+                # Merge: without a RETURNING row, entry only has the changed fields
+                entry = {**status_map.get(url, {"url": url, "status": "new"}), **entry}
                 status_map[url] = entry
                 funnels_module.STATUS_FILE.write_text(json.dumps(status_map, indent=2))
             except Exception:
@@ -412,6 +433,7 @@ def update_user(user_id):
     with get_db() as conn:
         conn.execute("UPDATE crm_users SET {} WHERE id=?".format(set_clause), list(updates.values()) + [user_id])
         conn.commit()
+    _calendar_invalidate(user=user_id)
     return jsonify({"ok": True})
 
 
@@ -432,8 +454,10 @@ def auth_login():
     if not email or not password:
         return jsonify({"error": "Email y contraseña requeridos"}), 400
     with get_db() as conn:
+        # Uncached: a password change or deactivation on another worker
+        # must take effect immediately
         row = conn.execute(
-            "SELECT * FROM crm_users WHERE email=? AND active=1", (email,)
+            "SELECT * FROM crm_users WHERE email=? AND active=1", (email,), cache=False
         ).fetchone()
     if not row:
         return jsonify({"error": "Credenciales inválidas"}), 401
@@ -475,6 +499,7 @@ def link_appraisal(cid):
             (appraisal_id, "parte2_completa", now, now, cid)
         )
         conn.commit()
+        _calendar_invalidate(consig=cid)
         row = conn.execute("SELECT * FROM consignaciones WHERE id=?", (cid,)).fetchone()
     if not row:
         return jsonify({"error": "Not found"}), 404
@@ -551,6 +576,7 @@ def create_inspeccion():
                     params
                 )
                 conn.commit()
+            _calendar_invalidate(consig=consignacion_id)
 
         return jsonify({"ok": True, "appraisal_id": appraisal_id})
 
@@ -979,227 +1005,322 @@ def send_inspeccion_email(appraisal_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/calendar", methods=["GET"])
-def calendar_get():
+# Funnels leads as match candidates for the calendar and for new
+# consignaciones (see execution/vehicle_matching.py). Rebuilt from one SELECT
+# when this process writes crm_leads, or after FUNNELS_INDEX_TTL seconds to
+# pick up other workers' writes; sync() re-indexes only changed leads.
+FUNNELS_INDEX_TTL = float(os.environ.get("FUNNELS_INDEX_TTL", "60"))
+_funnels_idx = VehicleIndex()
+_funnels_idx_state = {"gen": None, "at": 0.0}
+_funnels_idx_lock = threading.Lock()
+
+
+_CALENDAR_MATCH_FIELDS = ("id", "full_name", "car_make", "car_model", "car_year",
+                          "mileage", "listing_price", "funnel_url")
+
+
+def _funnels_index():
+    with _funnels_idx_lock:
+        gen = _db.write_generation("crm_leads")
+        st = _funnels_idx_state
+        if st["gen"] != gen or _time.monotonic() - st["at"] > FUNNELS_INDEX_TTL:
+            with get_db() as conn:
+                rows = conn.execute(
+                    "SELECT id, full_name, car_make, car_model, car_year, mileage, listing_price, funnel_url, "
+                    "estimated_value, ai_consignacion_price, ai_instant_buy_price "
+                    "FROM crm_leads WHERE source='funnels'"
+                ).fetchall()
+            _funnels_idx.sync(row_to_dict(r) for r in rows)
+            st["gen"], st["at"] = gen, _time.monotonic()
+        return _funnels_idx
+
+
+# ─── Calendar month cache ─────────────────────────────────────────────────────
+# The merged payload of each (year, month) is kept with its ETag, so repeat
+# views are one dict lookup and clients revalidate with If-None-Match. Each
+# entry remembers which consignaciones, leads, Supabase appointments and users
+# it shows; writes call _calendar_invalidate() with what they touched and only
+# the months showing it (or containing the written dates) are dropped.
+# Changes made elsewhere (other workers, bookings made straight into Supabase)
+# are picked up after CALENDAR_CACHE_TTL seconds.
+CALENDAR_CACHE_TTL = float(os.environ.get("CALENDAR_CACHE_TTL", "60"))
+CALENDAR_CACHE_MAX_MONTHS = int(os.environ.get("CALENDAR_CACHE_MAX_MONTHS", "24"))
+_calendar_cache = OrderedDict()   # (year, month) → entry dict
+_calendar_cache_lock = threading.Lock()
+_calendar_cache_gen = [0]         # bumped by every invalidation
+
+
+def _calendar_refs(snap, events):
     """
-    Returns all appointments for a month, merged with local assignment data.
-    Query params: ?year=2026&month=2  (defaults to current month)
+    Everything a month was built from, as ("consig"|"lead"|"appt"|"user", id)
+    pairs — including rows the merge hid as duplicates, since editing one of
+    those can make it appear.
     """
-    import calendar as _cal
-    year = int(request.args.get("year", datetime.now().year))
-    month = int(request.args.get("month", datetime.now().month))
-    _, last_day = _cal.monthrange(year, month)
-    date_from = "{:04d}-{:02d}-01".format(year, month)
-    date_to = "{:04d}-{:02d}-{:02d}".format(year, month, last_day)
+    refs = {("appt", str(a.get("id"))) for a in snap["appointments"]}
+    refs.update(("consig", str(c["id"])) for c in snap["consigs"])
+    refs.update(("lead", str(la["id"])) for la in snap["local_appts"])
+    for ev in events:
+        if ev.get("assigned_user_id"):
+            refs.add(("user", str(ev["assigned_user_id"])))
+        for m in ev.get("matched_funnel_leads") or ():
+            refs.add(("lead", str(m["id"])))
+    return refs
+
+
+def _calendar_cache_get(key):
+    with _calendar_cache_lock:
+        entry = _calendar_cache.get(key)
+        if entry is not None and entry["expires"] > _time.monotonic():
+            _calendar_cache.move_to_end(key)
+            return entry, None
+        _calendar_cache.pop(key, None)
+        return None, _calendar_cache_gen[0]
+
+
+def _calendar_cache_put(key, body, refs, gen):
+    entry = {
+        "body": body,
+        "etag": hashlib.sha1(body).hexdigest()[:20],
+        "refs": refs,
+        "expires": _time.monotonic() + CALENDAR_CACHE_TTL,
+    }
+    with _calendar_cache_lock:
+        # A write landed while the month was being built — serve, don't keep
+        if gen == _calendar_cache_gen[0] and CALENDAR_CACHE_TTL > 0:
+            _calendar_cache[key] = entry
+            _calendar_cache.move_to_end(key)
+            while len(_calendar_cache) > CALENDAR_CACHE_MAX_MONTHS:
+                _calendar_cache.popitem(last=False)
+    return entry
 
-    supabase_url = os.environ.get("SUPABASE_URL", "")
-    supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "") or os.environ.get("SUPABASE_ANON_KEY", "")
 
-    appointments = []
-    if supabase_url and supabase_key:
-        try:
-            resp = _requests.get(
-                supabase_url + "/rest/v1/appointments",
-                params={
-                    "select": "*",
-                    "appointment_date": "gte.{}".format(date_from),
-                    "appointment_date": "lte.{}".format(date_to),
-                    "order": "appointment_date.asc,appointment_time.asc"
-                },
-                headers={"apikey": supabase_key, "Authorization": "Bearer " + supabase_key},
-                timeout=10
-            )
-            if resp.status_code == 200:
-                appointments = resp.json()
-        except Exception as e:
-            print("[Calendar] Supabase error:", e)
+def _calendar_invalidate(*dates, consig=None, lead=None, appt=None, user=None):
+    """
+    Drop the cached months containing any of dates ("YYYY-MM-DD…") or showing
+    the given consignación / CRM lead / Supabase appointment / user id.
+    Called with no arguments, drops every month.
+    """
+    refs = {(kind, str(v)) for kind, v in
+            (("consig", consig), ("lead", lead), ("appt", appt), ("user", user)) if v}
+    months = set()
+    for d in dates:
+        d = str(d or "")
+        if len(d) >= 7 and d[:4].isdigit() and d[5:7].isdigit():
+            months.add((int(d[:4]), int(d[5:7])))
+    drop_all = not dates and all(v is None for v in (consig, lead, appt, user))
+    with _calendar_cache_lock:
+        _calendar_cache_gen[0] += 1
+        for key in list(_calendar_cache):
+            if drop_all or key in months or refs & _calendar_cache[key]["refs"]:
+                del _calendar_cache[key]
+
+
+# ─── Supabase appointments mirror ─────────────────────────────────────────────
+# The calendar reads Supabase appointments from an in-process mirror that is
+# loaded once and then refreshed with updated_at deltas at most every
+# APPOINTMENTS_MIRROR_TTL seconds, on a background thread, through db.py's
+# HTTP path (see execution/appointments_mirror.py). Upstream deletes are
+# picked up within APPOINTMENTS_MIRROR_RECONCILE seconds by an id-only check.
+# Rows it sees change invalidate the cached months they fall in. Until the first load lands, or
+# if the table has no updated_at, each month is one date-range query instead.
+APPOINTMENTS_MIRROR_TTL = float(os.environ.get("APPOINTMENTS_MIRROR_TTL", "10"))
+APPOINTMENTS_MIRROR_RECONCILE = float(os.environ.get("APPOINTMENTS_MIRROR_RECONCILE", "60"))
+APPOINTMENTS_MIRROR_RESYNC = float(os.environ.get("APPOINTMENTS_MIRROR_RESYNC", "900"))
+_appointments_mirror = AppointmentMirror(
+    ttl=APPOINTMENTS_MIRROR_TTL, reconcile=APPOINTMENTS_MIRROR_RECONCILE,
+    resync=APPOINTMENTS_MIRROR_RESYNC,
+    on_change=lambda dates: _calendar_invalidate(*dates),
+)
+
+
+def _fetch_supabase_appointments(date_from, date_to):
+    if not (_db.SUPABASE_URL and _db.SUPABASE_KEY):
+        return []
+    rows = _appointments_mirror.window(date_from, date_to)
+    if rows is not None:
+        return rows
+    try:
+        return fetch_appointments_range(date_from, date_to)
+    except Exception as e:
+        print("[Calendar] Supabase error:", e)
+    return []
+
+
+def _plate_key(row):
+    return (row.get("plate") or "").upper().strip()
 
-    # Merge with local consignaciones (assignment info)
+
+def _calendar_month_snapshot(date_from, date_to):
+    """
+    Everything the calendar merges for one month, each source read once:
+    Supabase appointments, the month's consignaciones, local CRM appointments
+    and their assigned users — plus the lookup maps the merge runs against.
+    """
+    appointments = _fetch_supabase_appointments(date_from, date_to)
     with get_db() as conn:
-        consig_rows = conn.execute(
-            "SELECT * FROM consignaciones WHERE appointment_date BETWEEN ? AND ?",
+        consigs = [row_to_dict(r) for r in conn.execute(
+            "SELECT id, owner_first_name, owner_last_name, owner_full_name, owner_phone, owner_email, owner_rut, "
+            "plate, car_make, car_model, car_year, mileage, version, appointment_date, appointment_time, "
+            "status, assigned_user_id, appointment_supabase_id FROM consignaciones "
+            "WHERE appointment_date BETWEEN ? AND ? ORDER BY id",
             (date_from, date_to)
-        ).fetchall()
-        consig_by_supabase_id = {r["appointment_supabase_id"]: row_to_dict(r) for r in consig_rows if r["appointment_supabase_id"]}
+        ).fetchall()]
+        local_appts = [row_to_dict(r) for r in conn.execute(
+            "SELECT id, first_name, last_name, full_name, phone, plate, car_make, car_model, car_year, "
+            "appointment_date, appointment_time, stage, source FROM crm_leads "
+            "WHERE appointment_date BETWEEN ? AND ? AND (supabase_id IS NULL OR supabase_id='') AND source NOT IN ('funnels') AND appointment_date IS NOT NULL",
+            (date_from, date_to)
+        ).fetchall()]
+
+    # Assigned users in one batch. Only what the calendar chips show — never
+    # the password column.
+    users = _db.loader("crm_users", select="id, name, email, role, color")
+    users.want(c["assigned_user_id"] for c in consigs)
+
+    return {
+        "appointments": appointments,
+        "local_appts": local_appts,
+        "consigs": consigs,
+        "consig_by_supabase_id": {c["appointment_supabase_id"]: c for c in consigs if c["appointment_supabase_id"]},
+        "consig_by_plate": {_plate_key(c): c for c in consigs if _plate_key(c)},
+        "users": users,
+    }
 
-        users_map = {r["id"]: row_to_dict(r) for r in conn.execute("SELECT * FROM crm_users").fetchall()}
 
+def _calendar_events(snap):
+    """Merge a month snapshot into the calendar's event list (unsorted)."""
+    users = snap["users"]
     result = []
-    for appt in appointments:
-        appt_id = appt.get("id")
-        consig = consig_by_supabase_id.get(appt_id, {})
+    seen_consig_ids = set()
+    seen_plate_date = set()   # (plate, date) already on the calendar
+
+    def add(ev):
+        result.append(ev)
+        if ev.get("consignacion_id"):
+            seen_consig_ids.add(ev["consignacion_id"])
+        if _plate_key(ev):
+            seen_plate_date.add((_plate_key(ev), ev.get("appointment_date") or ""))
+
+    # 1. Supabase appointments, with local assignment info
+    for appt in snap["appointments"]:
+        consig = snap["consig_by_supabase_id"].get(appt.get("id"), {})
         assigned_user_id = consig.get("assigned_user_id")
-        result.append({
+        add({
             **appt,
             "consignacion_id": consig.get("id"),
             "consignacion_status": consig.get("status", "sin_consignacion"),
             "assigned_user_id": assigned_user_id,
-            "assigned_user": users_map.get(assigned_user_id) if assigned_user_id else None,
+            "assigned_user": users.load(assigned_user_id),
         })
+    supabase_plate_date = set(seen_plate_date)
 
-    # Collect plates already present from Supabase appointments to avoid duplicates
-    supabase_plates = set()
-    for ev in result:
-        p = (ev.get("plate") or "").upper().strip()
-        d = ev.get("appointment_date") or ""
-        if p:
-            supabase_plates.add((p, d))
-
-    # Also include appointments from local CRM (no supabase_id, exclude funnels)
-    with get_db() as conn:
-        local_appts = conn.execute(
-            "SELECT * FROM crm_leads WHERE appointment_date BETWEEN ? AND ? AND (supabase_id IS NULL OR supabase_id='') AND source NOT IN ('funnels') AND appointment_date IS NOT NULL",
-            (date_from, date_to)
-        ).fetchall()
-    for la in local_appts:
-        la_dict = row_to_dict(la)
-        # Skip entries with no actual appointment_date
-        if not la_dict.get("appointment_date"):
+    # 2. Appointments from the local CRM (no supabase_id, not funnels), unless
+    # the same plate+date already came from Supabase
+    for la in snap["local_appts"]:
+        if not la.get("appointment_date"):
             continue
-        # Skip if same plate+date already exists from Supabase appointments
-        p = (la_dict.get("plate") or "").upper().strip()
-        d = la_dict.get("appointment_date") or ""
-        if p and (p, d) in supabase_plates:
+        if _plate_key(la) and (_plate_key(la), la["appointment_date"]) in supabase_plate_date:
             continue
-        result.append({
-            "id": "local-{}".format(la_dict["id"]),
-            "first_name": la_dict.get("first_name"),
-            "last_name": la_dict.get("last_name"),
-            "full_name": la_dict.get("full_name"),
-            "phone": la_dict.get("phone"),
-            "plate": la_dict.get("plate"),
-            "car_make": la_dict.get("car_make"),
-            "car_model": la_dict.get("car_model"),
-            "car_year": la_dict.get("car_year"),
-            "appointment_date": la_dict.get("appointment_date"),
-            "appointment_time": la_dict.get("appointment_time"),
-            "status": la_dict.get("stage", "agendado"),
-            "source": la_dict.get("source", "local"),
+        add({
+            "id": "local-{}".format(la["id"]),
+            "first_name": la.get("first_name"),
+            "last_name": la.get("last_name"),
+            "full_name": la.get("full_name"),
+            "phone": la.get("phone"),
+            "plate": la.get("plate"),
+            "car_make": la.get("car_make"),
+            "car_model": la.get("car_model"),
+            "car_year": la.get("car_year"),
+            "appointment_date": la.get("appointment_date"),
+            "appointment_time": la.get("appointment_time"),
+            "status": la.get("stage", "agendado"),
+            "source": la.get("source", "local"),
             "consignacion_id": None,
             "consignacion_status": "sin_consignacion",
             "assigned_user_id": None,
             "assigned_user": None,
         })
 
-    # Also include consignaciones created directly via wizard (no supabase appointment)
-    seen_consig_ids = {ev.get("consignacion_id") for ev in result if ev.get("consignacion_id")}
-    # Build a set of plate+date combos already in results to avoid duplicates
-    seen_plate_date = set()
-    for ev in result:
-        p = (ev.get("plate") or "").upper().strip()
-        d = ev.get("appointment_date") or ""
-        if p:
-            seen_plate_date.add((p, d))
-
-    # Try to link unlinked Supabase appointments to consignaciones by plate
-    with get_db() as conn:
-        all_consigs = conn.execute(
-            "SELECT * FROM consignaciones WHERE appointment_date BETWEEN ? AND ?",
-            (date_from, date_to)
-        ).fetchall()
-    consig_by_plate = {}
-    for c in all_consigs:
-        cd = row_to_dict(c)
-        p = (cd.get("plate") or "").upper().strip()
-        if p:
-            consig_by_plate[p] = cd
-
+    # 3. Link events without a consignación to one by plate
     for ev in result:
         if not ev.get("consignacion_id"):
-            p = (ev.get("plate") or "").upper().strip()
-            if p and p in consig_by_plate:
-                c = consig_by_plate[p]
+            c = snap["consig_by_plate"].get(_plate_key(ev))
+            if c:
                 ev["consignacion_id"] = c["id"]
                 ev["consignacion_status"] = c.get("status", "pendiente")
                 seen_consig_ids.add(c["id"])
 
-    # Add consignaciones not yet represented
-    with get_db() as conn:
-        direct_consigs = conn.execute(
-            "SELECT * FROM consignaciones WHERE appointment_date BETWEEN ? AND ? AND (appointment_supabase_id IS NULL OR appointment_supabase_id='')",
-            (date_from, date_to)
-        ).fetchall()
-    for dc in direct_consigs:
-        dc_dict = row_to_dict(dc)
-        if dc_dict["id"] in seen_consig_ids:
+    # 4. Consignaciones created directly via the wizard (no Supabase
+    # appointment) that are not represented yet
+    for dc in snap["consigs"]:
+        if dc.get("appointment_supabase_id"):
+            continue
+        if dc["id"] in seen_consig_ids:
             continue  # Already in results via supabase match or plate match
-        plate = (dc_dict.get("plate") or "").upper().strip()
-        date = dc_dict.get("appointment_date") or ""
-        if plate and (plate, date) in seen_plate_date:
-            continue  # Same plate+date already in calendar from Supabase appointment
-        assigned_user_id = dc_dict.get("assigned_user_id")
+        if _plate_key(dc) and (_plate_key(dc), dc.get("appointment_date") or "") in seen_plate_date:
+            continue  # Same plate+date already in calendar from another source
+        assigned_user_id = dc.get("assigned_user_id")
         result.append({
-            "id": "consig-{}".format(dc_dict["id"]),
-            "first_name": dc_dict.get("owner_first_name"),
-            "last_name": dc_dict.get("owner_last_name"),
-            "full_name": dc_dict.get("owner_full_name"),
-            "phone": dc_dict.get("owner_phone"),
-            "email": dc_dict.get("owner_email"),
-            "rut": dc_dict.get("owner_rut"),
-            "plate": dc_dict.get("plate"),
-            "car_make": dc_dict.get("car_make"),
-            "car_model": dc_dict.get("car_model"),
-            "car_year": dc_dict.get("car_year"),
-            "mileage": dc_dict.get("mileage"),
-            "version": dc_dict.get("version"),
-            "appointment_date": dc_dict.get("appointment_date"),
-            "appointment_time": dc_dict.get("appointment_time"),
-            "status": dc_dict.get("status", "pendiente"),
+            "id": "consig-{}".format(dc["id"]),
+            "first_name": dc.get("owner_first_name"),
+            "last_name": dc.get("owner_last_name"),
+            "full_name": dc.get("owner_full_name"),
+            "phone": dc.get("owner_phone"),
+            "email": dc.get("owner_email"),
+            "rut": dc.get("owner_rut"),
+            "plate": dc.get("plate"),
+            "car_make": dc.get("car_make"),
+            "car_model": dc.get("car_model"),
+            "car_year": dc.get("car_year"),
+            "mileage": dc.get("mileage"),
+            "version": dc.get("version"),
+            "appointment_date": dc.get("appointment_date"),
+            "appointment_time": dc.get("appointment_time"),
+            "status": dc.get("status", "pendiente"),
             "source": "wizard",
-            "consignacion_id": dc_dict["id"],
-            "consignacion_status": dc_dict.get("status", "pendiente"),
+            "consignacion_id": dc["id"],
+            "consignacion_status": dc.get("status", "pendiente"),
             "assigned_user_id": assigned_user_id,
-            "assigned_user": users_map.get(assigned_user_id) if assigned_user_id else None,
+            "assigned_user": users.load(assigned_user_id),
         })
+    return result
 
-    # Enrich each appointment with Funnels match suggestions
-    with get_db() as conn:
-        for ev in result:
-            make = (ev.get("car_make") or "").lower().strip()
-            model = (ev.get("car_model") or "").lower().strip()
-            year = ev.get("car_year")
-            if not make and not model:
-                ev["matched_funnel_leads"] = []
-                continue
-            # Score every funnels lead against this appointment
-            candidates = conn.execute(
-                "SELECT id, full_name, car_make, car_model, car_year, mileage, listing_price, funnel_url FROM crm_leads WHERE source='funnels'"
-            ).fetchall()
-            matches = []
-            for c in candidates:
-                score = 0
-                c_make = (c["car_make"] or "").lower().strip()
-                c_model = (c["car_model"] or "").lower().strip()
-                # Funnels often stores title as "2017 Mazda CX-5" → car_make="2017", car_model="Mazda CX-5"
-                # So also search the model field for make matches
-                c_combined = (c_make + " " + c_model).lower()
-                c_year = c["car_year"]
-                if make and (make in c_make or make in c_model or make in c_combined):
-                    score += 40
-                if model and c_model and (model in c_model or c_model in model):
-                    score += 40
-                if year and c_year and int(year) == int(c_year):
-                    score += 30  # exact year bonus
-                elif year and c_year and abs(int(year) - int(c_year)) <= 1:
-                    score += 15
-                if score >= 60:
-                    matches.append({
-                        "id": c["id"],
-                        "full_name": c["full_name"],
-                        "car_make": c["car_make"],
-                        "car_model": c["car_model"],
-                        "car_year": c["car_year"],
-                        "mileage": c["mileage"],
-                        "listing_price": c["listing_price"],
-                        "funnel_url": c["funnel_url"],
-                        "score": score,
-                    })
-            matches.sort(key=lambda x: -x["score"])
-            ev["matched_funnel_leads"] = matches[:8]
-
-    # Sort all by date then time
-    result.sort(key=lambda x: (x.get("appointment_date") or "", x.get("appointment_time") or ""))
-    return jsonify(result)
+
+@app.route("/api/calendar", methods=["GET"])
+def calendar_get():
+    """
+    Returns all appointments for a month, merged with local assignment data.
+    Query params: ?year=2026&month=2  (defaults to current month)
+    """
+    import calendar as _cal
+    year = int(request.args.get("year", datetime.now().year))
+    month = int(request.args.get("month", datetime.now().month))
+    _, last_day = _cal.monthrange(year, month)
+    date_from = "{:04d}-{:02d}-01".format(year, month)
+    date_to = "{:04d}-{:02d}-{:02d}".format(year, month, last_day)
+
+    entry, gen = _calendar_cache_get((year, month))
+    if entry is None:
+        snap = _calendar_month_snapshot(date_from, date_to)
+        result = _calendar_events(snap)
+
+        # Enrich each appointment with Funnels match suggestions from the index
+        suggestions = _funnels_index().match_many(
+            (ev.get("car_make"), ev.get("car_model"), ev.get("car_year")) for ev in result)
+        for ev, matches in zip(result, suggestions):
+            ev["matched_funnel_leads"] = [
+                {**{k: lead.get(k) for k in _CALENDAR_MATCH_FIELDS}, "score": score}
+                for score, lead in matches
+            ]
+
+        # Sort all by date then time
+        result.sort(key=lambda x: (x.get("appointment_date") or "", x.get("appointment_time") or ""))
+        entry = _calendar_cache_put((year, month), _db.json_dumps(result), _calendar_refs(snap, result), gen)
+
+    resp = app.response_class(entry["body"], mimetype="application/json")
+    resp.set_etag(entry["etag"])
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
 
 
 @app.route("/api/calendar/assign", methods=["POST"])
@@ -1287,6 +1408,7 @@ def calendar_assign():
             consig_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
         conn.commit()
         row = conn.execute("SELECT * FROM consignaciones WHERE id=?", (consig_id,)).fetchone()
+    _calendar_invalidate(row["appointment_date"] if row else None, consig=consig_id, appt=supabase_id)
     return jsonify({"ok": True, "consignacion": row_to_dict(row)})
 
 
@@ -1350,61 +1472,26 @@ def create_consignacion():
 
     # ── Match against existing funnels leads (FB Marketplace) by make+model+year ──
     # Then call MrCar AI to get real pricing, and create/update a CRM lead as "Agendado".
+    matched_lead = None
     try:
         car_make_val = (car.get("make") or g("carMake", "car_make") or "").strip().upper()
         car_model_val = (car.get("model") or g("carModel", "car_model") or "").strip().upper()
         car_year_val = car.get("year") or g("carYear", "car_year") or ""
         mileage_val = g("mileage") or ""
 
-        matched_lead = None
         listing_price = None   # What the FB seller asks
         print("[consignacion] matching: make={} model={} year={}".format(car_make_val, car_model_val, car_year_val), flush=True)
 
         with get_crm_conn() as crm:
-            # Try to find a funnels lead that matches this car.
-            # Funnels car_model = "Brand Model" (e.g. "Mazda CX-5") and car_year = year.
-            # Wizard sends make="TOYOTA", model="YARIS" separately.
-            # Strategy: use the same point-based scoring logic as the calendar view.
+            # Try to find a funnels lead that matches this car, with the same
+            # scoring as the calendar suggestions (execution/vehicle_matching.py).
             if car_make_val or car_model_val:
-                make = car_make_val.lower().strip()
-                model = car_model_val.lower().strip()
-                year = car_year_val
-
-                candidates = crm.execute(
-                    "SELECT id, full_name, car_make, car_model, car_year, mileage, "
-                    "listing_price, estimated_value, ai_consignacion_price, ai_instant_buy_price, funnel_url "
-                    "FROM crm_leads WHERE source='funnels'"
-                ).fetchall()
-
-                matches = []
-                for c in candidates:
-                    score = 0
-                    c_make = (c["car_make"] or "").lower().strip()
-                    c_model = (c["car_model"] or "").lower().strip()
-                    c_combined = (c_make + " " + c_model).lower()
-                    c_year = c["car_year"]
-
-                    if make and (make in c_make or make in c_model or make in c_combined):
-                        score += 40
-                    if model and c_model and (model in c_model or c_model in model):
-                        score += 40
-                    if year and c_year and int(year) == int(c_year):
-                        score += 30  # exact year bonus
-                    elif year and c_year and abs(int(year) - int(c_year)) <= 1:
-                        score += 15
-
-                    if score >= 60:
-                        matches.append({
-                            "lead": c,
-                            "score": score
-                        })
-
-                if matches:
-                    matches.sort(key=lambda x: -x["score"])
-                    matched_lead = matches[0]["lead"]
+                best = _funnels_index().match(car_make_val, car_model_val, car_year_val, limit=1)
+                if best:
+                    score, matched_lead = best[0]
                     listing_price = matched_lead.get("listing_price") or matched_lead.get("estimated_value")
                     print("[consignacion] MATCHED funnels lead id={} with score={}, listing_price={}".format(
-                        matched_lead.get("id"), matches[0]["score"], listing_price), flush=True)
+                        matched_lead.get("id"), score, listing_price), flush=True)
 
             print(f"[consignacion] Matching checkpoints - Plate: {plate}, SupaID: {supa_id}, RUT: {g('rut')}, Phone: {g('phone')}", flush=True)
 
@@ -1473,7 +1560,7 @@ def create_consignacion():
                         region, commune, address, plate, car_make, car_model, car_year,
                         mileage, version, appointment_date, appointment_time,
                         stage, source, supabase_id, created_at, updated_at
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
                 """, (
                     first_name, last_name, full_name,
                     g("rut"), g("phone"), g("countryCode", "country_code") or "+56", g("email"),
@@ -1574,6 +1661,7 @@ def create_consignacion():
         print("[consignacion→crm_lead] error:", e, flush=True)
         traceback.print_exc()
 
+    _calendar_invalidate(appointment_date, consig=new_id, lead=matched_lead.get("id") if matched_lead else None)
     return jsonify({"ok": True, "id": new_id, "consignacion": row_to_dict(row or inserted)}), 201
 
 
@@ -1581,49 +1669,29 @@ def create_consignacion():
 def get_consignaciones():
     status = request.args.get("status")
     with get_db() as conn:
-        q = "SELECT * FROM consignaciones WHERE 1=1"
+        # Assigned user name/color come back embedded in the same request
+        q = ("SELECT c.*, u.name as assigned_user_name, u.color as assigned_user_color "
+             "FROM consignaciones c LEFT JOIN crm_users u ON c.assigned_user_id=u.id WHERE 1=1")
         params = []
         if status:
-            q += " AND status=?"
+            q += " AND c.status=?"
             params.append(status)
-        q += " ORDER BY appointment_date ASC, appointment_time ASC"
+        q += " ORDER BY c.appointment_date ASC, c.appointment_time ASC"
         rows = conn.execute(q, params).fetchall()
-    result = [row_to_dict(r) for r in rows]
-    # Resolve assigned user names in a second pass
-    user_cache = {}
-    for c in result:
-        uid = c.get("assigned_user_id")
-        if uid and uid not in user_cache:
-            try:
-                with get_db() as conn2:
-                    u = conn2.execute("SELECT name, color FROM crm_users WHERE id=?", (uid,)).fetchone()
-                    user_cache[uid] = row_to_dict(u) if u else {}
-            except:
-                user_cache[uid] = {}
-        if uid and user_cache.get(uid):
-            c["assigned_user_name"] = user_cache[uid].get("name", "")
-            c["assigned_user_color"] = user_cache[uid].get("color", "")
-    return jsonify(result)
+    return jsonify([row_to_dict(r) for r in rows])
 
 
 @app.route("/api/consignaciones/<int:cid>", methods=["GET"])
 def get_consignacion(cid):
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM consignaciones WHERE id=?",
+            "SELECT c.*, u.name as assigned_user_name FROM consignaciones c "
+            "LEFT JOIN crm_users u ON c.assigned_user_id=u.id WHERE c.id=?",
             (cid,)
         ).fetchone()
     if not row:
         return jsonify({"error": "Not found"}), 404
-    result = row_to_dict(row)
-    # Add assigned user name if assigned
-    if result.get("assigned_user_id"):
-        with get_db() as conn:
-            user = conn.execute("SELECT * FROM crm_users WHERE id=?", (result["assigned_user_id"],)).fetchone()
-            result["assigned_user_name"] = row_to_dict(user).get("name") if user else None
-    else:
-        result["assigned_user_name"] = None
-    return jsonify(result)
+    return jsonify(row_to_dict(row))
 
 
 @app.route("/api/consignaciones/<int:cid>", methods=["PATCH"])
@@ -1689,6 +1757,7 @@ def update_consignacion(cid):
     except Exception as e_sync:
         print(f"[update_consignacion] sync error: {e_sync}", flush=True)
 
+    _calendar_invalidate(updates.get("appointment_date"), consig=cid)
     result["ok"] = True
     return jsonify(result)
 
@@ -1769,6 +1838,7 @@ def _sync_crm_lead_stage(plate, consig_status, appt_id=None, rut=None, phone=Non
                              CRM_STAGE_LABELS.get(new_stage, new_stage)))
                     )
                     conn.commit()
+                    _calendar_invalidate(lead=lead["id"])
                     log_to_file(f"[sync_crm_stage] Successfully updated lead {lead['id']} stage to {new_stage}")
             else:
                 log_to_file(f"[sync_crm_stage] No matching CRM lead found")
@@ -1804,6 +1874,7 @@ def _sync_crm_lead_owner_details(consig):
             with get_db() as conn:
                 conn.execute("UPDATE consignaciones SET owner_full_name=? WHERE id=?", (full, consig_id))
                 conn.commit()
+                _calendar_invalidate(consig=consig_id)
                 print(f"[sync_crm_owner] Updated local owner_full_name for {consig_id} to: {full}", flush=True)
         except Exception as e:
             print(f"[sync_crm_owner] Local full_name update error for {consig_id}: {e}", flush=True)
@@ -1869,6 +1940,7 @@ def _sync_crm_lead_owner_details(consig):
                     list(lead_updates.values()) + [lead["id"]]
                 )
                 conn.commit()
+                _calendar_invalidate(lead=lead["id"])
                 print(f"[sync_crm_owner] Successfully pushed updates to CRM lead {lead['id']}", flush=True)
             else:
                 print(f"[sync_crm_owner] No matching CRM lead found for consig {consig_id}", flush=True)
@@ -1961,6 +2033,7 @@ def _sync_consignacion_from_crm_lead(lead):
                     list(consig_updates.values()) + [cid]
                 )
                 conn.commit()
+                _calendar_invalidate(consig_updates.get("appointment_date"), consig=cid)
                 print(f"[sync_consig_from_crm] Updated consig #{cid} with: {list(consig_updates.keys())}", flush=True)
             else:
                 print(f"[sync_consig_from_crm] No matching consignacion found for CRM lead {lead_id}", flush=True)
@@ -2087,39 +2160,20 @@ def publicar_en_catalogo(cid):
         "featured":          False,
     }
 
-    # 4. Upsert into listings table (insert or update if plate already published)
+    # 4. Upsert into listings table (insert or update if already published).
+    #    One POST keyed on the unique consignacion_id — no read-then-write race.
     try:
-        # Try update first
-        check_r = req_lib.get(
+        post_r = req_lib.post(
             supabase_url + "/rest/v1/listings",
-            params={"select": "id", "consignacion_id": "eq.{}".format(cid)},
-            headers=headers, timeout=10
+            params={"on_conflict": "consignacion_id"},
+            json={**listing_payload, "updated_at": datetime.now().isoformat()},
+            headers={**headers, "Prefer": "return=representation,resolution=merge-duplicates"},
+            timeout=10
         )
-        existing_listings = check_r.json() if check_r.status_code == 200 else []
-
-        if existing_listings:
-            # Update
-            listing_id = existing_listings[0]["id"]
-            put_r = req_lib.patch(
-                supabase_url + "/rest/v1/listings?id=eq.{}".format(listing_id),
-                json={**listing_payload, "updated_at": datetime.now().isoformat()},
-                headers={**headers, "Prefer": "return=representation"},
-                timeout=10
-            )
-            result_listing = put_r.json()
-            listing_id = result_listing[0]["id"] if isinstance(result_listing, list) and result_listing else listing_id
-        else:
-            # Insert
-            post_r = req_lib.post(
-                supabase_url + "/rest/v1/listings",
-                json=listing_payload,
-                headers=headers,
-                timeout=10
-            )
-            if post_r.status_code not in (200, 201):
-                return jsonify({"error": "Supabase error {}: {}".format(post_r.status_code, post_r.text)}), 502
-            result_listing = post_r.json()
-            listing_id = result_listing[0]["id"] if isinstance(result_listing, list) and result_listing else None
+        if post_r.status_code not in (200, 201):
+            return jsonify({"error": "Supabase error {}: {}".format(post_r.status_code, post_r.text)}), 502
+        result_listing = post_r.json()
+        listing_id = result_listing[0]["id"] if isinstance(result_listing, list) and result_listing else None
 
         # Mark consignacion as en_venta + store listing_id
         now = datetime.now().isoformat()
@@ -2129,6 +2183,7 @@ def publicar_en_catalogo(cid):
                 (str(listing_id) if listing_id else None, now, cid)
             )
             conn.commit()
+            _calendar_invalidate(consig=cid)
 
             # Auto-promote to inventory if not already there
             c = row_to_dict(conn.execute("SELECT * FROM consignaciones WHERE id=?", (cid,)).fetchone())
@@ -2210,6 +2265,7 @@ def promote_to_inventory(cid):
             (car_id, now, cid)
         )
         conn.commit()
+    _calendar_invalidate(consig=cid)
 
     return jsonify({"ok": True, "car_id": car_id, "message": "Auto promovido al inventario"})
 
@@ -3398,6 +3454,7 @@ def crm_create_lead():
             )
             conn.commit()
             row = conn.execute("SELECT * FROM crm_leads WHERE id=?", (lead_id,)).fetchone()
+            _calendar_invalidate(record.get("appointment_date"), lead=lead_id)
             return jsonify(row_to_dict(row)), 201
         except Exception as e:
             return jsonify({"error": str(e)}), 409
@@ -3471,6 +3528,7 @@ def crm_update_lead(lead_id):
         row = conn.execute("SELECT * FROM crm_leads WHERE id=?", (lead_id,)).fetchone()
 
     result = row_to_dict(row)
+    _calendar_invalidate(updates.get("appointment_date"), lead=lead_id)
 
     # ── Reverse sync: push owner details to matching consignacion ──
     _sync_consignacion_from_crm_lead(result)
@@ -3487,6 +3545,7 @@ def crm_delete_lead(lead_id):
         conn.execute("DELETE FROM crm_activities WHERE lead_id=?", (lead_id,))
         conn.execute("DELETE FROM crm_leads WHERE id=?", (lead_id,))
         conn.commit()
+    _calendar_invalidate(lead=lead_id)
     return jsonify({"ok": True})
 
 
@@ -3523,28 +3582,51 @@ def crm_add_activity(lead_id):
 
 
 # ─── CRM API: Pipeline Stats ──────────────────────────────────────────────────
+def _utc_naive(value):
+    """A stored timestamp as naive UTC (naive values are taken as UTC, like SQL's datetime('now'))."""
+    if not value:
+        return None
+    try:
+        t = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t
+
+
 @app.route("/api/crm/stats")
 def crm_stats():
     with get_crm_conn() as conn:
-        total = conn.execute("SELECT COUNT(*) FROM crm_leads").fetchone()[0]
-        pipeline = {}
-        for stage in CRM_STAGES:
-            count = conn.execute("SELECT COUNT(*) FROM crm_leads WHERE stage=?", (stage,)).fetchone()[0]
-            pipeline[stage] = count
-        # Source breakdown
-        all_leads = conn.execute("SELECT source FROM crm_leads").fetchall()
+        # Pipeline, source breakdown and total from one grouped query
+        groups = conn.execute(
+            "SELECT stage, source, COUNT(*) AS n FROM crm_leads GROUP BY stage, source"
+        ).fetchall()
+        total = 0
+        pipeline = {stage: 0 for stage in CRM_STAGES}
         source_map = {}
-        for r in all_leads:
-            src = r.get("source") or "unknown"
-            source_map[src] = source_map.get(src, 0) + 1
-        # Recent leads (last 7 days)
-        recent = conn.execute(
-            "SELECT COUNT(*) FROM crm_leads WHERE created_at >= datetime('now', '-7 days')"
-        ).fetchone()[0]
-        # Leads needing follow-up
-        needs_followup = conn.execute(
-            "SELECT COUNT(*) FROM crm_leads WHERE next_followup_at <= datetime('now') AND stage NOT IN ('vendido', 'descartado')"
-        ).fetchone()[0]
+        for r in groups:
+            total += r["n"]
+            if r["stage"] in pipeline:
+                pipeline[r["stage"]] += r["n"]
+            src = r["source"] or "unknown"
+            source_map[src] = source_map.get(src, 0) + r["n"]
+        # Recent leads (last 7 days) and leads needing follow-up: one narrow
+        # query for both, told apart here
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        week_ago = now - timedelta(days=7)
+        recent = needs_followup = 0
+        for r in conn.execute(
+            "SELECT created_at, next_followup_at, stage FROM crm_leads "
+            "WHERE created_at >= datetime('now', '-7 days') "
+            "OR (next_followup_at <= datetime('now') AND stage NOT IN ('vendido', 'descartado'))"
+        ).fetchall():
+            created = _utc_naive(r["created_at"])
+            followup = _utc_naive(r["next_followup_at"])
+            if created and created >= week_ago:
+                recent += 1
+            if followup and followup <= now and r["stage"] not in ("vendido", "descartado"):
+                needs_followup += 1
     return jsonify({
         "total": total,
         "pipeline": pipeline,
@@ -3581,18 +3663,21 @@ def crm_sync_supabase():
 
     imported = 0
     skipped = 0
-    with get_crm_conn() as conn:
+    # Writes are buffered and sent as bulk POSTs on commit()
+    with get_crm_conn(batch_writes=True) as conn:
+        # Already-imported ids in one query instead of one lookup per appointment
+        known_ids = {str(r["supabase_id"]) for r in conn.execute(
+            "SELECT supabase_id FROM crm_leads WHERE supabase_id IS NOT NULL"
+        )}
         for appt in appointments:
             supabase_id = appt.get("id")
             if not supabase_id:
                 continue
             # Check if already imported
-            existing = conn.execute(
-                "SELECT id FROM crm_leads WHERE supabase_id=?", (supabase_id,)
-            ).fetchone()
-            if existing:
+            if str(supabase_id) in known_ids:
                 skipped += 1
                 continue
+            known_ids.add(str(supabase_id))
             # Map Supabase appointment → CRM lead
             stage_map = {
                 'agendado': 'agendado',
@@ -3627,6 +3712,8 @@ def crm_sync_supabase():
             )
             imported += 1
         conn.commit()
+    if imported:
+        _calendar_invalidate()
 
     return jsonify({"ok": True, "imported": imported, "skipped": skipped, "total_from_supabase": len(appointments)})
 
@@ -3646,20 +3733,22 @@ def crm_import_funnels():
     imported = 0
     skipped = 0
     import re as _re
-    with get_crm_conn() as conn:
+    # Writes are buffered and sent as bulk POSTs on commit()
+    with get_crm_conn(batch_writes=True) as conn:
+        known_urls = {r["funnel_url"] for r in conn.execute(
+            "SELECT funnel_url FROM crm_leads WHERE funnel_url IS NOT NULL"
+        )}
         for lead in leads:
             funnel_url = lead.get("url", "")
             if not funnel_url:
                 continue
-            existing = conn.execute(
-                "SELECT id FROM crm_leads WHERE funnel_url=?", (funnel_url,)
-            ).fetchone()
-            if existing:
+            if funnel_url in known_urls:
                 skipped += 1
                 continue
+            known_urls.add(funnel_url)
             # Parse vehicle info from title
             title = lead.get("title", "")
-            car_make, car_model, car_year = _parse_car_from_title(title)
+            car_make, car_model, car_year = parse_title(title)
             # Parse mileage
             mileage_raw = lead.get("mileage", "")
             mileage = None
@@ -3697,6 +3786,8 @@ def crm_import_funnels():
             )
             imported += 1
         conn.commit()
+    if imported:
+        _calendar_invalidate()
     return jsonify({"ok": True, "imported": imported, "skipped": skipped, "total_funnels": len(leads)})
 
 
@@ -3710,18 +3801,25 @@ def index():
 @app.route("/api/stats")
 def stats():
     with get_conn() as conn:
-        total = conn.execute("SELECT COUNT(*) FROM cars").fetchone()[0]
-        available = conn.execute("SELECT COUNT(*) FROM cars WHERE status='available'").fetchone()[0]
-        sold = conn.execute("SELECT COUNT(*) FROM cars WHERE status='sold'").fetchone()[0]
-        sent_dte = conn.execute("SELECT COUNT(*) FROM cars WHERE status='sent_dte'").fetchone()[0]
-        draft_dte = conn.execute("SELECT COUNT(*) FROM cars WHERE status='draft_dte'").fetchone()[0]
-
-        # Commission sums (sold + sent_dte cars)
+        # Counts per status and sales totals from one grouped query
+        counts, ventas = {}, {}
+        for r in conn.execute(
+            "SELECT status, COUNT(*) AS n, SUM(selling_price) AS ventas FROM cars GROUP BY status"
+        ).fetchall():
+            counts[r["status"]] = r["n"]
+            ventas[r["status"]] = r["ventas"] or 0
+        total = sum(counts.values())
+        available = counts.get("available", 0)
+        sold = counts.get("sold", 0)
+        sent_dte = counts.get("sent_dte", 0)
+        draft_dte = counts.get("draft_dte", 0)
+        total_ventas = ventas.get("sold", 0) + ventas.get("sent_dte", 0)
+
+        # Commission is rounded per car, so it still needs the two columns
         rows = conn.execute(
             "SELECT selling_price, commission_pct FROM cars WHERE status IN ('sold','sent_dte')"
         ).fetchall()
         total_commission = sum(round((r["selling_price"] or 0) * (r["commission_pct"] or 0)) for r in rows)
-        total_ventas = sum(r["selling_price"] or 0 for r in rows)
 
     return jsonify({
         "total": total,
@@ -3734,6 +3832,28 @@ def stats():
     })
 
 
+# ─── API: Admin — DB adapter diagnostics ──────────────────────────────────────
+@app.route("/api/admin/db-stats")
+def admin_db_stats():
+    """
+    Top-N most expensive SQL fingerprints plus adapter counters (admins only).
+    With SUPABASE_COLUMN_AUDIT set, "columns" lists fetched vs. read columns.
+    """
+    user = session.get("user") or {}
+    if user.get("role") != "admin":
+        return jsonify({"error": "Solo administradores"}), 403
+    n = request.args.get("top", 20, type=int)
+    by = request.args.get("by", "total_ms")
+    return jsonify({
+        "backend": _db.DB_BACKEND,
+        "slow_query_ms": _db.SUPABASE_SLOW_QUERY_MS,
+        "adapter": _db.get_stats(),
+        "top": _db.top_queries(n, by=by),
+        "recent": _db.query_log(request.args.get("recent", 0, type=int)),
+        "columns": _db.column_usage(),
+    })
+
+
 # ─── API: Cars (inventory) ────────────────────────────────────────────────────
 @app.route("/api/cars", methods=["GET"])
 def get_cars():
@@ -6,13 +6,38 @@ Replaces sqlite3 with Supabase REST API calls, using the same
 so app.py needs minimal changes.
 
 All CRM tables live in Supabase Postgres instead of a local SQLite file.
+Set DB_BACKEND=sqlite to run the same SQL against a local SQLite file
+(DB_PATH) instead — for single-node deployments and offline development.
 """
 
 import os
 import json
+import random
 import re
+import bisect
+import calendar
+import dataclasses
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
 import requests as _req
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID
+
+try:
+    import orjson as _orjson
+except ImportError:  # optional: the stdlib codec is used instead
+    _orjson = None
+
+ROOT = Path(__file__).parent
+
+# "supabase" (default) or "sqlite"
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase").strip().lower()
+DB_PATH = os.getenv("DB_PATH", str(ROOT / "data" / "inventory.db"))
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = (
@@ -20,6 +45,24 @@ SUPABASE_KEY = (
     or os.environ.get("SUPABASE_ANON_KEY", "")
 )
 
+# HTTP connection pool (one keep-alive session per worker process)
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "10"))
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", "3.05"))
+SUPABASE_READ_TIMEOUT = float(os.environ.get("SUPABASE_READ_TIMEOUT", "10"))
+
+# Retries for GET/HEAD/DELETE, with full-jitter backoff capped at MAX_BACKOFF
+SUPABASE_RETRIES = int(os.environ.get("SUPABASE_RETRIES", "2"))
+SUPABASE_RETRY_BACKOFF = float(os.environ.get("SUPABASE_RETRY_BACKOFF", "0.1"))
+SUPABASE_RETRY_MAX_BACKOFF = float(os.environ.get("SUPABASE_RETRY_MAX_BACKOFF", "1.0"))
+# Circuit breaker: THRESHOLD failures in a row open it for COOLDOWN seconds
+SUPABASE_BREAKER_THRESHOLD = int(os.environ.get("SUPABASE_BREAKER_THRESHOLD", "5"))
+SUPABASE_BREAKER_COOLDOWN = float(os.environ.get("SUPABASE_BREAKER_COOLDOWN", "30"))
+
+# Rows per Range request when paging through large SELECTs
+SUPABASE_PAGE_SIZE = int(os.environ.get("SUPABASE_PAGE_SIZE", "1000"))
+# Rows per bulk POST when a batch_writes connection commits
+SUPABASE_BULK_SIZE = int(os.environ.get("SUPABASE_BULK_SIZE", "500"))
+
 
 def _headers(prefer_return=True):
     h = {
@@ -36,6 +79,466 @@ def _rest(table):
     return f"{SUPABASE_URL}/rest/v1/{table}"
 
 
+# ─── JSON Codec ───────────────────────────────────────────────────────────────
+# orjson when installed, the stdlib otherwise (SUPABASE_JSON=stdlib forces it).
+
+SUPABASE_JSON = os.environ.get("SUPABASE_JSON", "auto").strip().lower()
+JSON_CODEC = "orjson" if _orjson is not None and SUPABASE_JSON != "stdlib" else "stdlib"
+
+
+def _json_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, (Decimal, UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    if isinstance(o, _AuditRow):
+        # Serialised as a whole: every column reaches the client
+        o._escaped()
+        return dict(dict.items(o))
+    # Other subclasses, passed through while the column audit is on
+    for base in (dict, list, str, int):
+        if isinstance(o, base):
+            return base(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if JSON_CODEC == "orjson":
+    _ORJSON_OPTS = _orjson.OPT_NON_STR_KEYS
+
+    def json_loads(data):
+        return _orjson.loads(data)
+
+    def json_dumps(obj):
+        # orjson writes dict subclasses natively, which would bypass _AuditRow's
+        # bookkeeping; while the audit samples, route subclasses through default
+        opts = _ORJSON_OPTS | _orjson.OPT_PASSTHROUGH_SUBCLASS if SUPABASE_COLUMN_AUDIT else _ORJSON_OPTS
+        return _orjson.dumps(obj, default=_json_default, option=opts)
+else:
+    _json_encoder = json.JSONEncoder(default=_json_default, ensure_ascii=False,
+                                     separators=(",", ":"))
+
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj):
+        return _json_encoder.encode(obj).encode("utf-8")
+
+
+# ─── HTTP Session Pool ────────────────────────────────────────────────────────
+# One keep-alive session per process, rebuilt after a fork (gunicorn workers).
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "sessions_created": 0, "bulk_rows": 0,
+          "gets_coalesced": 0, "rows_shared": 0,
+          "retries": 0, "breaker_trips": 0, "breaker_rejections": 0,
+          "loader_batches": 0, "loader_keys": 0, "loader_hits": 0}
+
+
+def _session_get():
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            s = _req.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=SUPABASE_POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session, _session_pid = s, pid
+            with _stats_lock:
+                _stats["sessions_created"] += 1
+    return _session
+
+
+def _reset_session_after_fork():
+    # Drop the parent's session without closing it — its sockets belong to
+    # the parent process.
+    global _session, _session_pid, _session_lock, _stats_lock, _cache_lock, _inflight_lock, _query_lock
+    global _column_lock, _breaker_lock
+    _session, _session_pid = None, None
+    _session_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _cache_lock = threading.Lock()
+    _inflight_lock = threading.Lock()
+    _inflight.clear()
+    _query_lock = threading.Lock()
+    _query_log.clear()
+    _query_agg.clear()
+    _column_lock = threading.Lock()
+    _column_usage.clear()
+    _breaker_lock = threading.Lock()
+    _breakers.clear()
+    _cache.clear()
+    _cache_stats.clear()
+    _stats.update(dict.fromkeys(_stats, 0))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_session_after_fork)
+
+
+def _pool_stats():
+    """Connections opened vs. requests served, summed over urllib3 pools."""
+    opened = served = 0
+    s = _session
+    if s is None or _session_pid != os.getpid():
+        return {"connections_opened": 0, "pool_requests": 0}
+    for adapter in set(s.adapters.values()):
+        pools = getattr(adapter.poolmanager, "pools", None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += getattr(pool, "num_connections", 0)
+            served += getattr(pool, "num_requests", 0)
+    return {"connections_opened": opened, "pool_requests": served}
+
+
+def get_stats():
+    """Adapter counters for this worker process."""
+    with _stats_lock:
+        out = dict(_stats)
+    pool = _pool_stats()
+    out.update(pool)
+    out["connections_reused"] = max(0, pool["pool_requests"] - pool["connections_opened"])
+    out["pid"] = os.getpid()
+    out["pool_size"] = SUPABASE_POOL_SIZE
+    out["plan_cache"] = plan_cache_stats()
+    out["read_cache"] = cache_stats()
+    out["breakers"] = breaker_state()
+    out["json_codec"] = JSON_CODEC
+    return out
+
+
+# ─── Retries & Circuit Breaker ────────────────────────────────────────────────
+# Idempotent calls retry on 502/503/504; a per-host breaker then fails fast.
+
+class SupabaseUnavailable(Exception):
+    """Supabase could not be reached (or the circuit breaker is open)."""
+
+
+_RETRY_METHODS = ("GET", "HEAD", "DELETE")
+_RETRY_STATUS = (502, 503, 504)
+
+_breaker_lock = threading.Lock()
+_breakers = {}   # host → {"failures", "opened_at", "probe_at"}
+
+
+def _host():
+    return SUPABASE_URL.split("://", 1)[-1].split("/", 1)[0]
+
+
+def _breaker_allow(host):
+    """Raise SupabaseUnavailable if the breaker is open; let one probe through after cooldown."""
+    with _breaker_lock:
+        b = _breakers.get(host)
+        if b is None or b["opened_at"] is None:
+            return
+        now = time.monotonic()
+        last = b["probe_at"] or b["opened_at"]
+        if now - last >= SUPABASE_BREAKER_COOLDOWN:
+            b["probe_at"] = now   # half-open: this caller is the probe
+            return
+    with _stats_lock:
+        _stats["breaker_rejections"] += 1
+    raise SupabaseUnavailable(f"circuit open for {host}")
+
+
+def _breaker_record(host, ok):
+    with _breaker_lock:
+        b = _breakers.setdefault(host, {"failures": 0, "opened_at": None, "probe_at": None})
+        if ok:
+            b.update(failures=0, opened_at=None, probe_at=None)
+            return
+        b["failures"] += 1
+        tripped = b["probe_at"] is not None or (b["opened_at"] is None and b["failures"] >= SUPABASE_BREAKER_THRESHOLD)
+        if tripped:
+            b.update(opened_at=time.monotonic(), probe_at=None)
+    if tripped:
+        with _stats_lock:
+            _stats["breaker_trips"] += 1
+        print(f"[db] circuit open for {host} after {b['failures']} failures; failing fast for {SUPABASE_BREAKER_COOLDOWN:g}s")
+
+
+def breaker_state():
+    with _breaker_lock:
+        now = time.monotonic()
+        return {
+            host: {"failures": b["failures"],
+                   "open": b["opened_at"] is not None,
+                   "open_for_s": round(now - b["opened_at"], 1) if b["opened_at"] is not None else 0}
+            for host, b in _breakers.items()
+        }
+
+
+def _backoff(attempt):
+    cap = min(SUPABASE_RETRY_MAX_BACKOFF, SUPABASE_RETRY_BACKOFF * (2 ** attempt))
+    time.sleep(random.uniform(0, cap))
+
+
+def _http(method, table, **kwargs):
+    """Send one PostgREST request through the pooled session."""
+    kwargs.setdefault("timeout", (SUPABASE_CONNECT_TIMEOUT, SUPABASE_READ_TIMEOUT))
+    if "json" in kwargs:
+        # Callers' headers already carry Content-Type: application/json
+        kwargs["data"] = json_dumps(kwargs.pop("json"))
+    host = _host()
+    attempts = 1 + (SUPABASE_RETRIES if method in _RETRY_METHODS else 0)
+    try:
+        for attempt in range(attempts):
+            _breaker_allow(host)
+            try:
+                r = _session_get().request(method, _rest(table), **kwargs)
+            except (_req.ConnectionError, _req.Timeout) as e:
+                _breaker_record(host, False)
+                # A read timeout means the server is slow, not gone; retrying
+                # only multiplies the wait.
+                if attempt + 1 < attempts and not isinstance(e, _req.ReadTimeout):
+                    with _stats_lock:
+                        _stats["retries"] += 1
+                    _backoff(attempt)
+                    continue
+                raise SupabaseUnavailable(f"{method} {table}: {e}") from e
+            if r.status_code not in _RETRY_STATUS:
+                _breaker_record(host, True)
+                break
+            _breaker_record(host, False)
+            if attempt + 1 == attempts:
+                raise SupabaseUnavailable(f"{method} {table}: HTTP {r.status_code}")
+            with _stats_lock:
+                _stats["retries"] += 1
+            _backoff(attempt)
+    finally:
+        if method not in ("GET", "HEAD"):
+            _cache_invalidate(table)
+    with _stats_lock:
+        _stats["requests"] += 1
+    io = getattr(_query_local, "io", None)
+    if io is not None:
+        io["status"] = r.status_code
+        io["bytes"] += len(r.content)
+    return r
+
+
+# ─── Read Cache ───────────────────────────────────────────────────────────────
+# Per-process LRU for the tables in SUPABASE_CACHE_TTLS ("table=seconds,...").
+# Local writes invalidate; execute(..., cache=False) reads through.
+
+def _parse_ttls(spec):
+    ttls = {}
+    for part in spec.split(","):
+        name, _, secs = part.partition("=")
+        if name.strip() and secs.strip():
+            ttls[name.strip().lower()] = float(secs)
+    return ttls
+
+
+SUPABASE_CACHE_TTLS = _parse_ttls(
+    os.environ.get("SUPABASE_CACHE_TTLS", "crm_users=60,funnel_lead_status=15"))
+SUPABASE_CACHE_MAX_ENTRIES = int(os.environ.get("SUPABASE_CACHE_MAX_ENTRIES", "256"))
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()   # key → (expires_at, rows)
+_cache_gen = {}          # table → write generation
+_cache_stats = {}        # table → {hits, misses, invalidations, evictions}
+
+
+def _freeze(params):
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                        for k, v in params.items()))
+
+
+def _cache_key(table, select, filters, order, limit):
+    return (table, select, _freeze(filters), order, limit)
+
+
+def _table_stats(table):
+    st = _cache_stats.get(table)
+    if st is None:
+        st = _cache_stats[table] = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+    return st
+
+
+def _cache_lookup(key):
+    """Return (rows, generation); rows is None on a miss."""
+    table = key[0]
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key)
+            _table_stats(table)["hits"] += 1
+            return entry[1], None
+        if entry is not None:
+            del _cache[key]
+        _table_stats(table)["misses"] += 1
+        return None, _cache_gen.get(table, 0)
+
+
+def _cache_store(key, rows, gen):
+    table = key[0]
+    with _cache_lock:
+        # A write landed while we were fetching — the rows may be stale
+        if _cache_gen.get(table, 0) != gen:
+            return
+        _cache[key] = (time.monotonic() + SUPABASE_CACHE_TTLS[table], rows)
+        _cache.move_to_end(key)
+        while len(_cache) > SUPABASE_CACHE_MAX_ENTRIES:
+            old_key, _ = _cache.popitem(last=False)
+            _table_stats(old_key[0])["evictions"] += 1
+
+
+def _cache_invalidate(table):
+    with _cache_lock:
+        _cache_gen[table] = _cache_gen.get(table, 0) + 1
+        if table not in SUPABASE_CACHE_TTLS:
+            return
+        for key in [k for k in _cache if k[0] == table]:
+            del _cache[key]
+        _table_stats(table)["invalidations"] += 1
+
+
+def write_generation(table):
+    """
+    Counter bumped by every write this process makes to table. In-memory
+    structures derived from a table (e.g. the calendar's vehicle index)
+    compare it to know when to refresh.
+    """
+    return _cache_gen.get(table, 0)
+
+
+def cache_clear():
+    with _cache_lock:
+        _cache.clear()
+        for table in list(_cache_gen):
+            _cache_gen[table] += 1
+
+
+def cache_stats():
+    """Per-table read-cache counters with hit rate, for tuning the TTLs."""
+    with _cache_lock:
+        out = {}
+        for table, ttl in SUPABASE_CACHE_TTLS.items():
+            st = dict(_table_stats(table))
+            lookups = st["hits"] + st["misses"]
+            st["hit_rate"] = round(st["hits"] / lookups, 3) if lookups else None
+            st["entries"] = sum(1 for k in _cache if k[0] == table)
+            st["ttl"] = ttl
+            out[table] = st
+    return out
+
+
+# ─── Query Instrumentation ────────────────────────────────────────────────────
+# Per-statement fingerprint, status, bytes, rows and time; slow ones are logged.
+
+SUPABASE_QUERY_LOG_SIZE = int(os.environ.get("SUPABASE_QUERY_LOG_SIZE", "1000"))
+SUPABASE_SLOW_QUERY_MS = float(os.environ.get("SUPABASE_SLOW_QUERY_MS", "500"))
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_query_local = threading.local()
+_query_lock = threading.Lock()
+_query_log = deque(maxlen=SUPABASE_QUERY_LOG_SIZE)
+_query_agg = {}   # fingerprint → aggregate dict
+
+
+def _fingerprint(sql):
+    """Normalise SQL so statements differing only in literals group together."""
+    fp = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    fp = re.sub(r"\b\d+\b", "?", fp)
+    fp = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", fp)
+    return re.sub(r"\s+", " ", fp).strip()
+
+
+def _query_io_begin():
+    io = {"status": None, "bytes": 0}
+    _query_local.io = io
+    return io
+
+
+def _query_io_end():
+    _query_local.io = None
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if has_request_context():
+        return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+    return None
+
+
+def _record_query(plan, status, nbytes, rows, seconds):
+    ms = seconds * 1000
+    route = _current_route()
+    fp = plan.fingerprint
+    entry = {
+        "ts": time.time(), "fingerprint": fp, "table": plan.table, "verb": plan.kind,
+        "status": status, "bytes": nbytes, "rows": rows, "ms": round(ms, 2), "route": route,
+    }
+    with _query_lock:
+        _query_log.append(entry)
+        agg = _query_agg.get(fp)
+        if agg is None:
+            agg = _query_agg[fp] = {
+                "fingerprint": fp, "table": plan.table, "verb": plan.kind,
+                "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "bytes": 0, "rows": 0, "routes": {},
+                "histogram": [0] * (len(_LATENCY_BUCKETS) + 1),
+            }
+        agg["calls"] += 1
+        agg["errors"] += status == "error" or (isinstance(status, int) and status >= 400)
+        agg["total_ms"] += ms
+        agg["max_ms"] = max(agg["max_ms"], ms)
+        agg["bytes"] += nbytes
+        agg["rows"] += rows
+        if route:
+            agg["routes"][route] = agg["routes"].get(route, 0) + 1
+        agg["histogram"][bisect.bisect_left(_LATENCY_BUCKETS, ms)] += 1
+    if ms >= SUPABASE_SLOW_QUERY_MS:
+        print(f"[db] SLOW {ms:.0f}ms {route or '-'} {plan.kind} {plan.table}: {fp[:200]}", flush=True)
+
+
+def query_log(limit=100):
+    """Most recent statements, newest first."""
+    with _query_lock:
+        return list(reversed(_query_log))[:limit]
+
+
+def top_queries(n=20, by="total_ms"):
+    """Top-N fingerprints by total_ms (default), max_ms, calls, bytes or rows."""
+    with _query_lock:
+        aggs = [dict(a, routes=dict(a["routes"]), histogram=list(a["histogram"]))
+                for a in _query_agg.values()]
+    for a in aggs:
+        a["avg_ms"] = round(a["total_ms"] / a["calls"], 2) if a["calls"] else 0
+        a["total_ms"] = round(a["total_ms"], 2)
+        a["max_ms"] = round(a["max_ms"], 2)
+        # [[upper bound ms, count], ...] — a list so JSON keeps bucket order
+        a["histogram"] = [list(p) for p in zip(_LATENCY_BUCKETS + ("inf",), a["histogram"])]
+    aggs.sort(key=lambda a: a.get(by, 0), reverse=True)
+    return aggs[:n]
+
+
+def reset_query_stats():
+    with _query_lock:
+        _query_log.clear()
+        _query_agg.clear()
+
+
 # ─── SQL Parser ───────────────────────────────────────────────────────────────
 # Translates the SQLite-style SQL used in app.py into Supabase REST API calls.
 # Supports the subset of SQL actually used: SELECT, INSERT, UPDATE, DELETE,
@@ -43,28 +546,68 @@ def _rest(table):
 # ALTER TABLE (ignored), CREATE INDEX (ignored).
 
 class SupabaseResult:
-    """Mimics sqlite3 cursor result — list of dict-like rows."""
-    def __init__(self, rows=None, last_id=None):
+    """
+    Mimics sqlite3 cursor result — list of dict-like rows.
+
+    Large SELECTs arrive as an iterator of pages (see _supa_pages). The first
+    page is already fetched when execute() returns; later pages are requested
+    only when fetchall()/len() needs them, or streamed one page at a time by
+    iterating the result or calling iter_pages().
+    """
+    def __init__(self, rows=None, last_id=None, pages=None):
         self._rows = rows or []
         self._last_id = last_id
+        self._pages = pages
+
+    def _fill(self, n=None):
+        while self._pages is not None and (n is None or len(self._rows) < n):
+            page = next(self._pages, None)
+            if page is None:
+                self._pages = None
+            else:
+                self._rows.extend(page)
 
     def fetchall(self):
+        self._fill()
         return self._rows
 
     def fetchone(self):
+        self._fill(1)
         if not self._rows:
             return None
         return self._rows[0]
 
+    def iter_pages(self):
+        """Yield rows page by page without keeping earlier pages in memory."""
+        rows, pages = self._rows, self._pages
+        self._rows, self._pages = [], None
+        if rows:
+            yield rows
+        if pages is not None:
+            yield from pages
+
     def __iter__(self):
-        return iter(self._rows)
+        if self._pages is None:
+            return iter(self._rows)
+        return (row for page in self.iter_pages() for row in page)
 
     def __len__(self):
-        return len(self._rows)
+        return len(self.fetchall())
 
 
 class SupabaseRow(dict):
-    """Dict subclass that also supports attribute access (row["col"] and row.col)."""
+    """
+    Dict subclass that also supports attribute access (row["col"] and row.col)
+    and sqlite3-style positional access (row[0]). Rows from one result share a
+    single tuple of column names, so row[i] is O(1) without building a list.
+    Being a real dict, a row goes to jsonify and row_to_dict() without a copy.
+    """
+    __slots__ = ("_cols",)
+
+    def __init__(self, data=(), cols=None):
+        super().__init__(data)
+        self._cols = cols
+
     def __getattr__(self, key):
         try:
             return self[key]
@@ -73,87 +616,251 @@ class SupabaseRow(dict):
 
     def __getitem__(self, key):
         if isinstance(key, int):
-            return list(self.values())[key]
-        return super().__getitem__(key)
-
-    def keys(self):
-        return super().keys()
+            cols = self._cols
+            if cols is None:
+                cols = self._cols = tuple(dict.keys(self))
+            key = cols[key]
+        return dict.__getitem__(self, key)
 
 
-def _make_rows(data):
+def _make_rows(data, usage=None):
     if data is None:
         return []
-    if isinstance(data, list):
-        return [SupabaseRow(r) for r in data]
     if isinstance(data, dict):
-        return [SupabaseRow(data)]
-    return []
+        data = [data]
+    if not isinstance(data, list) or not data:
+        return []
+    if usage is not None:
+        return [_AuditRow(r, usage) for r in data]
+    # PostgREST emits the same keys in the same order for every object of a
+    # response, so one column tuple serves the whole page.
+    cols = tuple(data[0])
+    return [SupabaseRow(r, cols) for r in data]
+
+
+class PendingId:
+    """
+    Placeholder returned by last_insert_rowid() while an INSERT is still
+    buffered. It resolves to the real id when commit() flushes the batch, and
+    may be used as a parameter in later buffered INSERTs (e.g. crm_activities
+    rows pointing at a not-yet-sent crm_leads row).
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def __int__(self):
+        return int(self.value)
+
+    def __str__(self):
+        return "<pending>" if self.value is None else str(self.value)
+
+    __repr__ = __str__
+
+
+def _resolve(v):
+    return v.value if isinstance(v, PendingId) else v
 
 
 class SupabaseConn:
     """
     Drop-in replacement for sqlite3 connection.
     Translates SQL to Supabase REST calls.
+
+    With batch_writes=True, INSERT/UPDATE/DELETE are buffered until commit():
+    INSERTs are sent as one bulk array POST per table, UPDATEs aimed at the
+    same row are merged, and last_insert_rowid() hands out PendingId values
+    that resolve from the bulk response. Reads on a table with buffered
+    writes flush first, so the connection still reads its own writes.
     """
 
-    def __init__(self):
+    def __init__(self, batch_writes=False):
         self._last_insert_id = None
+        self._batch = batch_writes
+        self._queue = []
 
-    def execute(self, sql, params=None):
+    def execute(self, sql, params=None, cache=True):
         sql = sql.strip()
+        plan = _get_plan(sql)
+        if plan.kind in ("ddl", "last_id"):
+            return self._execute(plan, params)
+        t0 = time.perf_counter()
+        io = _query_io_begin()
+        status = "error"
+        try:
+            result = self._execute(plan, params, cache)
+            status = io["status"]
+            return result
+        finally:
+            _query_io_end()
+            rows = len(result._rows) if status != "error" else 0
+            _record_query(plan, status, io["bytes"], rows, time.perf_counter() - t0)
+
+    def _execute(self, plan, params, cache=True):
         params = list(params) if params else []
+        if plan.clock:
+            params = _clock_params(plan.clock, params)
+        kind = plan.kind
 
         # Skip DDL — tables are created via Supabase dashboard
-        upper = sql.upper()
-        if (upper.startswith("CREATE TABLE") or
-                upper.startswith("CREATE INDEX") or
-                upper.startswith("ALTER TABLE") or
-                upper.startswith("DROP TABLE") or
-                upper.startswith("PRAGMA")):
+        if kind == "ddl":
             return SupabaseResult()
 
         # SELECT last_insert_rowid() → return cached last id
-        if "LAST_INSERT_ROWID" in upper:
+        if kind == "last_id":
             return SupabaseResult([SupabaseRow({"last_insert_rowid()": self._last_insert_id})])
 
+        if self._queue:
+            if kind != "insert" and any(isinstance(p, PendingId) and p.value is None for p in params):
+                self.commit()
+            elif kind in ("count", "select", "aggregate", "upsert") and any(op[1] == plan.table for op in self._queue):
+                self.commit()
+        params = [p if kind == "insert" and self._batch else _resolve(p) for p in params]
+
+        # SELECT col, COUNT(*) ... GROUP BY col / SELECT SUM(col) ...
+        if kind == "aggregate":
+            rows = _supa_aggregate(plan, _bind(plan.filters, params))
+            return SupabaseResult(_make_rows(rows))
+
         # SELECT COUNT(*)
-        if upper.startswith("SELECT COUNT(*)"):
-            table, filters = _parse_where(sql, params)
-            rows = _supa_get(table, filters, select="id")
-            count = len(rows)
+        if kind == "count":
+            count = _supa_count(plan.table, _bind(plan.filters, params))
             return SupabaseResult([SupabaseRow({"COUNT(*)": count})])
 
         # SELECT
-        if upper.startswith("SELECT"):
-            table, select_cols, filters, order, limit = _parse_select(sql, params)
-            rows = _supa_get(table, filters, select=select_cols, order=order, limit=limit)
-            return SupabaseResult(_make_rows(rows))
+        if kind == "select":
+            filters = _bind(plan.filters, params)
+            hit = _loader_hit(plan, filters) if cache else None
+            if hit is not None:
+                return SupabaseResult(_make_rows(hit))
+            usage = _column_sample(plan)
+            if cache and plan.table in SUPABASE_CACHE_TTLS:
+                return SupabaseResult(_make_rows(_cached_select(plan, filters), usage))
+            pages = _supa_pages(plan.table, filters, select=plan.select,
+                                order=plan.order, limit=plan.limit)
+            if plan.embeds:
+                pages = (_flatten_embeds(p, plan.embeds) for p in pages)
+            pages = (_make_rows(p, usage) for p in pages)
+            result = SupabaseResult(pages=pages)
+            result._fill(1)  # first round trip happens now, like sqlite3
+            return result
+
+        if self._batch and kind in ("insert", "update", "delete"):
+            return self._enqueue(plan, params)
 
         # INSERT
-        if upper.startswith("INSERT INTO"):
-            table, record = _parse_insert(sql, params)
-            result = _supa_insert(table, record)
+        if kind == "insert":
+            result = _supa_insert(plan.table, _bind(plan.record, params))
+            if result:
+                self._last_insert_id = result[0].get("id")
+                return SupabaseResult(_make_rows(result))
+            return SupabaseResult()
+
+        # INSERT ... ON CONFLICT — never buffered, the caller usually wants the row
+        if kind == "upsert":
+            result = _supa_upsert(plan.table, _bind(plan.record, params), plan.conflict)
             if result:
                 self._last_insert_id = result[0].get("id")
                 return SupabaseResult(_make_rows(result))
             return SupabaseResult()
 
         # UPDATE
-        if upper.startswith("UPDATE"):
-            table, updates, filters = _parse_update(sql, params)
-            _supa_update(table, updates, filters)
+        if kind == "update":
+            _supa_update(plan.table, _bind(plan.record, params), _bind(plan.filters, params))
             return SupabaseResult()
 
         # DELETE
-        if upper.startswith("DELETE FROM"):
-            table, filters = _parse_where(sql, params)
-            _supa_delete(table, filters)
+        if kind == "delete":
+            _supa_delete(plan.table, _bind(plan.filters, params))
             return SupabaseResult()
 
         return SupabaseResult()
 
+    # ─── Write-behind buffer ──────────────────────────────────────────────
+    # Queue entries: ("insert", table, record, PendingId)
+    #                ("update", table, updates, filters)
+    #                ("delete", table, None, filters)
+
+    def _enqueue(self, plan, params):
+        table = plan.table
+        if plan.kind == "insert":
+            pid = PendingId()
+            self._queue.append(("insert", table, _bind(plan.record, params), pid))
+            self._last_insert_id = pid
+            return SupabaseResult()
+
+        filters = _bind(plan.filters, params)
+        if plan.kind == "update":
+            updates = _bind(plan.record, params)
+            # Merge into an earlier UPDATE of the same row, unless another
+            # write to that table was queued in between.
+            for op in reversed(self._queue):
+                if op[1] != table:
+                    continue
+                if op[0] == "update" and op[3] == filters:
+                    op[2].update(updates)
+                    return SupabaseResult()
+                break
+            self._queue.append(("update", table, updates, filters))
+        else:
+            self._queue.append(("delete", table, None, filters))
+        return SupabaseResult()
+
+    def _flush_inserts(self, ops):
+        # One bulk POST per (dependency level, table, column set). A row that
+        # references another buffered row's PendingId goes one level after
+        # it, so parents are always sent before their children; within a
+        # level, groups keep queue order.
+        levels = {}   # id(PendingId) → level of the row it stands for
+        groups = OrderedDict()
+        for _, table, record, pid in ops:
+            level = 0
+            for v in record.values():
+                if isinstance(v, PendingId) and id(v) in levels:
+                    level = max(level, levels[id(v)] + 1)
+            levels[id(pid)] = level
+            groups.setdefault((level, table, tuple(record)), []).append((record, pid))
+        for (_, table, _), items in sorted(groups.items(), key=lambda g: g[0][0]):
+            # Children of a row that failed to insert are not written with a NULL key
+            ready = []
+            for rec, pid in items:
+                if any(isinstance(v, PendingId) and v.value is None for v in rec.values()):
+                    print(f"[db] INSERT {table} skipped: references a row that failed to insert")
+                    continue
+                ready.append((rec, pid))
+            for i in range(0, len(ready), SUPABASE_BULK_SIZE):
+                chunk = ready[i:i + SUPABASE_BULK_SIZE]
+                records = [{k: _resolve(v) for k, v in rec.items()} for rec, _ in chunk]
+                result = _supa_insert(table, records) if len(records) > 1 else []
+                if len(result) != len(records):
+                    # Bulk POST failed (one bad row rejects the whole array):
+                    # fall back to row-by-row so the good rows still land.
+                    result = [(_supa_insert(table, rec) or [{}])[0] for rec in records]
+                with _stats_lock:
+                    _stats["bulk_rows"] += len(records)
+                for (_, pid), row in zip(chunk, result):
+                    pid.value = row.get("id")
+
     def commit(self):
-        pass  # Auto-committed in Supabase REST
+        # Auto-committed in Supabase REST; only buffered writes need sending
+        queue, self._queue = self._queue, []
+        inserts = []
+        for op in queue:
+            if op[0] == "insert":
+                inserts.append(op)
+                continue
+            if inserts:
+                self._flush_inserts(inserts)
+                inserts = []
+            if op[0] == "update":
+                _supa_update(op[1], op[2], op[3])
+            else:
+                _supa_delete(op[1], op[3])
+        if inserts:
+            self._flush_inserts(inserts)
+        if isinstance(self._last_insert_id, PendingId):
+            self._last_insert_id = self._last_insert_id.value
 
     def close(self):
         pass
@@ -161,52 +868,411 @@ class SupabaseConn:
     def __enter__(self):
         return self
 
-    def __exit__(self, *args):
-        pass
+    def __exit__(self, exc_type, *args):
+        # Like sqlite3: commit on success, drop buffered writes on error
+        if exc_type is None:
+            self.commit()
+        else:
+            self._queue = []
+
+
+def _cached_select(plan, filters):
+    key = _cache_key(plan.table, plan.select, filters, plan.order, plan.limit)
+    rows, gen = _cache_lookup(key)
+    if rows is None:
+        rows = _supa_get(plan.table, filters, select=plan.select,
+                         order=plan.order, limit=plan.limit)
+        if plan.embeds:
+            rows = _flatten_embeds(rows, plan.embeds)
+        _cache_store(key, rows, gen)
+    return rows
+
+
+# ─── Column Audit ─────────────────────────────────────────────────────────────
+# Samples which columns routes read from SELECT rows (SUPABASE_COLUMN_AUDIT = rate).
+
+SUPABASE_COLUMN_AUDIT = float(os.environ.get("SUPABASE_COLUMN_AUDIT", "0"))
+_COLUMN_SAMPLES_KEPT = 50
+
+_column_lock = threading.Lock()
+_column_usage = {}   # (route, fingerprint) -> {"table", "samples", "recent": deque}
+
+
+class _ColumnUsage:
+    __slots__ = ("fetched", "touched", "whole")
+
+    def __init__(self):
+        self.fetched = set()
+        self.touched = set()
+        self.whole = False
+
+
+class _AuditRow(dict):
+    """Stand-in for SupabaseRow that records which columns the caller reads."""
+
+    def __init__(self, data, usage):
+        super().__init__(data)
+        self._usage = usage
+        usage.fetched.update(data)
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            key = list(dict.keys(self))[key]
+        self._usage.touched.add(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._usage.touched.add(key)
+        return dict.get(self, key, default)
+
+    def _escaped(self):
+        self._usage.whole = True
+
+    def keys(self):
+        self._escaped()
+        return dict.keys(self)
+
+    def values(self):
+        self._escaped()
+        return dict.values(self)
+
+    def items(self):
+        self._escaped()
+        return dict.items(self)
+
+    def __iter__(self):
+        self._escaped()
+        return dict.__iter__(self)
+
+    def copy(self):
+        # row_to_dict() keeps auditing the copy instead of counting it as whole
+        return _AuditRow(dict(dict.items(self)), self._usage)
+
+
+def _column_sample(plan):
+    """A fresh _ColumnUsage if this SELECT is sampled, else None."""
+    if not SUPABASE_COLUMN_AUDIT or random.random() >= SUPABASE_COLUMN_AUDIT:
+        return None
+    usage = _ColumnUsage()
+    key = (_current_route() or "-", plan.fingerprint)
+    with _column_lock:
+        entry = _column_usage.get(key)
+        if entry is None:
+            entry = _column_usage[key] = {
+                "table": plan.table, "samples": 0,
+                "recent": deque(maxlen=_COLUMN_SAMPLES_KEPT),
+            }
+        entry["samples"] += 1
+        entry["recent"].append(usage)
+    return usage
+
+
+def column_usage():
+    """
+    Per (route, statement): columns fetched vs. columns read over the recent
+    samples. "unused" is only reported when no sampled row escaped whole.
+    """
+    with _column_lock:
+        entries = [(k, dict(v, recent=list(v["recent"]))) for k, v in _column_usage.items()]
+    out = []
+    for (route, fp), e in entries:
+        fetched, touched, whole = set(), set(), 0
+        for u in e["recent"]:
+            fetched |= u.fetched
+            touched |= u.touched
+            whole += u.whole
+        out.append({
+            "route": route, "fingerprint": fp, "table": e["table"], "samples": e["samples"],
+            "fetched": sorted(fetched), "touched": sorted(touched & fetched), "whole": whole,
+            "unused": sorted(fetched - touched) if not whole else [],
+        })
+    out.sort(key=lambda u: (u["route"], u["fingerprint"] or ""))
+    return out
+
+
+def reset_column_usage():
+    with _column_lock:
+        _column_usage.clear()
 
 
 # ─── REST Helpers ─────────────────────────────────────────────────────────────
 
-def _supa_get(table, filters=None, select="*", order=None, limit=None):
+def _supa_pages(table, filters=None, select="*", order=None, limit=None):
+    """
+    Yield the rows of one SELECT as successive pages.
+
+    PostgREST silently caps every response at its max-rows setting, so rows
+    are requested in Range windows of SUPABASE_PAGE_SIZE until a short page
+    comes back (or LIMIT is reached). Keep SUPABASE_PAGE_SIZE at or below the
+    project's max-rows (1000 on Supabase by default).
+    """
     params = {"select": select or "*"}
     if filters:
         for k, v in filters.items():
             params[k] = v
-    if order:
-        params["order"] = order
-    if limit:
+    page_size = SUPABASE_PAGE_SIZE
+    if limit and limit <= page_size:
+        # Fits in one response — no Range bookkeeping needed
+        if order:
+            params["order"] = order
         params["limit"] = limit
+        yield _supa_get_page(table, params, None)
+        return
+
+    # Offsets are only stable under a total order, so tie-break on id
+    if not order:
+        params["order"] = "id.asc"
+    elif not re.search(r'(^|,)id\.', order):
+        params["order"] = order + ",id.asc"
+    else:
+        params["order"] = order
+
+    offset = 0
+    while True:
+        want = page_size if not limit else min(page_size, limit - offset)
+        if want <= 0:
+            return
+        page = _supa_get_page(table, params, (offset, offset + want - 1))
+        if page:
+            yield page
+        if len(page) < want:
+            return
+        offset += len(page)
+
+
+# ─── Single-flight GETs ──────────────────────────────────────────────────────
+# Identical concurrent page GETs share one request.
+
+class _Flight:
+    __slots__ = ("done", "rows", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.rows = []
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _supa_get_page(table, params, window):
+    key = (table, _cache_gen.get(table, 0), _freeze(params), window)
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        with _stats_lock:
+            _stats["gets_coalesced"] += 1
+            _stats["rows_shared"] += len(flight.rows)
+        # Callers mutate rows (e.g. _flatten_embeds), so each gets its own
+        return [dict(r) for r in flight.rows]
     try:
-        r = _req.get(_rest(table), params=params, headers=_headers(prefer_return=False), timeout=10)
-        if r.status_code == 200:
-            return r.json()
+        flight.rows = _fetch_page(table, params, window)
+    except SupabaseUnavailable as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+    return flight.rows
+
+
+def _fetch_page(table, params, window):
+    headers = _headers(prefer_return=False)
+    if window is not None:
+        headers["Range-Unit"] = "items"
+        headers["Range"] = f"{window[0]}-{window[1]}"
+    try:
+        r = _http("GET", table, params=params, headers=headers)
+        if r.status_code in (200, 206):
+            return json_loads(r.content)
         print(f"[db] GET {table} {r.status_code}: {r.text[:200]}")
         return []
+    except SupabaseUnavailable:
+        raise
     except Exception as e:
         print(f"[db] GET {table} error: {e}")
         return []
 
 
+def _supa_get(table, filters=None, select="*", order=None, limit=None):
+    rows = []
+    for page in _supa_pages(table, filters, select=select, order=order, limit=limit):
+        rows.extend(page)
+    return rows
+
+
+def _supa_count(table, filters=None):
+    """
+    COUNT(*) pushed down to Postgres: a HEAD request with Prefer: count=exact
+    returns only the total in Content-Range ("0-24/3573" or "*/0").
+    """
+    params = dict(filters or {})
+    headers = _headers(prefer_return=False)
+    headers["Prefer"] = "count=exact"
+    try:
+        r = _http("HEAD", table, params=params, headers=headers)
+        if r.status_code in (200, 206):
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit():
+                return int(total)
+        print(f"[db] COUNT {table} {r.status_code}: {r.headers.get('Content-Range')}")
+        return 0
+    except SupabaseUnavailable:
+        raise
+    except Exception as e:
+        print(f"[db] COUNT {table} error: {e}")
+        return 0
+
+
+# Off after PGRST123 (db-aggregates-enabled is off, see setup_crm.sql): aggregate locally
+_aggregates_pushdown = True
+
+
+def _supa_aggregate(plan, filters):
+    """
+    GROUP BY / SUM via PostgREST aggregate selects, e.g.
+    select=stage,_a0:count() → [{"stage": "nuevo", "_a0": 12}, ...]
+    Falls back to fetching just the grouped/aggregated columns and folding
+    them in Python.
+    """
+    global _aggregates_pushdown
+    groups, aggs = plan.aggregate
+    rows = None
+    if _aggregates_pushdown:
+        parts = list(groups)
+        for i, (func, arg, _) in enumerate(aggs):
+            parts.append(f"_a{i}:count()" if arg == "*" else f"_a{i}:{arg}.{func}()")
+        params = dict(filters)
+        params["select"] = ",".join(parts)
+        headers = _headers(prefer_return=False)
+        try:
+            r = _http("GET", plan.table, params=params, headers=headers)
+            if r.status_code == 200:
+                rows = []
+                for raw in json_loads(r.content):
+                    row = {g: raw.get(g) for g in groups}
+                    for i, (_, _, out) in enumerate(aggs):
+                        row[out] = raw.get(f"_a{i}")
+                    rows.append(row)
+            elif 400 <= r.status_code < 500:
+                try:
+                    code = json_loads(r.content).get("code")
+                except (ValueError, AttributeError):
+                    code = None
+                if code == "PGRST123":
+                    # db-aggregates-enabled is off for this project: stop asking
+                    _aggregates_pushdown = False
+                    print(f"[db] aggregate pushdown not enabled, aggregating locally: {r.text[:200]}")
+                else:
+                    # Something about this statement; only this call falls back
+                    print(f"[db] AGGREGATE {plan.table} {r.status_code}, aggregating locally: {r.text[:200]}")
+        except SupabaseUnavailable:
+            raise
+        except Exception as e:
+            print(f"[db] AGGREGATE {plan.table} error: {e}")
+    if rows is None:
+        cols = list(OrderedDict.fromkeys(list(groups) + [a for _, a, _ in aggs if a != "*"]))
+        source = _supa_get(plan.table, filters, select=",".join(cols) or "id")
+        rows = _aggregate_local(source, groups, aggs)
+
+    if plan.order:
+        for col, desc in reversed(plan.order):
+            rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+    if plan.limit:
+        rows = rows[:plan.limit]
+    return rows
+
+
+def _aggregate_local(source, groups, aggs):
+    buckets = OrderedDict()
+    for r in source:
+        key = tuple(r.get(g) for g in groups)
+        buckets.setdefault(key, []).append(r)
+    if not groups and not buckets:
+        buckets[()] = []  # aggregates without GROUP BY always yield one row
+    rows = []
+    for key, members in buckets.items():
+        row = dict(zip(groups, key))
+        for func, arg, out in aggs:
+            if arg == "*":
+                row[out] = len(members)
+                continue
+            vals = [m.get(arg) for m in members if m.get(arg) is not None]
+            if func == "count":
+                row[out] = len(vals)
+            elif not vals:
+                row[out] = None
+            elif func == "sum":
+                row[out] = sum(vals)
+            elif func == "avg":
+                row[out] = sum(vals) / len(vals)
+            elif func == "min":
+                row[out] = min(vals)
+            else:
+                row[out] = max(vals)
+        rows.append(row)
+    return rows
+
+
 def _supa_insert(table, record):
     try:
-        r = _req.post(_rest(table), json=record, headers=_headers(), timeout=10)
+        r = _http("POST", table, json=record, headers=_headers())
         if r.status_code in (200, 201):
-            return r.json() if isinstance(r.json(), list) else [r.json()]
+            data = json_loads(r.content)
+            return data if isinstance(data, list) else [data]
         print(f"[db] INSERT {table} {r.status_code}: {r.text[:300]}")
         return []
+    except SupabaseUnavailable:
+        raise
     except Exception as e:
         print(f"[db] INSERT {table} error: {e}")
         return []
 
 
+def _supa_upsert(table, record, conflict):
+    """INSERT ... ON CONFLICT as one POST with on_conflict= and a resolution."""
+    on_conflict, merge = conflict
+    headers = _headers()
+    resolution = "merge-duplicates" if merge else "ignore-duplicates"
+    headers["Prefer"] += f",resolution={resolution}"
+    try:
+        r = _http("POST", table, json=record, params={"on_conflict": on_conflict}, headers=headers)
+        if r.status_code in (200, 201):
+            data = json_loads(r.content)
+            return data if isinstance(data, list) else [data]
+        print(f"[db] UPSERT {table} {r.status_code}: {r.text[:300]}")
+        return []
+    except SupabaseUnavailable:
+        raise
+    except Exception as e:
+        print(f"[db] UPSERT {table} error: {e}")
+        return []
+
+
 def _supa_update(table, updates, filters):
     params = {}
     for k, v in (filters or {}).items():
         params[k] = v
     try:
-        r = _req.patch(_rest(table), json=updates, params=params, headers=_headers(), timeout=10)
+        r = _http("PATCH", table, json=updates, params=params, headers=_headers())
         if r.status_code not in (200, 204):
             print(f"[db] UPDATE {table} {r.status_code}: {r.text[:200]}")
+    except SupabaseUnavailable:
+        raise
     except Exception as e:
         print(f"[db] UPDATE {table} error: {e}")
 
@@ -216,9 +1282,11 @@ def _supa_delete(table, filters):
     for k, v in (filters or {}).items():
         params[k] = v
     try:
-        r = _req.delete(_rest(table), params=params, headers=_headers(prefer_return=False), timeout=10)
+        r = _http("DELETE", table, params=params, headers=_headers(prefer_return=False))
         if r.status_code not in (200, 204):
             print(f"[db] DELETE {table} {r.status_code}: {r.text[:200]}")
+    except SupabaseUnavailable:
+        raise
     except Exception as e:
         print(f"[db] DELETE {table} error: {e}")
 
@@ -247,12 +1315,210 @@ def _bind_params(sql, params):
     return ''.join(result)
 
 
+def _split_top(expr, word):
+    """
+    Split expr on AND/OR at parenthesis depth 0, outside quotes.
+    The AND inside "col BETWEEN ? AND ?" is not a split point.
+    """
+    parts, depth, quote, last = [], 0, None, 0
+    pat = re.compile(r"\b%s\b" % word, re.I)
+    i = 0
+    while i < len(expr):
+        ch = expr[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and pat.match(expr, i) and (i == 0 or not expr[i - 1].isalnum()):
+            if not (word.upper() == "AND" and re.search(r"\bBETWEEN\s+\S+\s*$", expr[last:i], re.I)):
+                parts.append(expr[last:i])
+                last = i + len(word)
+            i += len(word)
+            continue
+        i += 1
+    parts.append(expr[last:])
+    return [p.strip() for p in parts]
+
+
+def _unwrap(cond):
+    """Strip one pair of parentheses that encloses the whole condition."""
+    if not (cond.startswith("(") and cond.endswith(")")):
+        return None
+    depth = 0
+    for i, ch in enumerate(cond):
+        depth += ch == "("
+        depth -= ch == ")"
+        if depth == 0 and i < len(cond) - 1:
+            return None
+    return cond[1:-1].strip()
+
+
+def _parse_condition(cond, next_param):
+    """
+    Translate one simple predicate into [(col, "op.value"), ...].
+    Returns None for predicates the translator does not understand.
+    """
+    # UPPER(col)=UPPER(?)
+    m = re.match(r"UPPER\(([^)]+)\)\s*=\s*UPPER\(\?\)", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        v = next_param()
+        return [(col, f"ilike.{v}")]
+
+    # col BETWEEN ? AND ?
+    m = re.match(r"([a-zA-Z_.]+)\s+BETWEEN\s+\?\s+AND\s+\?", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        v1 = next_param()
+        v2 = next_param()
+        return [(col, f"gte.{v1}"), (col, f"lte.{v2}")]
+
+    # col >= ? / col <= ? / col > ? / col < ?
+    m = re.match(r"([a-zA-Z_.]+)\s*(>=|<=|>|<)\s*\?", cond, re.I)
+    if m:
+        col, op = m.group(1).strip(), m.group(2)
+        v = next_param()
+        op_map = {">=": "gte", "<=": "lte", ">": "gt", "<": "lt"}
+        return [(col, f"{op_map[op]}.{v}")]
+
+    # col LIKE ?
+    m = re.match(r"([a-zA-Z_.]+)\s+LIKE\s+\?", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        v = next_param()
+        # Convert SQL LIKE % to Supabase ilike
+        return [(col, f"ilike.{v}")]
+
+    # col IS NULL
+    m = re.match(r"([a-zA-Z_.]+)\s+IS\s+NULL", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        return [(col, "is.null")]
+
+    # col IS NOT NULL
+    m = re.match(r"([a-zA-Z_.]+)\s+IS\s+NOT\s+NULL", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        return [(col, "not.is.null")]
+
+    # col IN (?, ?, ...) / col NOT IN (?, ?, ...) — values are quoted at bind
+    # time like logic-tree slots, since in.(...) lists share their syntax
+    m = re.match(r"([a-zA-Z_.]+)\s+(NOT\s+)?IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        vals = []
+        for _ in range(m.group(0).count("?")):
+            v = str(next_param())
+            vals.append(v.replace("\x00", "\x01") if _SLOT_RE.fullmatch(v) else _tree_quote(v))
+        op = "not.in" if m.group(2) else "in"
+        return [(col, f"{op}.({','.join(vals)})")]
+
+    # col IN (...)
+    m = re.match(r"([a-zA-Z_.]+)\s+IN\s*\(([^)]+)\)", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        vals = [v.strip().strip("'\"") for v in m.group(2).split(",")]
+        return [(col, f"in.({','.join(vals)})")]
+
+    # col NOT IN (...)
+    m = re.match(r"([a-zA-Z_.]+)\s+NOT\s+IN\s*\(([^)]+)\)", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        vals = [v.strip().strip("'\"") for v in m.group(2).split(",")]
+        return [(col, f"not.in.({','.join(vals)})")]
+
+    # col=? or col='value' or col=value
+    m = re.match(r"([a-zA-Z_.]+)\s*=\s*\?", cond, re.I)
+    if m:
+        col = m.group(1).strip()
+        v = next_param()
+        return [(col, f"eq.{v}")]
+
+
+    m = re.match(r"([a-zA-Z_.]+)\s*=\s*'([^']*)'", cond, re.I)
+    if m:
+        col, v = m.group(1).strip(), m.group(2)
+        return [(col, f"eq.{v}")]
+
+
+    m = re.match(r"([a-zA-Z_.]+)\s*=\s*(\w+)", cond, re.I)
+    if m:
+        col, v = m.group(1).strip(), m.group(2)
+        if v.upper() != 'NULL':
+            return [(col, f"eq.{v}")]
+        return []
+
+    return None
+
+
+# Characters PostgREST reserves inside or=(...)/and=(...) trees
+_TREE_RESERVED = set(',().:"\\ ')
+
+
+def _tree_quote(v):
+    s = str(v)
+    if s == "" or _TREE_RESERVED.intersection(s):
+        return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return s
+
+
+def _tree_item(col, val):
+    """col + "op.value" → "col.op.value" for a PostgREST logic tree."""
+    if val.startswith(("in.", "not.in.", "is.", "not.is.")):
+        return f"{col}.{val}"
+    op, _, v = val.partition(".")
+    if _SLOT_RE.fullmatch(v):
+        # Bound later; \x01 slots are quoted by _bind at substitution time
+        return f"{col}.{op}.{v.replace(chr(0), chr(1))}"
+    return f"{col}.{op}.{_tree_quote(v)}"
+
+
+def _parse_logic(expr, next_param):
+    """
+    Compile a predicate that may contain OR / nested parentheses into a
+    PostgREST logic-tree term: "col.op.v", "or(...)" or "and(...)".
+    Returns None if any part is untranslatable.
+    """
+    inner = _unwrap(expr)
+    if inner is not None:
+        return _parse_logic(inner, next_param)
+    for word in ("OR", "AND"):
+        parts = _split_top(expr, word)
+        if len(parts) > 1:
+            terms = [_parse_logic(p, next_param) for p in parts]
+            if any(t is None for t in terms):
+                return None
+            return f"{word.lower()}({','.join(terms)})"
+    pairs = _parse_condition(expr, next_param)
+    if not pairs:
+        return None
+    terms = [_tree_item(col, val) for col, val in pairs]
+    return terms[0] if len(terms) == 1 else f"and({','.join(terms)})"
+
+
+def _add_filter(filters, key, val):
+    # Repeated keys become repeated query params (?d=gte.X&d=lte.Y)
+    if key not in filters:
+        filters[key] = val
+    elif isinstance(filters[key], list):
+        filters[key].append(val)
+    else:
+        filters[key] = [filters[key], val]
+
+
 def _parse_where_clause(where_str, params):
     """
     Parse a WHERE clause into Supabase filter params.
     Handles: col=?, col=value, col LIKE %, col IS NULL,
     UPPER(col)=UPPER(?), col IN (...), col BETWEEN ? AND ?,
     col>=?, col<=?, col>?, col<?
+    and OR groups such as "(a LIKE ? OR b LIKE ?)", which are pushed down as
+    or=(a.ilike.x,b.ilike.x).
     """
     filters = {}
     if not where_str:
@@ -269,112 +1535,119 @@ def _parse_where_clause(where_str, params):
             return v
         return None
 
-    # Split on AND (simple, doesn't handle OR or nested parens)
-    conditions = re.split(r'\bAND\b', where_str, flags=re.I)
-    for cond in conditions:
-        cond = cond.strip()
+    # Split on top-level AND; OR groups become PostgREST logic trees
+    trees = []
+    for cond in _split_top(where_str, "AND"):
         if not cond or cond == '1=1':
             continue
 
-        # UPPER(col)=UPPER(?)
-        m = re.match(r"UPPER\(([^)]+)\)\s*=\s*UPPER\(\?\)", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            v = next_param()
-            filters[col] = f"ilike.{v}"
-            continue
-
-        # col BETWEEN ? AND ?
-        m = re.match(r"([a-zA-Z_.]+)\s+BETWEEN\s+\?\s+AND\s+\?", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            v1 = next_param()
-            v2 = next_param()
-            filters[col] = f"gte.{v1}"
-            filters[f"{col}_lte"] = f"lte.{v2}"  # Note: Supabase handles this with separate params
-            continue
-
-        # col >= ? / col <= ? / col > ? / col < ?
-        m = re.match(r"([a-zA-Z_.]+)\s*(>=|<=|>|<)\s*\?", cond, re.I)
-        if m:
-            col, op = m.group(1).strip(), m.group(2)
-            v = next_param()
-            op_map = {">=": "gte", "<=": "lte", ">": "gt", "<": "lt"}
-            filters[col] = f"{op_map[op]}.{v}"
-            continue
-
-        # col LIKE ?
-        m = re.match(r"([a-zA-Z_.]+)\s+LIKE\s+\?", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            v = next_param()
-            # Convert SQL LIKE % to Supabase ilike
-            filters[col] = f"ilike.{v}"
+        if _unwrap(cond) is not None or len(_split_top(cond, "OR")) > 1:
+            term = _parse_logic(cond, next_param)
+            if term and term.startswith(("or(", "and(")):
+                trees.append(term)
+            elif term:
+                col, _, val = term.partition(".")
+                _add_filter(filters, col, val.replace("\x01", "\x00"))
             continue
 
-        # col IS NULL
-        m = re.match(r"([a-zA-Z_.]+)\s+IS\s+NULL", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            filters[col] = "is.null"
-            continue
+        for col, val in _parse_condition(cond, next_param) or ():
+            _add_filter(filters, col, val)
 
-        # col IS NOT NULL
-        m = re.match(r"([a-zA-Z_.]+)\s+IS\s+NOT\s+NULL", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            filters[col] = "not.is.null"
-            continue
+    # A single group goes in or=(...); several are AND-ed via and=(...)
+    if len(trees) == 1 and trees[0].startswith("or("):
+        filters["or"] = trees[0][2:]
+    elif trees:
+        filters["and"] = "(" + ",".join(trees) + ")"
 
-        # col IN (...)
-        m = re.match(r"([a-zA-Z_.]+)\s+IN\s*\(([^)]+)\)", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            vals = [v.strip().strip("'\"") for v in m.group(2).split(",")]
-            filters[col] = f"in.({','.join(vals)})"
-            continue
+    remaining_params = param_list[param_idx[0]:]
+    return filters, remaining_params
 
-        # col NOT IN (...)
-        m = re.match(r"([a-zA-Z_.]+)\s+NOT\s+IN\s*\(([^)]+)\)", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            vals = [v.strip().strip("'\"") for v in m.group(2).split(",")]
-            filters[col] = f"not.in.({','.join(vals)})"
-            continue
 
-        # col=? or col='value' or col=value
-        m = re.match(r"([a-zA-Z_.]+)\s*=\s*\?", cond, re.I)
-        if m:
-            col = m.group(1).strip()
-            v = next_param()
-            filters[col] = f"eq.{v}"
-            continue
+_JOIN_RE = re.compile(
+    r"\bLEFT\s+(?:OUTER\s+)?JOIN\s+([a-zA-Z_]\w*)\s+(?:AS\s+)?([a-zA-Z_]\w*)\s+"
+    r"ON\s+(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)", re.I)
 
-        m = re.match(r"([a-zA-Z_.]+)\s*=\s*'([^']*)'", cond, re.I)
-        if m:
-            col, v = m.group(1).strip(), m.group(2)
-            filters[col] = f"eq.{v}"
-            continue
 
-        m = re.match(r"([a-zA-Z_.]+)\s*=\s*(\w+)", cond, re.I)
-        if m:
-            col, v = m.group(1).strip(), m.group(2)
-            if v.upper() != 'NULL':
-                filters[col] = f"eq.{v}"
+def _parse_joins(sql):
+    """
+    Find foreign-key LEFT JOINs of the form
+        FROM base b LEFT JOIN other o ON b.fk_col = o.id
+    Returns (base_alias, {alias: (table, fk_col)}), or (None, {}) when the
+    statement has no join we can express as a PostgREST embed.
+    """
+    m = re.search(r"\bFROM\s+([a-zA-Z_]\w*)\s+(?:AS\s+)?([a-zA-Z_]\w*)\s+LEFT\b", sql, re.I)
+    if not m:
+        return None, {}
+    base_alias = m.group(2)
+    joins = {}
+    for jm in _JOIN_RE.finditer(sql):
+        table, alias = jm.group(1).lower(), jm.group(2)
+        left = (jm.group(3), jm.group(4))
+        right = (jm.group(5), jm.group(6))
+        if right[0] == base_alias:
+            left, right = right, left
+        if left[0] != base_alias or right[0] != alias or right[1].lower() != "id":
+            return None, {}  # not a many-to-one FK join
+        joins[alias] = (table, left[1])
+    return (base_alias, joins) if joins else (None, {})
+
+
+def _join_projection(cols, base_alias, joins):
+    """
+    Translate "c.*, u.name as assigned_user_name" into a PostgREST embedded
+    select ("*,_j_u:crm_users!assigned_user_id(name)") plus the spec used by
+    _flatten_embeds to put the embedded values back under their SQL aliases.
+    """
+    base_cols, embed_cols = [], OrderedDict()
+    for col in cols.split(","):
+        col = col.strip()
+        m = re.match(r"(\w+)\.(\*|\w+)(?:\s+AS\s+(\w+))?$", col, re.I)
+        if not m:
+            base_cols.append(col)
             continue
-
-    remaining_params = param_list[param_idx[0]:]
-    return filters, remaining_params
+        alias, name, out = m.group(1), m.group(2), m.group(3)
+        if alias == base_alias:
+            base_cols.append(name)
+        elif alias in joins and name != "*":
+            embed_cols.setdefault(alias, []).append((name, out or name))
+    parts = ["*" if "*" in base_cols else ",".join(base_cols)]
+    embeds = []
+    for alias, pairs in embed_cols.items():
+        table, fk_col = joins[alias]
+        key = f"_j_{alias}"
+        names = ",".join(OrderedDict.fromkeys(name for name, _ in pairs))
+        parts.append(f"{key}:{table}!{fk_col}({names})")
+        embeds.append((key, tuple(pairs)))
+    return ",".join(p for p in parts if p), tuple(embeds)
+
+
+def _flatten_embeds(rows, embeds):
+    """Move embedded objects back into flat, SQL-aliased columns."""
+    out = []
+    for row in rows:
+        row = dict(row)
+        for key, pairs in embeds:
+            obj = row.pop(key, None) or {}
+            for name, alias in pairs:
+                row[alias] = obj.get(name)
+        out.append(row)
+    return out
 
 
 def _parse_select(sql, params):
-    """Parse SELECT ... FROM table [WHERE ...] [ORDER BY ...] [LIMIT n]"""
+    """Parse SELECT ... FROM table [LEFT JOIN ...] [WHERE ...] [ORDER BY ...] [LIMIT n]"""
     table = _extract_table(sql)
+    base_alias, joins = _parse_joins(sql)
+    embeds = None
 
     # Extract SELECT columns
     m = re.match(r"SELECT\s+(.*?)\s+FROM\s+", sql, re.I | re.S)
     select_cols = "*"
-    if m:
+    if m and joins:
+        select_cols, embeds = _join_projection(m.group(1), base_alias, joins)
+        # Filters and ordering only ever reference the base table here
+        sql = re.sub(r"\b%s\.(\w)" % re.escape(base_alias), r"\1", sql)
+    elif m:
         cols = m.group(1).strip()
         # Handle table aliases like "c.*, u.name as assigned_user_name"
         # For Supabase we just request * and filter client-side if needed
@@ -425,7 +1698,61 @@ def _parse_select(sql, params):
     if limit_match:
         limit = int(limit_match.group(1))
 
-    return table, select_cols, filters, order, limit
+    return table, select_cols, filters, order, limit, embeds
+
+
+_AGG_RE = re.compile(r"^(COUNT|SUM|AVG|MIN|MAX)\s*\(\s*(\*|[a-zA-Z_]\w*)\s*\)(?:\s+AS\s+(\w+))?$", re.I)
+
+
+def _select_list(sql):
+    m = re.match(r"SELECT\s+(.*?)\s+FROM\s+", sql, re.I | re.S)
+    return [c.strip() for c in m.group(1).split(",")] if m else []
+
+
+def _is_aggregate(sql):
+    """GROUP BY, or aggregates mixed with other select items (a bare
+    SELECT COUNT(*) stays on the HEAD count path)."""
+    if re.search(r"\bGROUP\s+BY\b", sql, re.I):
+        return True
+    cols = _select_list(sql)
+    return any(_AGG_RE.match(c) for c in cols) and not re.match(r"SELECT\s+COUNT\(\*\)\s+FROM\b", sql, re.I)
+
+
+def _parse_aggregate(sql, params):
+    """
+    Parse SELECT g1, g2, COUNT(*) [AS n], SUM(col) [AS s] FROM t [WHERE ...]
+    [GROUP BY g1, g2] [ORDER BY ...] [LIMIT n].
+    Returns (table, (group_cols, aggs), filters, order, limit) where aggs is a
+    tuple of (func, col or "*", output column name).
+    """
+    table = _extract_table(sql)
+    groups, aggs = [], []
+    for col in _select_list(sql):
+        m = _AGG_RE.match(col)
+        if m:
+            func, arg, alias = m.group(1).upper(), m.group(2), m.group(3)
+            aggs.append((func.lower(), arg, alias or f"{func}({arg})"))
+        else:
+            groups.append(re.sub(r"^\w+\.", "", col))
+
+    where_match = re.search(r"\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|$)", sql, re.I | re.S)
+    filters = {}
+    if where_match:
+        filters, _ = _parse_where_clause(where_match.group(1), params)
+
+    order = None
+    order_match = re.search(r"ORDER\s+BY\s+(.*?)(?:\bLIMIT\b|$)", sql, re.I | re.S)
+    if order_match:
+        order = []
+        for part in order_match.group(1).split(","):
+            bits = part.split()
+            if bits:
+                order.append((bits[0], len(bits) > 1 and bits[1].upper() == "DESC"))
+        order = tuple(order)
+
+    limit_match = re.search(r"LIMIT\s+(\d+)", sql, re.I)
+    limit = int(limit_match.group(1)) if limit_match else None
+    return table, (tuple(groups), tuple(aggs)), filters, order, limit
 
 
 def _parse_insert(sql, params):
@@ -446,6 +1773,19 @@ def _parse_insert(sql, params):
     return table, record
 
 
+def _parse_conflict(sql):
+    """
+    ON CONFLICT (cols) DO UPDATE / DO NOTHING → ("col1,col2", merge?).
+    PostgREST's merge-duplicates overwrites every inserted column, so a DO
+    UPDATE SET list is expected to be col=excluded.col for those columns.
+    """
+    m = re.search(r"ON\s+CONFLICT\s*\(([^)]+)\)\s*DO\s+(UPDATE|NOTHING)", sql, re.I)
+    if not m:
+        return None
+    cols = ",".join(c.strip() for c in m.group(1).split(","))
+    return cols, m.group(2).upper() == "UPDATE"
+
+
 def _parse_update(sql, params):
     """Parse UPDATE table SET col=?, ... WHERE col=?"""
     table = _extract_table(sql)
@@ -468,6 +1808,17 @@ def _parse_update(sql, params):
                 if set_params_used < len(params):
                     updates[col] = params[set_params_used]
                     set_params_used += 1
+                continue
+            # col='text' / col=123 / col=NULL
+            m = re.match(r"([a-zA-Z0-9_]+)\s*=\s*(?:'((?:[^']|'')*)'|(-?\d+(?:\.\d+)?)|(NULL))$", part.strip(), re.I)
+            if m:
+                col, text, num, null = m.groups()
+                if text is not None:
+                    updates[col] = text.replace("''", "'")
+                elif num is not None:
+                    updates[col] = float(num) if "." in num else int(num)
+                else:
+                    updates[col] = None
 
     # Extract WHERE clause
     where_match = re.search(r'WHERE\s+(.*?)$', sql, re.I | re.S)
@@ -488,16 +1839,499 @@ def _parse_where(sql, params):
     return table, filters
 
 
+# ─── Time Expressions ─────────────────────────────────────────────────────────
+# datetime('now', ...) and friends become ? parameters, evaluated (UTC) per execute.
+
+_TIME_EXPR_RE = re.compile(
+    r"\b(datetime|date)\(\s*'now'\s*((?:,\s*'[^']*'\s*)*)\)"
+    r"|\b(CURRENT_TIMESTAMP|CURRENT_DATE)\b|\bNOW\(\s*\)",
+    re.I,
+)
+_TIME_MOD_RE = re.compile(r"([+-]?\d+(?:\.\d+)?)\s+(second|minute|hour|day|month|year)s?$", re.I)
+
+
+def _extract_time_exprs(sql):
+    """
+    Replace time functions with ? placeholders.
+    Returns (sql, clock) where clock is a tuple of (param_index, func, modifiers).
+    """
+    clock = []
+    out = []
+    pos = 0
+    for m in _TIME_EXPR_RE.finditer(sql):
+        out.append(sql[pos:m.start()])
+        if m.group(1):
+            func = m.group(1).lower()
+            mods = tuple(x.lower() for x in re.findall(r"'([^']*)'", m.group(2)))
+        else:
+            func = "date" if (m.group(3) or "").upper() == "CURRENT_DATE" else "datetime"
+            mods = ()
+        clock.append(("".join(out).count("?"), func, mods))
+        out.append("?")
+        pos = m.end()
+    if not clock:
+        return sql, None
+    out.append(sql[pos:])
+    return "".join(out), tuple(clock)
+
+
+def _add_months(t, n):
+    month = t.month - 1 + n
+    year, month = t.year + month // 12, month % 12 + 1
+    return t.replace(year=year, month=month, day=min(t.day, calendar.monthrange(year, month)[1]))
+
+
+def _eval_time(func, mods, now=None):
+    """Evaluate one SQLite date/time function call against the current UTC time."""
+    t = (now or datetime.now(timezone.utc)).replace(tzinfo=None, microsecond=0)
+    for mod in mods:
+        m = _TIME_MOD_RE.match(mod.strip())
+        if m:
+            n, unit = float(m.group(1)), m.group(2).lower()
+            if unit == "month":
+                t = _add_months(t, int(n))
+            elif unit == "year":
+                t = _add_months(t, int(n) * 12)
+            else:
+                t += timedelta(**{unit + "s": n})
+        elif mod == "start of day":
+            t = t.replace(hour=0, minute=0, second=0)
+        elif mod == "start of month":
+            t = t.replace(day=1, hour=0, minute=0, second=0)
+        elif mod == "start of year":
+            t = t.replace(month=1, day=1, hour=0, minute=0, second=0)
+        # 'utc' / 'localtime' and anything else are ignored: values stay UTC
+    return t.date().isoformat() if func == "date" else t.isoformat()
+
+
+def _clock_params(clock, params):
+    """Insert the evaluated time expressions at their ? positions."""
+    params = list(params)
+    for i, func, mods in clock:
+        params.insert(i, _eval_time(func, mods))
+    return params
+
+
+# ─── Plan Cache ───────────────────────────────────────────────────────────────
+# Each SQL string is parsed once into a _Plan with slot markers for its ? params;
+# the parsers only count ?, they never read parameter values.
+
+SUPABASE_PLAN_CACHE_SIZE = int(os.environ.get("SUPABASE_PLAN_CACHE_SIZE", "512"))
+
+_Plan = namedtuple("_Plan", "kind table select filters order limit record embeds fingerprint aggregate clock conflict",
+                   defaults=(None, None, None, None, None))
+
+# \x00N\x00 is a plain slot; \x01N\x01 sits inside an or=()/and=() tree and
+# its value gets quoted if it contains PostgREST's reserved characters.
+_SLOT_RE = re.compile(r"([\x00\x01])(\d+)\1")
+_MISSING = object()
+
+_plan_cache = OrderedDict()
+_plan_lock = threading.Lock()
+_plan_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _slot(i):
+    return f"\x00{i}\x00"
+
+
+def _compile_plan(sql):
+    """Classify and parse one SQL string into a reusable _Plan template."""
+    upper = sql.upper()
+    if upper.startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+        sql, clock = _extract_time_exprs(sql)
+        if clock:
+            return _compile_sql(sql)._replace(clock=clock)
+    return _compile_sql(sql)
+
+
+def _compile_sql(sql):
+    upper = sql.upper()
+    slots = [_slot(i) for i in range(sql.count("?"))]
+
+    if (upper.startswith("CREATE TABLE") or
+            upper.startswith("CREATE INDEX") or
+            upper.startswith("ALTER TABLE") or
+            upper.startswith("DROP TABLE") or
+            upper.startswith("PRAGMA")):
+        return _Plan("ddl", None, None, None, None, None, None)
+
+    if "LAST_INSERT_ROWID" in upper:
+        return _Plan("last_id", None, None, None, None, None, None)
+
+    if upper.startswith("SELECT") and _is_aggregate(sql):
+        table, aggregate, filters, order, limit = _parse_aggregate(sql, slots)
+        return _Plan("aggregate", table, None, filters, order, limit, None, aggregate=aggregate)
+
+    if upper.startswith("SELECT COUNT(*)"):
+        table, filters = _parse_where(sql, slots)
+        return _Plan("count", table, None, filters, None, None, None)
+
+    if upper.startswith("SELECT"):
+        table, select_cols, filters, order, limit, embeds = _parse_select(sql, slots)
+        return _Plan("select", table, select_cols, filters, order, limit, None, embeds)
+
+    if upper.startswith("INSERT INTO"):
+        table, record = _parse_insert(sql, slots)
+        conflict = _parse_conflict(sql)
+        if conflict:
+            return _Plan("upsert", table, None, None, None, None, record, conflict=conflict)
+        return _Plan("insert", table, None, None, None, None, record)
+
+    if upper.startswith("UPDATE"):
+        table, updates, filters = _parse_update(sql, slots)
+        return _Plan("update", table, None, filters, None, None, updates)
+
+    if upper.startswith("DELETE FROM"):
+        table, filters = _parse_where(sql, slots)
+        return _Plan("delete", table, None, filters, None, None, None)
+
+    return _Plan("noop", None, None, None, None, None, None)
+
+
+def _get_plan(sql):
+    with _plan_lock:
+        plan = _plan_cache.get(sql)
+        if plan is not None:
+            _plan_cache.move_to_end(sql)
+            _plan_stats["hits"] += 1
+            return plan
+        _plan_stats["misses"] += 1
+    plan = _compile_plan(sql)._replace(fingerprint=_fingerprint(sql))
+    with _plan_lock:
+        _plan_cache[sql] = plan
+        _plan_cache.move_to_end(sql)
+        while len(_plan_cache) > SUPABASE_PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+            _plan_stats["evictions"] += 1
+    return plan
+
+
+def _bind(template, params):
+    """
+    Substitute ? parameters into a plan's filters or record.
+
+    A value that is exactly one slot gets the raw parameter (so INSERT/UPDATE
+    keep ints, None, dicts...); slots embedded in filter strings are formatted
+    with str() like the parsers do. Record slots with no parameter are dropped,
+    matching the parsers' own behaviour when too few params are passed.
+    """
+    if not template:
+        return {}
+    n = len(params)
+
+    def lookup(i):
+        return params[i] if i < n else _MISSING
+
+    def sub(m):
+        v = lookup(int(m.group(2)))
+        v = None if v is _MISSING else v
+        return _tree_quote(v) if m.group(1) == "\x01" else str(v)
+
+    def bind_str(v):
+        if "\x00" in v or "\x01" in v:
+            return _SLOT_RE.sub(sub, v)
+        return v
+
+    out = {}
+    for k, v in template.items():
+        if isinstance(v, str) and "\x00" in v:
+            m = _SLOT_RE.fullmatch(v)
+            if m:
+                v = lookup(int(m.group(2)))
+                if v is _MISSING:
+                    continue
+            else:
+                v = bind_str(v)
+        elif isinstance(v, str):
+            v = bind_str(v)
+        elif isinstance(v, list):
+            v = [bind_str(x) for x in v]
+        out[k] = v
+    return out
+
+
+def plan_cache_stats():
+    with _plan_lock:
+        out = dict(_plan_stats)
+        out["size"] = len(_plan_cache)
+    out["max_size"] = SUPABASE_PLAN_CACHE_SIZE
+    return out
+
+
+# ─── SQLite Backend ───────────────────────────────────────────────────────────
+# DB_BACKEND=sqlite: app.py's SQL runs as-is on a file bootstrapped from setup_crm.sql.
+
+_sqlite_ready = set()
+_sqlite_lock = threading.Lock()
+
+_PG_ONLY = re.compile(
+    r"^\s*(CREATE\s+EXTENSION|CREATE\s+POLICY|DROP\s+POLICY|ALTER\s+TABLE\s+\w+\s+ENABLE\s+ROW"
+    r"|ALTER\s+ROLE|NOTIFY)"
+    r"|\bUSING\s+gin\b", re.I)
+
+
+def _sqlite_schema():
+    """setup_crm.sql statements rewritten for SQLite."""
+    text = (ROOT / "setup_crm.sql").read_text(encoding="utf-8")
+    text = "\n".join(line.split("--", 1)[0] for line in text.splitlines())
+    statements = []
+    for stmt in text.split(";"):
+        stmt = stmt.strip()
+        if not stmt or _PG_ONLY.search(stmt):
+            continue
+        stmt = re.sub(r"\bSERIAL\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", stmt, flags=re.I)
+        stmt = re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", stmt, flags=re.I)
+        stmt = re.sub(r"\b(TIMESTAMPTZ|JSONB)\b", "TEXT", stmt, flags=re.I)
+        statements.append(stmt)
+    return statements
+
+
+_sqlite_json_cols = []
+
+
+def _sqlite_json_columns():
+    """Names of the JSONB columns in setup_crm.sql."""
+    if not _sqlite_json_cols:
+        text = (ROOT / "setup_crm.sql").read_text(encoding="utf-8")
+        _sqlite_json_cols.append(frozenset(re.findall(r"^\s*(\w+)\s+JSONB\b", text, re.M | re.I)))
+    return _sqlite_json_cols[0]
+
+
+def _sqlite_param(value):
+    if isinstance(value, (dict, list)):
+        return json_dumps(value).decode("utf-8")
+    return value
+
+
+def _sqlite_bootstrap(conn, path):
+    with _sqlite_lock:
+        if path in _sqlite_ready:
+            return
+        conn.execute("PRAGMA journal_mode=WAL")
+        for stmt in _sqlite_schema():
+            try:
+                conn.execute(stmt)
+            except sqlite3.OperationalError as e:
+                # e.g. an index on a column that an older local table lacks
+                print(f"[db] sqlite schema: {e}")
+        conn.commit()
+        _sqlite_ready.add(path)
+
+
+_SQLITE_WRITE_RE = re.compile(
+    r"\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|UPDATE|DELETE\s+FROM)\s+(\w+)", re.I)
+
+
+def _sqlite_row(cursor, row):
+    cols = tuple(d[0] for d in cursor.description)
+    json_cols = _sqlite_json_columns()
+    if json_cols.intersection(cols):
+        row = list(row)
+        for i, col in enumerate(cols):
+            v = row[i]
+            if col in json_cols and isinstance(v, str) and v[:1] in ("{", "["):
+                try:
+                    row[i] = json_loads(v)
+                except ValueError:
+                    pass
+    return SupabaseRow(zip(cols, row), cols)
+
+
+class SqliteConn:
+    """
+    Same interface as SupabaseConn, backed by a local SQLite file in WAL mode.
+    Used as a context manager it commits on success and rolls back on error,
+    then closes the file handle.
+    """
+
+    def __init__(self, path=None, batch_writes=False):
+        # batch_writes is accepted for interface parity; SQLite transactions
+        # already buffer until commit().
+        self._path = path or DB_PATH
+        Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self._path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = _sqlite_row
+        _sqlite_bootstrap(self._conn, self._path)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._last_insert_id = None
+
+    def execute(self, sql, params=None, cache=True):
+        # cache is accepted for interface parity; SQLite has no read cache
+        cur = self._conn.execute(sql, tuple(_sqlite_param(p) for p in params) if params else ())
+        if cur.lastrowid:
+            self._last_insert_id = cur.lastrowid
+        m = _SQLITE_WRITE_RE.match(sql)
+        if m:
+            _cache_invalidate(m.group(1).lower())
+        return cur
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        try:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            self._conn.close()
+
+
+# ─── Dataloader ───────────────────────────────────────────────────────────────
+# Collects point-lookup keys and resolves them with one WHERE col IN (...) per chunk.
+
+LOADER_CHUNK = 128
+
+
+class DataLoader:
+    def __init__(self, table, column="id", select="*"):
+        if select != "*" and column not in [c.strip() for c in select.split(",")]:
+            select = f"{column}, {select}"   # rows are matched back by column
+        self.table = table
+        self.column = column
+        self.select = select
+        self._queued = []
+        self._memo = {}   # str(key) → [rows]
+        self._gen = _cache_gen.get(table, 0)
+
+    def _fresh(self):
+        gen = _cache_gen.get(self.table, 0)
+        if gen != self._gen:
+            self._memo.clear()
+            self._gen = gen
+
+    def want(self, keys):
+        """Queue keys; they are fetched together on the next load()."""
+        self._queued.extend(k for k in keys if k is not None and k != "")
+        return self
+
+    def _flush(self):
+        self._fresh()
+        pending = OrderedDict()
+        for k in self._queued:
+            if str(k) not in self._memo:
+                pending.setdefault(str(k), k)
+        self._queued = []
+        if not pending:
+            return
+        keys = list(pending.values())
+        with get_conn() as conn:
+            for i in range(0, len(keys), LOADER_CHUNK):
+                chunk = keys[i:i + LOADER_CHUNK]
+                # Pad to a power of two so only a handful of distinct SQL
+                # strings (and cached plans) exist per loader
+                size = 1 << (len(chunk) - 1).bit_length()
+                chunk = chunk + [chunk[-1]] * (size - len(chunk))
+                sql = "SELECT {} FROM {} WHERE {} IN ({})".format(
+                    self.select, self.table, self.column, ", ".join("?" * size))
+                for k in chunk:
+                    self._memo.setdefault(str(k), [])
+                for row in conn.execute(sql, chunk).fetchall():
+                    self._memo.setdefault(str(row[self.column]), []).append(row)
+        with _stats_lock:
+            _stats["loader_batches"] += 1
+            _stats["loader_keys"] += len(keys)
+
+    def load_all(self, key):
+        """Every row whose column equals key."""
+        if key is None or key == "":
+            return []
+        self._queued.append(key)
+        self._flush()
+        return self._memo.get(str(key), [])
+
+    def load(self, key):
+        """First row whose column equals key, or None."""
+        rows = self.load_all(key)
+        return rows[0] if rows else None
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.want(keys)
+        return [self.load(k) for k in keys]
+
+    def cached(self, key):
+        """Rows for key if already loaded (None if unknown), without I/O."""
+        self._fresh()
+        return self._memo.get(str(key))
+
+
+def _request_loaders():
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    if "_db_loaders" not in g:
+        g._db_loaders = {}
+    return g._db_loaders
+
+
+def loader(table, column="id", select="*"):
+    """
+    A DataLoader for table.column, shared for the current request:
+
+        users = db.loader("crm_users", select="id, name, color")
+        users.want(r["assigned_user_id"] for r in rows)
+        r["assigned_user"] = users.load(r["assigned_user_id"])
+    """
+    loaders = _request_loaders()
+    if loaders is None:
+        return DataLoader(table, column, select)
+    key = (table, column, select)
+    if key not in loaders:
+        loaders[key] = DataLoader(table, column, select)
+    return loaders[key]
+
+
+def _loader_hit(plan, filters):
+    """Rows for a primed point lookup, or None."""
+    if plan.select != "*" or plan.embeds or plan.order or plan.limit not in (None, 1) or len(filters) != 1:
+        return None
+    (col, val), = filters.items()
+    if not isinstance(val, str) or not val.startswith("eq."):
+        return None
+    loaders = _request_loaders()
+    ld = loaders.get((plan.table, col, "*")) if loaders else None
+    rows = ld.cached(val[3:]) if ld is not None else None
+    if rows is None:
+        return None
+    with _stats_lock:
+        _stats["loader_hits"] += 1
+    return [dict(r) for r in rows[:plan.limit or None]]
+
+
 # ─── Public API ───────────────────────────────────────────────────────────────
 
-def get_conn():
-    """Returns a Supabase-backed connection (drop-in for sqlite3.connect)."""
-    return SupabaseConn()
+def get_conn(batch_writes=False):
+    """
+    Returns a connection for the configured DB_BACKEND (drop-in for
+    sqlite3.connect): Supabase over HTTP by default, or a local SQLite file.
+    """
+    if DB_BACKEND == "sqlite":
+        return SqliteConn(batch_writes=batch_writes)
+    return SupabaseConn(batch_writes=batch_writes)
 
 
 def row_to_dict(row):
     if row is None:
         return {}
+    if isinstance(row, SupabaseRow):
+        # Every execute() builds fresh rows, so handing out the row itself
+        # is safe and saves copying each row before jsonify
+        return row
+    if isinstance(row, _AuditRow):
+        return row.copy()
     if isinstance(row, dict):
         return dict(row)
     # sqlite3.Row fallback
@@ -512,13 +2346,16 @@ def init_db():
     Ensure all CRM tables exist in Supabase.
     Run this SQL once in the Supabase SQL editor:
     https://supabase.com/dashboard/project/kqympdxeszdyppbhtzbm/sql/new
+
+    With DB_BACKEND=sqlite the schema is created automatically on first use.
     """
-    pass  # Tables are created via Supabase dashboard SQL (see setup_crm.sql)
+    if DB_BACKEND == "sqlite":
+        get_conn().close()
 
 
-def get_db():
-    return get_conn()
+def get_db(batch_writes=False):
+    return get_conn(batch_writes=batch_writes)
 
 
-def get_crm_conn():
-    return get_conn()
+def get_crm_conn(batch_writes=False):
+    return get_conn(batch_writes=batch_writes)
@@ -0,0 +1,244 @@
+"""
+appointments_mirror.py — In-process copy of the Supabase `appointments` table.
+
+The calendar used to download appointments for every month it rendered. The
+mirror loads the table once, then only asks Supabase for rows whose
+updated_at is at or after the newest one it has seen (the watermark), so a
+refresh normally moves a handful of rows. Months are served from a
+YYYY-MM → rows bucket map without touching the network.
+
+Deleted rows never show up in an updated_at delta, so every `reconcile`
+seconds a delta also fetches the table's ids (select=id) and drops rows that
+are gone; the whole table is re-read every `resync` seconds as well. Refreshes run on one background
+thread at a time: window() never waits for Supabase, it serves the mirror as
+it stands and starts a refresh when the last one is older than ttl. Until the
+first load has landed, or if the table has no updated_at column, window()
+returns None and callers use a plain date-range query; see fetch_range().
+
+Requests go through db.py's pooled session, retries and circuit breaker, so
+they use the same SUPABASE_URL / key as the rest of the app.
+
+Usage (as module):
+    from execution.appointments_mirror import AppointmentMirror, fetch_range
+    mirror = AppointmentMirror(ttl=10, reconcile=60, resync=900,
+                               on_change=lambda dates: ...)
+    mirror.window("2026-10-01", "2026-10-31")   # → [row, ...] or None
+    mirror.refresh(wait=True)                   # load now, in this thread
+    mirror.stats()
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+
+TABLE = "appointments"
+PAGE_SIZE = 1000
+ORDER_BY_DATE = "appointment_date.asc,appointment_time.asc,id.asc"   # same as _sort_key
+
+
+def _month(row):
+    d = str(row.get("appointment_date") or "")
+    return d[:7] if len(d) >= 7 else None
+
+
+def _sort_key(row):
+    # PostgREST's "asc" puts nulls last; id keeps ties (and the ETag) stable
+    t = row.get("appointment_time")
+    rid = row.get("id")
+    rid = (0, rid, "") if isinstance(rid, int) else (1, 0, str(rid))
+    return (str(row.get("appointment_date") or ""), t is None, str(t or ""), rid)
+
+
+class MirrorError(Exception):
+    """PostgREST answered a mirror request with an error status."""
+
+    def __init__(self, status, body):
+        super().__init__("HTTP {}: {}".format(status, body[:200]))
+        self.status = status
+
+
+def _get(params):
+    r = db._http("GET", TABLE, params=params, headers=db._headers(prefer_return=False))
+    if r.status_code != 200:
+        raise MirrorError(r.status_code, r.text)
+    return db.json_loads(r.content)
+
+
+def _get_all(params):
+    """Every row for params, PAGE_SIZE at a time."""
+    out = []
+    while True:
+        page = _get({**params, "limit": PAGE_SIZE, "offset": len(out)})
+        out.extend(page)
+        if len(page) < PAGE_SIZE:
+            return out
+
+
+def fetch_range(date_from, date_to):
+    """Appointments dated date_from..date_to (inclusive), straight from Supabase."""
+    return _get_all({
+        "select": "*",
+        "and": "(appointment_date.gte.{},appointment_date.lte.{})".format(date_from, date_to),
+        "order": ORDER_BY_DATE,
+    })
+
+
+class AppointmentMirror:
+    """Supabase appointments kept current through an updated_at watermark."""
+
+    def __init__(self, ttl=10.0, reconcile=60.0, resync=900.0, on_change=None):
+        self.ttl = ttl
+        self.reconcile = reconcile
+        self.resync = resync
+        self.on_change = on_change    # called with the dates whose rows changed
+        self.rows = {}                # id → row
+        self._by_month = {}           # "YYYY-MM" → {ids}
+        self.watermark = None         # newest updated_at seen
+        self.usable = None            # None until the first load tells us
+        self._checked_at = None       # monotonic time of the last refresh start
+        self._loaded_at = 0.0
+        self._reconciled_at = 0.0
+        self._refreshing = False
+        self._counts = {"full": 0, "delta": 0, "reconcile": 0, "rows": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    # ── Maintenance (callers hold _lock) ──
+    def _put(self, row, changed):
+        rid = row.get("id")
+        old = self.rows.get(rid)
+        if old == row:
+            return
+        if old is not None:
+            changed.add(old.get("appointment_date"))
+            self._by_month.get(_month(old), set()).discard(rid)
+        changed.add(row.get("appointment_date"))
+        self.rows[rid] = row
+        self._by_month.setdefault(_month(row), set()).add(rid)
+
+    def _advance(self, rows):
+        for row in rows:
+            ts = row.get("updated_at")
+            if ts and (self.watermark is None or str(ts) > self.watermark):
+                self.watermark = str(ts)
+
+    def _apply_full(self, rows):
+        changed = set()
+        if self.usable is None:
+            if not rows:
+                # An empty table cannot tell; ask again on the next full load
+                return changed
+            self.usable = "updated_at" in rows[0]
+            if not self.usable:
+                print("[Appointments mirror] no updated_at column, using range queries")
+                return changed
+        self._drop_missing({row.get("id") for row in rows}, changed)
+        for row in rows:
+            self._put(row, changed)
+        self._advance(rows)
+        self._loaded_at = self._reconciled_at = time.monotonic()
+        return changed
+
+    def _drop_missing(self, ids, changed):
+        for rid in [rid for rid in self.rows if rid not in ids]:
+            old = self.rows.pop(rid)
+            changed.add(old.get("appointment_date"))
+            self._by_month.get(_month(old), set()).discard(rid)
+
+    def _apply_delta(self, rows):
+        changed = set()
+        for row in rows:
+            self._put(row, changed)
+        self._advance(rows)
+        return changed
+
+    # ── Refresh ──
+    def _run(self, full, watermark, reconcile=False):
+        """One refresh: fetch without the lock, apply under it."""
+        changed = set()
+        try:
+            if full:
+                rows = _get_all({"select": "*", "order": "id.asc"})
+            else:
+                params = {"select": "*", "order": "updated_at.asc,id.asc"}
+                if watermark:
+                    # gte, not gt: rows written in the same instant as the
+                    # watermark may not have been visible yet; re-reading is harmless
+                    params["updated_at"] = "gte." + watermark
+                rows = _get_all(params)
+            # After the delta: an id missing now was deleted, not yet to come
+            ids = {r.get("id") for r in _get_all({"select": "id", "order": "id.asc"})} if reconcile else None
+            with self._lock:
+                changed = self._apply_full(rows) if full else self._apply_delta(rows)
+                if ids is not None:
+                    self._drop_missing(ids, changed)
+                    self._reconciled_at = time.monotonic()
+                    self._counts["reconcile"] += 1
+                self._counts["full" if full else "delta"] += 1
+                self._counts["rows"] += len(rows)
+        except Exception as e:   # incl. db.SupabaseUnavailable: keep serving what we have
+            with self._lock:
+                self._counts["errors"] += 1
+            print("[Appointments mirror] refresh failed:", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+        changed.discard(None)
+        if changed and self.on_change:
+            self.on_change(sorted(str(d) for d in changed))
+
+    def refresh(self, force=False, wait=False):
+        """
+        Start a refresh if the mirror is older than ttl (or force): a full
+        reload when due, an updated_at delta otherwise. Runs on a background
+        thread unless wait; at most one refresh is in flight.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.usable is False or self._refreshing:
+                return
+            if not force and self._checked_at is not None and now - self._checked_at < self.ttl:
+                return
+            self._checked_at = now
+            self._refreshing = True
+            full = self.usable is None or now - self._loaded_at > self.resync
+            reconcile = not full and now - self._reconciled_at > self.reconcile
+            args = (full, self.watermark, reconcile)
+        if wait:
+            self._run(*args)
+        else:
+            threading.Thread(target=self._run, args=args, daemon=True,
+                             name="appointments-mirror").start()
+
+    # ── Lookup ──
+    def window(self, date_from, date_to):
+        """
+        Rows dated date_from..date_to ("YYYY-MM-DD", inclusive), ordered by
+        date then time — or None when the mirror cannot be used (yet).
+        """
+        self.refresh()
+        with self._lock:
+            if not self.usable or not self._loaded_at:
+                return None
+            months = {date_from[:7], date_to[:7]}
+            y, m = int(date_from[:4]), int(date_from[5:7])
+            while "{:04d}-{:02d}".format(y, m) < date_to[:7]:
+                months.add("{:04d}-{:02d}".format(y, m))
+                y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+            rows = [self.rows[rid] for month in months for rid in self._by_month.get(month, ())]
+        rows = [r for r in rows if date_from <= str(r.get("appointment_date") or "")[:10] <= date_to]
+        rows.sort(key=_sort_key)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "size": len(self.rows), "watermark": self.watermark,
+                    "usable": self.usable, "refreshing": self._refreshing}
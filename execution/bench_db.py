@@ -0,0 +1,241 @@
+"""
+bench_db.py — Micro-benchmarks for the Supabase adapter in db.py.
+
+`plans`, `rows` and `json` need no network access: they exercise the adapter's
+in-process work only. `queries` runs real statements against whatever DB_BACKEND selects.
+
+Usage:
+    python execution/bench_db.py plans              # SQL → PostgREST translation
+    python execution/bench_db.py plans --rounds=2000
+    python execution/bench_db.py rows               # row objects: build, memory, access
+    python execution/bench_db.py json               # orjson vs. stdlib on 20k leads
+
+    # End-to-end statement latency through get_conn(). Against SQLite this is
+    # the local baseline every Supabase-side number should be compared with.
+    DB_BACKEND=sqlite DB_PATH=/tmp/bench.db python execution/bench_db.py queries
+    python execution/bench_db.py queries --rounds=20   # needs SUPABASE_URL/KEY
+
+    # The Supabase path without a project: execution/local_supabase.py serves
+    # PostgREST on SQLite, with injectable latency to mimic a remote region
+    python execution/local_supabase.py --latency-ms=30 --jitter-ms=10 &
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_ANON_KEY=local \
+        python execution/bench_db.py queries
+"""
+
+import argparse
+import ast
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+
+
+# ─── Helpers ─────────────────────────────────────────────────────────────────
+def app_sql_corpus():
+    """Every literal SQL string passed to .execute() in app.py."""
+    tree = ast.parse((ROOT / "app.py").read_text(encoding="utf-8"))
+    sqls = set()
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call)
+                and getattr(node.func, "attr", "") == "execute"
+                and node.args
+                and isinstance(node.args[0], ast.Constant)
+                and isinstance(node.args[0].value, str)):
+            sqls.add(node.args[0].value.strip())
+    return sorted(sqls)
+
+
+def fake_params(sql):
+    return [f"v{i}" if i % 2 else i for i in range(sql.count("?"))]
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return time.perf_counter() - start
+
+
+def report(label, seconds, ops):
+    print(f"  {label:<28} {seconds * 1000:9.1f} ms   {seconds / ops * 1e6:8.2f} µs/stmt")
+
+
+# ─── Benchmarks ──────────────────────────────────────────────────────────────
+def bench_plans(args):
+    corpus = [(sql, fake_params(sql)) for sql in app_sql_corpus()]
+    ops = len(corpus) * args.rounds
+    print(f"SQL corpus: {len(corpus)} statements from app.py × {args.rounds} rounds")
+
+    def uncached():
+        for sql, params in corpus:
+            plan = db._compile_plan(sql)
+            db._bind(plan.filters, params)
+            db._bind(plan.record, params)
+
+    def cached():
+        for sql, params in corpus:
+            plan = db._get_plan(sql)
+            db._bind(plan.filters, params)
+            db._bind(plan.record, params)
+
+    cached()  # warm the cache
+    t_uncached = timed(uncached, args.rounds)
+    t_cached = timed(cached, args.rounds)
+    report("parse every call", t_uncached, ops)
+    report("cached plan + bind", t_cached, ops)
+    print(f"  speedup: {t_uncached / t_cached:.1f}×   cache: {db.plan_cache_stats()}")
+
+
+def bench_queries(args):
+    backend = db.DB_BACKEND
+    print(f"Backend: {backend}" + (f" ({db.DB_PATH})" if backend == "sqlite" else f" ({db.SUPABASE_URL})"))
+    marker = f"bench-{time.time_ns()}"
+    workload = [
+        ("insert lead", lambda c, i: c.execute(
+            "INSERT INTO crm_leads (full_name, plate, stage, source, source_id) VALUES (?, ?, ?, ?, ?)",
+            (f"Bench {i}", f"BN{i:04d}", "nuevo", "bench", marker))),
+        ("point select", lambda c, i: c.execute(
+            "SELECT * FROM crm_leads WHERE plate=?", (f"BN{i:04d}",)).fetchone()),
+        ("update by key", lambda c, i: c.execute(
+            "UPDATE crm_leads SET stage=? WHERE plate=?", ("contactado", f"BN{i:04d}"))),
+        ("count", lambda c, i: c.execute(
+            "SELECT COUNT(*) FROM crm_leads WHERE stage=?", ("contactado",)).fetchone()),
+        ("list users", lambda c, i: c.execute(
+            "SELECT * FROM crm_users WHERE active=1 ORDER BY name").fetchall()),
+    ]
+    with db.get_conn() as conn:
+        for label, fn in workload:
+            t = timed(lambda: [fn(conn, i) for i in range(args.rounds)], 1)
+            conn.commit()
+            report(label, t, args.rounds)
+        conn.execute("DELETE FROM crm_leads WHERE source_id=?", (marker,))
+        conn.commit()
+
+
+class LegacyRow(dict):
+    """The previous SupabaseRow, kept here as the baseline."""
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+
+def bench_rows(args):
+    page = [{f"col_{c:02d}": (i * c if c % 3 else f"value {i}-{c}") for c in range(args.cols)}
+            for i in range(args.rows)]
+    print(f"Page: {args.rows} rows × {args.cols} columns (a list endpoint: rows, then row_to_dict)")
+
+    variants = (
+        # (label, decoded page → rows, row_to_dict)
+        ("before", lambda p: [LegacyRow(r) for r in p], dict),
+        ("SupabaseRow", db._make_rows, db.row_to_dict),
+    )
+    for label, make, to_dict in variants:
+        t0 = time.perf_counter()
+        rows = make(page)
+        t_build = time.perf_counter() - t0
+        t_pos = timed(lambda: [r[0] for r in rows], 1)
+        t0 = time.perf_counter()
+        out = [to_dict(r) for r in rows]
+        t_dict = time.perf_counter() - t0
+
+        # Peak memory of the same pipeline, measured separately because
+        # tracemalloc slows allocation-heavy code down
+        del rows, out
+        tracemalloc.start()
+        rows = make(page)
+        out = [to_dict(r) for r in rows]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del rows, out
+
+        print(f"  {label}")
+        report("build rows", t_build, args.rows)
+        report("row[0]", t_pos, args.rows)
+        report("row_to_dict", t_dict, args.rows)
+        print(f"  {'memory on top of the page':<28} {peak / 1024 / 1024:9.1f} MB")
+
+
+def synthetic_leads(n):
+    """crm_leads-shaped rows, as PostgREST would return them."""
+    stages = ["nuevo", "contactado", "agendado", "inspeccion", "vendido", "descartado"]
+    base = datetime(2026, 1, 1, 9, 0)
+    leads = []
+    for i in range(n):
+        ts = (base + timedelta(minutes=17 * i)).isoformat()
+        leads.append({
+            "id": i + 1, "first_name": f"Nombre{i}", "last_name": f"Apellido{i}",
+            "full_name": f"Nombre{i} Apellido{i}", "rut": f"{10000000 + i}-{i % 10}",
+            "email": f"lead{i}@example.cl", "phone": f"9{i:08d}", "country_code": "+56",
+            "region": "Metropolitana", "commune": "Vitacura", "address": f"Av. Siempre Viva {i}",
+            "plate": f"AB{i % 10000:04d}", "car_make": "Toyota", "car_model": "Corolla",
+            "car_year": 2010 + i % 15, "mileage": 1000 * (i % 200), "version": "1.8 XEI",
+            "appointment_date": None, "appointment_time": None, "stage": stages[i % len(stages)],
+            "priority": "medium", "assigned_to": i % 5 or None, "source": "funnels",
+            "source_id": None, "supabase_id": None, "funnel_url": f"https://fb.com/item/{i}",
+            "estimated_value": 9_500_000 + i, "listing_price": 10_000_000 + i,
+            "ai_consignacion_price": 9_000_000, "ai_instant_buy_price": 8_200_000,
+            "notes": "Cliente interesado en consignación, llamar después de las 18:00",
+            "tags": "[]", "last_contact_at": ts, "next_followup_at": None,
+            "created_at": ts, "updated_at": ts,
+        })
+    return leads
+
+
+def bench_json(args):
+    leads = synthetic_leads(args.leads)
+    body = json.dumps(leads).encode()
+    print(f"Payload: {args.leads} leads, {len(body) / 1024 / 1024:.1f} MB — codec in use: {db.JSON_CODEC}")
+
+    # What Flask's default provider does for jsonify: sorted keys, ASCII-escaped
+    def flask_default():
+        json.dumps(leads, default=db._json_default, ensure_ascii=True, sort_keys=True)
+
+    cases = [
+        ("decode  json.loads", lambda: json.loads(body)),
+        ("decode  db.json_loads", lambda: db.json_loads(body)),
+        ("encode  Flask default", flask_default),
+        ("encode  db.json_dumps", lambda: db.json_dumps(leads)),
+    ]
+    for label, fn in cases:
+        print(f"  {label:<28} {timed(fn, args.rounds) / args.rounds * 1000:9.1f} ms/payload")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="db.py adapter micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_plans = sub.add_parser("plans", help="SQL translation: re-parse vs. cached plan")
+    p_plans.add_argument("--rounds", type=int, default=500)
+
+    p_rows = sub.add_parser("rows", help="Row objects: build, positional access, row_to_dict, memory")
+    p_rows.add_argument("--rows", type=int, default=10000)
+    p_rows.add_argument("--cols", type=int, default=40)
+
+    p_json = sub.add_parser("json", help="Decode/encode a synthetic lead listing")
+    p_json.add_argument("--leads", type=int, default=20000)
+    p_json.add_argument("--rounds", type=int, default=5)
+
+    p_queries = sub.add_parser("queries", help="Statement latency on the configured DB_BACKEND")
+    p_queries.add_argument("--rounds", type=int, default=200)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    commands = {
+        "plans": bench_plans,
+        "rows": bench_rows,
+        "json": bench_json,
+        "queries": bench_queries,
+    }
+    commands[args.command](args)
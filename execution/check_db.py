@@ -0,0 +1,496 @@
+"""
+check_db.py — db.py's Supabase path against its SQLite backend, over local_supabase.py.
+
+Starts execution/local_supabase.py in this process on a temporary SQLite file,
+loads the same generated rows into it and into a DB_BACKEND=sqlite database,
+then runs these checks and exits 1 on the first failure:
+
+    corpus    every statement app.py passes to execute(), with parameters drawn
+              from the data, returns the same rows and leaves the same tables
+              through SupabaseConn as through SqliteConn
+    trees     random WHERE clauses nesting AND/OR, BETWEEN, IN, NOT IN, LIKE,
+              IS [NOT] NULL and comparisons select the same rows as SQLite
+    batch     batch_writes=True sends parents before the children that hold
+              their PendingId, and drops children of a parent that failed
+    cache     crm_users reads are cached, a write drops them, cache=False
+              reads through
+    paging    a SELECT over 2,500 rows comes back whole, in Range pages of
+              1000, from a server that caps responses at 1000 rows
+    breaker   failures open the circuit, after the cooldown one probe goes
+              through, and its result closes or re-opens the circuit
+
+Usage:
+    python execution/check_db.py
+    python execution/check_db.py --rounds=10 --seed=7
+    python execution/check_db.py --only=corpus,trees
+"""
+
+import argparse
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+from execution import local_supabase  # noqa: E402
+from execution.bench_db import app_sql_corpus  # noqa: E402
+
+STAGES = ["nuevo", "contactado", "agendado", "vendido", "descartado"]
+CHOICES = {
+    "stage": STAGES,
+    "source": ["funnels", "web", "manual"],
+    "status": ["draft", "sold", "sent_dte", "en_venta", "new"],
+    "role": ["admin", "vendedor"],
+    "active": [0, 1],
+}
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(ok, message):
+    if not ok:
+        raise CheckFailed(message)
+
+
+# ─── Data ────────────────────────────────────────────────────────────────────
+class Env:
+    """The stub, both connections and a row generator that knows the schema."""
+
+    def __init__(self, tmp, rng):
+        self.rng = rng
+        self.server, self.url = local_supabase.serve_in_thread(
+            port=0, db_path=tmp / "rest.db", storage_dir=tmp / "storage")
+        self.stub = self.server.stub
+        db.SUPABASE_URL, db.SUPABASE_KEY = self.url, "local"
+        self.lite = db.SqliteConn(str(tmp / "lite.db"))
+        self.supa = db.SupabaseConn()
+        self.serial = 0
+        self.today = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        self.columns, self.parents = {}, {}
+        for row in self.lite.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():
+            name = row["name"]
+            unique = set()
+            for idx in self.lite.execute(f'PRAGMA index_list("{name}")').fetchall():
+                if idx["unique"]:
+                    unique.update(c["name"] for c in self.lite.execute(f'PRAGMA index_info("{idx["name"]}")').fetchall())
+            self.columns[name] = {
+                c["name"]: (c["type"].upper(), bool(c["notnull"]), c["name"] in unique)
+                for c in self.lite.execute(f'PRAGMA table_info("{name}")').fetchall()
+            }
+            self.parents[name] = {fk["from"]: fk["table"]
+                                  for fk in self.lite.execute(f'PRAGMA foreign_key_list("{name}")').fetchall()}
+        self.tables = []
+        while len(self.tables) < len(self.columns):   # parents before children
+            for name in sorted(self.columns):
+                if name not in self.tables and all(p in self.tables or p == name for p in self.parents[name].values()):
+                    self.tables.append(name)
+
+    def requests_for(self, method, table):
+        return self.stub.requests[f"{method} rest/v1/{table}"]
+
+    def value(self, table, col, nullable=True):
+        """A fresh value for table.col; unique columns never repeat."""
+        rng = self.rng
+        decl, notnull, unique = self.columns[table][col]
+        self.serial += 1
+        if col in self.parents[table]:
+            ids = self.pool(self.parents[table][col], "id")
+            return rng.choice(ids) if ids and (notnull or rng.random() < 0.8) else None
+        if unique:
+            return f"{col}-{self.serial}"
+        if nullable and not notnull and rng.random() < 0.15:
+            return None
+        if col in CHOICES:
+            return rng.choice(CHOICES[col])
+        if col in db._sqlite_json_columns():
+            return rng.choice([{"n": rng.randint(0, 3)}, [1, "a"], None if nullable else {}])
+        if "INT" in decl:
+            return rng.randint(2015, 2024) if "year" in col else rng.randint(0, 9) * 1000
+        if any(t in decl for t in ("REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL")):
+            return round(rng.uniform(0, 50), 1)
+        if "BOOL" in decl:
+            return rng.random() < 0.5
+        # Days -7 and 0 are left out: the adapter evaluates datetime('now', …)
+        # to "YYYY-MM-DDTHH:MM:SS" and SQLite to "YYYY-MM-DD HH:MM:SS", which
+        # only order differently against a stored text timestamp of the same day.
+        day = self.today + timedelta(days=rng.choice([d for d in range(-30, 31) if d not in (-7, 0)]))
+        if col.endswith("_date"):
+            return day.date().isoformat()
+        if col.endswith("_time"):
+            return f"{rng.randint(8, 19):02d}:{rng.choice([0, 30]):02d}"
+        if col.endswith("_at"):
+            return day.replace(hour=rng.randint(0, 23), minute=rng.randint(0, 59)).strftime("%Y-%m-%d %H:%M:%S")
+        return f"{col}-{rng.randint(0, 5)}"
+
+    def pool(self, table, col):
+        return [r[0] for r in self.lite.execute(
+            f'SELECT DISTINCT "{col}" FROM "{table}" WHERE "{col}" IS NOT NULL').fetchall()]
+
+    def existing(self, table, col):
+        """A value table.col already holds, now and then one it does not."""
+        pool = self.pool(table, col)
+        if pool and self.rng.random() < 0.85:
+            return self.rng.choice(pool)
+        return self.value(table, col, nullable=False)
+
+    def load(self, per_table):
+        for table in self.tables:
+            cols = [c for c in self.columns[table] if c != "id"]
+            rows = [{c: self.value(table, c) for c in cols} for _ in range(per_table)]
+            if self.columns[table]["id"][0] != "INTEGER":
+                for row in rows:
+                    row["id"] = self.value(table, "id")
+            for row in rows:
+                self.lite.execute(f'INSERT INTO "{table}" ({", ".join(row)}) VALUES ({", ".join("?" * len(row))})',
+                                  list(row.values()))
+                self.lite.commit()
+            db._supa_insert(table, rows)
+
+
+# ─── Comparing results ───────────────────────────────────────────────────────
+def _norm(v):
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, float):
+        return int(v) if v.is_integer() else round(v, 6)
+    return v
+
+
+def rows_of(result):
+    return [{k: _norm(v) for k, v in dict(r).items()} for r in result.fetchall()]
+
+
+def _key(row):
+    return repr(sorted(row.items()))
+
+
+def _order_cols(plan):
+    return [part.split(".")[0] for part in (plan.order or "").split(",") if part]
+
+
+def compare_read(env, sql, params, plan):
+    """None if SupabaseConn and SqliteConn agree on sql, else a description."""
+    got = rows_of(env.supa.execute(sql, params))
+    # LIMIT without a total order may pick different tied rows: compare
+    # against everything SQLite would return without it
+    want = rows_of(env.lite.execute(re.sub(r"\s+LIMIT\s+\d+\s*$", "", sql, flags=re.I), params))
+    n = min(plan.limit, len(want)) if plan.limit else len(want)
+    keys = sorted(map(_key, want))
+    if plan.limit:
+        ok = len(got) == n and all(_key(r) in keys for r in got)
+    else:
+        ok = sorted(map(_key, got)) == keys
+    cols = _order_cols(plan)
+    if ok and cols and all(c in r for r in want[:1] for c in cols):
+        ok = [[r[c] for c in cols] for r in got] == [[r[c] for c in cols] for r in want[:n]]
+    if not ok:
+        return "supabase: {}\n  sqlite:   {}".format(got[:5], want[:5])
+    return None
+
+
+def compare_tables(env, tables):
+    for table in tables:
+        got = rows_of(env.supa.execute(f"SELECT * FROM {table} ORDER BY id", cache=False))
+        want = rows_of(env.lite.execute(f"SELECT * FROM {table} ORDER BY id"))
+        if got != want:
+            diff = [(g, w) for g, w in zip(got, want) if g != w][:2]
+            return f"{table} differs ({len(got)} vs {len(want)} rows): {diff}"
+    return None
+
+
+# ─── corpus ──────────────────────────────────────────────────────────────────
+_PARAM_RES = [
+    re.compile(r"(?:\w+\.)?(\w+)\s*(?:=|>=|<=|>|<|\bLIKE)\s*\?$", re.I),
+    re.compile(r"(?:\w+\.)?(\w+)\s+BETWEEN\s+\?$", re.I),
+    re.compile(r"(?:\w+\.)?(\w+)\s+BETWEEN\s+\?\s+AND\s+\?$", re.I),
+    re.compile(r"(?:\w+\.)?(\w+)\s+(?:NOT\s+)?IN\s*\((?:\?\s*,\s*)*\?$", re.I),
+]
+
+
+def param_columns(sql):
+    """[(column, is_written), ...] for each ? in sql, or None if one is not understood."""
+    m = re.match(r"\s*INSERT\s+INTO\s+\w+\s*\(([^)]*)\)\s*VALUES\s*\((.*)\)\s*$", sql, re.I | re.S)
+    if m:
+        pairs = list(zip(m.group(1).split(","), m.group(2).split(",")))
+        out = [(c.strip(), True) for c, v in pairs if v.strip() == "?"]
+        return out if len(out) == sql.count("?") else None
+    where = re.search(r"\bWHERE\b", sql, re.I)
+    out = []
+    for i, ch in enumerate(sql):
+        if ch != "?":
+            continue
+        prefix = sql[:i + 1]
+        m = next((m for m in (r.search(prefix) for r in _PARAM_RES) if m), None)
+        if m is None:
+            return None
+        out.append((m.group(1), sql.upper().startswith("UPDATE") and (where is None or i < where.start())))
+    return out
+
+
+def check_corpus(env, args):
+    corpus = [sql for sql in app_sql_corpus() if db._get_plan(sql).kind not in ("ddl", "last_id")]
+    reads = writes = refused = 0
+    skipped = [sql for sql in corpus if param_columns(sql) is None]
+    for _ in range(args.rounds):
+        for sql in corpus:
+            if sql in skipped:
+                continue
+            plan = db._get_plan(sql)
+            params = [env.value(plan.table, col) if written else env.existing(plan.table, col)
+                      for col, written in param_columns(sql)]
+            label = " ".join(sql.split())[:100]
+            if plan.kind in ("select", "count", "aggregate"):
+                problem = compare_read(env, sql, params, plan)
+                expect(problem is None, f"{label}\n  params:   {params}\n  {problem}")
+                reads += 1
+                continue
+            try:
+                env.lite.execute(sql, params)
+                env.lite.commit()
+            except sqlite3.IntegrityError:
+                refused += 1   # e.g. deleting a car a consignación still points at
+                continue
+            env.supa.execute(sql, params)
+            writes += 1
+            # The written table, and those an ON DELETE CASCADE may reach
+            tables = [t for t in env.tables if t == plan.table or plan.table in env.parents[t].values()]
+            problem = compare_tables(env, tables)
+            expect(problem is None, f"{label}\n  params: {params}\n  {problem}")
+            if plan.kind == "insert":
+                ids = [c.execute("SELECT last_insert_rowid()").fetchone()[0] for c in (env.supa, env.lite)]
+                expect(ids[0] == ids[1], f"{label}\n  last_insert_rowid(): {ids[0]} vs {ids[1]}")
+    for sql in skipped:
+        print("    not checked (parameters not understood):", " ".join(sql.split())[:100])
+    return f"{len(corpus) - len(skipped)} statements: {reads} reads, {writes} writes agree ({refused} refused by SQLite, skipped)"
+
+
+# ─── trees ───────────────────────────────────────────────────────────────────
+TREE_COLS = ["stage", "source", "car_year", "mileage", "appointment_date", "created_at", "full_name", "plate"]
+
+
+def _atom(env, params):
+    rng = env.rng
+    col = rng.choice(TREE_COLS)
+    v = lambda: env.existing("crm_leads", col)  # noqa: E731
+    shape = rng.randrange(9)
+    if shape == 0:
+        lo, hi = sorted([v(), v()], key=str)
+        params += [lo, hi]
+        return f"{col} BETWEEN ? AND ?"
+    if shape == 1:
+        params += [v(), v()]
+        return f"{col} {rng.choice(['IN', 'NOT IN'])} (?, ?)"
+    if shape == 2:
+        return f"stage {rng.choice(['IN', 'NOT IN'])} ('vendido', 'descartado')"
+    if shape == 3:
+        return f"{col} IS {rng.choice(['', 'NOT '])}NULL"
+    if shape == 4 and col in ("full_name", "plate", "stage", "source"):
+        params.append(str(v())[:4] + "%")
+        return f"{col} LIKE ?"
+    if shape == 5:
+        return f"source='{rng.choice(CHOICES['source'])}'"
+    params.append(v())
+    return f"{col} {rng.choice(['=', '>=', '<=', '>', '<'])} ?"
+
+
+def _tree(env, params, depth):
+    if depth == 0 or env.rng.random() < 0.3:
+        return _atom(env, params)
+    word = env.rng.choice(["AND", "OR"])
+    return "(" + f" {word} ".join(_tree(env, params, depth - 1) for _ in range(env.rng.randint(2, 3))) + ")"
+
+
+def check_trees(env, args):
+    for _ in range(args.rounds * 40):
+        params = []
+        where = " AND ".join(_tree(env, params, 3) for _ in range(env.rng.randint(1, 2)))
+        sql = f"SELECT id, stage FROM crm_leads WHERE {where}"
+        problem = compare_read(env, sql, params, db._get_plan(sql))
+        expect(problem is None, f"{sql}\n  params:   {params}\n  {problem}")
+    return f"{args.rounds * 40} WHERE trees agree"
+
+
+# ─── batch ───────────────────────────────────────────────────────────────────
+def check_batch(env, args):
+    marker = f"batch-{time.time_ns()}"
+    posts = env.requests_for("POST", "crm_leads"), env.requests_for("POST", "crm_activities")
+    existing = env.pool("crm_leads", "id")[0]
+    with db.SupabaseConn(batch_writes=True) as conn:
+        # crm_activities is queued first, so grouping by table alone would
+        # send the new leads' children ahead of them
+        conn.execute("INSERT INTO crm_activities (lead_id, type, title) VALUES (?, ?, ?)", (existing, "nota", f"{marker}-pre"))
+        for i in range(3):
+            conn.execute("INSERT INTO crm_leads (full_name, stage, source) VALUES (?, ?, ?)", (f"{marker}-{i}", "nuevo", "check"))
+            lead = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            expect(isinstance(lead, db.PendingId), f"last_insert_rowid() while buffered is {lead!r}, not a PendingId")
+            # Children are queued before the next parent, with two column sets
+            conn.execute("INSERT INTO crm_activities (lead_id, type, title) VALUES (?, ?, ?)", (lead, "nota", f"{marker}-{i}"))
+            conn.execute("INSERT INTO crm_activities (lead_id, type, title, description) VALUES (?, ?, ?, ?)",
+                         (lead, "nota", f"{marker}-{i}", "second"))
+        # A parent the server rejects: its child must not be written with a NULL key
+        conn.execute("INSERT INTO crm_leads (full_name, no_such_column) VALUES (?, ?)", (f"{marker}-bad", 1))
+        bad = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        conn.execute("INSERT INTO crm_activities (lead_id, type, title) VALUES (?, ?, ?)", (bad, "nota", f"{marker}-orphan"))
+    sent = env.requests_for("POST", "crm_leads") - posts[0], env.requests_for("POST", "crm_activities") - posts[1]
+    # crm_leads: the good rows in bulk, then the bad row alone; crm_activities:
+    # the existing lead's child, then the new leads' children per column set
+    expect(sent == (2, 3), f"POSTs (crm_leads, crm_activities) = {sent}, expected (2, 3)")
+    leads = {r["id"]: r["full_name"] for r in env.supa.execute(
+        "SELECT id, full_name FROM crm_leads WHERE full_name LIKE ?", (marker + "%",)).fetchall()}
+    acts = env.supa.execute("SELECT lead_id, title FROM crm_activities WHERE title LIKE ?", (marker + "%",)).fetchall()
+    expect(len(leads) == 3, f"{len(leads)} of 3 leads written")
+    expect(len(acts) == 7, f"{len(acts)} activities written, expected 7 (orphan skipped)")
+    leads[existing] = f"{marker}-pre"
+    for a in acts:
+        expect(leads.get(a["lead_id"]) == a["title"], f"activity {a['title']} points at lead {a['lead_id']}")
+    return "3 parents and 7 children in 5 POSTs, orphan skipped"
+
+
+# ─── cache ───────────────────────────────────────────────────────────────────
+def check_cache(env, args):
+    sql = "SELECT * FROM crm_users WHERE active=1 ORDER BY name"
+    expect("crm_users" in db.SUPABASE_CACHE_TTLS, "crm_users is not in SUPABASE_CACHE_TTLS")
+    db.cache_clear()
+    gets = env.requests_for("GET", "crm_users")
+    first = rows_of(env.supa.execute(sql))
+    expect(rows_of(env.supa.execute(sql)) == first, "a cached read returned different rows")
+    expect(env.requests_for("GET", "crm_users") - gets == 1, "the second read went to the server")
+
+    gen = db.write_generation("crm_users")
+    env.supa.execute("INSERT INTO crm_users (name, email, role, color, sucursal, password) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("Cache Check", f"cache-{time.time_ns()}@example.com", "vendedor", "#000", "x", "x"))
+    uid = env.supa.execute("SELECT last_insert_rowid()").fetchone()[0]
+    expect(db.write_generation("crm_users") > gen, "the INSERT did not bump crm_users' write generation")
+    expect(any(r["id"] == uid for r in rows_of(env.supa.execute(sql))), "the read after an INSERT missed the new row")
+
+    # Another worker's write is not seen until the TTL, except with cache=False
+    r = requests.patch(f"{env.url}/rest/v1/crm_users", params={"id": f"eq.{uid}"}, json={"name": "Renamed"},
+                       headers={"apikey": "local"})
+    expect(r.status_code in (200, 204), f"out-of-band PATCH: HTTP {r.status_code}")
+    cached = {r["id"]: r["name"] for r in rows_of(env.supa.execute(sql))}
+    fresh = {r["id"]: r["name"] for r in rows_of(env.supa.execute(sql, cache=False))}
+    expect(cached[uid] == "Cache Check", "the cache was bypassed without a write from this process")
+    expect(fresh[uid] == "Renamed", "cache=False returned cached rows")
+    stats = db.cache_stats()["crm_users"]
+    return f"hits={stats['hits']} misses={stats['misses']} invalidations={stats['invalidations']}"
+
+
+# ─── paging ──────────────────────────────────────────────────────────────────
+def check_paging(env, args):
+    n = 2500
+    with db.SupabaseConn(batch_writes=True) as conn:
+        for i in range(n):
+            conn.execute("INSERT INTO funnel_listings (id, url, year) VALUES (?, ?, ?)",
+                         (f"page-{i:05d}", f"https://paging.example/{i}", 2015 + i % 5))
+    r = requests.get(f"{env.url}/rest/v1/funnel_listings", params={"select": "id", "url": "like.https://paging*"},
+                     headers={"apikey": "local"})
+    expect(len(r.json()) == 1000, f"one unranged GET returned {len(r.json())} rows; the stub should cap at 1000")
+    gets = env.requests_for("GET", "funnel_listings")
+    result = env.supa.execute("SELECT id, year FROM funnel_listings WHERE url LIKE ? ORDER BY year DESC",
+                              ("https://paging.example/%",))
+    pages = [len(p) for p in result.iter_pages()]
+    expect(pages == [1000, 1000, 500], f"page sizes {pages}")
+    expect(env.requests_for("GET", "funnel_listings") - gets == 3, "expected one GET per page")
+    rows = env.supa.execute("SELECT id, year FROM funnel_listings WHERE url LIKE ? ORDER BY year DESC",
+                            ("https://paging.example/%",)).fetchall()
+    ids = [r["id"] for r in rows]
+    expect(len(set(ids)) == n, f"{len(set(ids))} distinct of {n} rows: offsets over tied years are not stable")
+    expect([r["year"] for r in rows] == sorted((r["year"] for r in rows), reverse=True), "rows out of order across pages")
+    return f"{n} rows in pages {pages}"
+
+
+# ─── breaker ─────────────────────────────────────────────────────────────────
+def check_breaker(env, args):
+    saved = db.SUPABASE_BREAKER_THRESHOLD, db.SUPABASE_BREAKER_COOLDOWN, db.SUPABASE_RETRIES
+    db.SUPABASE_BREAKER_THRESHOLD, db.SUPABASE_BREAKER_COOLDOWN, db.SUPABASE_RETRIES = 3, 0.3, 0
+    host = env.url.split("://", 1)[1]
+    sql = "SELECT id FROM crm_leads WHERE id=?"
+
+    def call():
+        try:
+            env.supa.execute(sql, (1,))
+            return "ok"
+        except db.SupabaseUnavailable as e:
+            return "open" if "circuit open" in str(e) else "failed"
+
+    def state():
+        return db.breaker_state().get(host, {}).get("open", False)
+
+    try:
+        env.stub.config["error_rate"] = 1.0
+        outcomes = [call() for _ in range(3)]
+        expect(outcomes == ["failed"] * 3 and state(), f"3 failures gave {outcomes}, breaker open={state()}")
+        sent = env.requests_for("GET", "crm_leads")
+        expect(call() == "open" and env.requests_for("GET", "crm_leads") == sent,
+               "an open breaker let a request through")
+
+        time.sleep(db.SUPABASE_BREAKER_COOLDOWN)
+        expect(call() == "failed" and env.requests_for("GET", "crm_leads") == sent + 1,
+               "after the cooldown, exactly one probe should reach the server")
+        expect(state() and call() == "open", "a failed probe did not re-open the breaker")
+
+        env.stub.config["error_rate"] = 0.0
+        time.sleep(db.SUPABASE_BREAKER_COOLDOWN)
+        expect(call() == "ok" and not state(), "a successful probe did not close the breaker")
+        expect(call() == "ok", "the closed breaker rejected a request")
+    finally:
+        env.stub.config["error_rate"] = 0.0
+        db.SUPABASE_BREAKER_THRESHOLD, db.SUPABASE_BREAKER_COOLDOWN, db.SUPABASE_RETRIES = saved
+    return "open after 3 failures, failed probe re-opens, good probe closes"
+
+
+CHECKS = {
+    "corpus": check_corpus,
+    "trees": check_trees,
+    "batch": check_batch,
+    "cache": check_cache,
+    "paging": check_paging,
+    "breaker": check_breaker,
+}
+
+
+def main(args):
+    only = [c.strip() for c in args.only.split(",")] if args.only else list(CHECKS)
+    unknown = [c for c in only if c not in CHECKS]
+    if unknown:
+        print("Unknown check(s): {} (choose from {})".format(", ".join(unknown), ", ".join(CHECKS)))
+        return 2
+    with tempfile.TemporaryDirectory(prefix="check_db-") as tmp:
+        env = Env(Path(tmp), random.Random(args.seed))
+        try:
+            env.load(args.rows)
+            for name in only:
+                try:
+                    summary = CHECKS[name](env, args)
+                except CheckFailed as e:
+                    print(f"FAIL {name}: {e}")
+                    return 1
+                print(f"  {name:<8} OK — {summary}")
+        finally:
+            env.lite.close()
+            env.server.shutdown()
+            env.server.server_close()
+    print("OK — the Supabase path agrees with SQLite")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="db.py's Supabase adapter vs. its SQLite backend, over local_supabase.py")
+    parser.add_argument("--rounds", type=int, default=5, help="Parameter draws per corpus statement")
+    parser.add_argument("--rows", type=int, default=40, help="Generated rows per table")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", help="Comma-separated subset of: " + ", ".join(CHECKS))
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""
+check_vehicle_matching.py — VehicleIndex.match() against scoring every lead.
+
+Builds random lead lists (Funnels-style titles split into make/model, partial
+names, punctuation, missing fields), runs random queries through the index
+and through a plain loop over score(), and fails on the first difference.
+Exits 1 on a mismatch, so it can gate a deploy.
+
+Usage:
+    python execution/check_vehicle_matching.py
+    python execution/check_vehicle_matching.py --rounds=200 --leads=500 --seed=7
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from execution.vehicle_matching import VehicleIndex, score, _year  # noqa: E402
+
+MAKES = ["Mazda", "Toyota", "Kia", "BMW", "Mercedes-Benz", "Hyundai", "Chevrolet", "Ford", "MG"]
+MODELS = ["3", "CX-30", "CX-5", "CX 5", "RAV", "RAV4", "Yaris", "Yaris Sport", "X1", "X",
+          "Rio", "Rio 5", "Creta", "Sail", "F-150", "150", "-", "ZS", "Mazda 3", "Grand i10", "i10"]
+
+
+def random_lead(rng, lid):
+    make, model = rng.choice(MAKES), rng.choice(MODELS)
+    year = rng.randint(2005, 2025)
+    shape = rng.random()
+    if shape < 0.2:
+        # Funnels title split: year as make, "Make Model" as model
+        make, model = str(year), "{} {}".format(make, model)
+    elif shape < 0.3:
+        make = None
+    elif shape < 0.4:
+        model = None if rng.random() < 0.5 else "  "
+    return {
+        "id": lid,
+        "car_make": make if rng.random() < 0.8 else (make or "").upper(),
+        "car_model": model,
+        "car_year": rng.choice([year, str(year), None, "s/i"]),
+    }
+
+
+def random_query(rng):
+    make = rng.choice(MAKES + ["", "maz", "benz", "-"])
+    model = rng.choice(MODELS + ["", "cx", "Yaris Cross", "RAV4 Hybrid", "CX-30 Signature"])
+    if rng.random() < 0.3:
+        model = model[: rng.randint(0, len(model))]
+    return make, model, rng.choice([None, rng.randint(2004, 2026)])
+
+
+def brute_force(leads, make, model, year, limit, min_score):
+    make = (make or "").lower().strip()
+    model = (model or "").lower().strip()
+    if not make and not model:
+        return []
+    year = _year(year)
+    scored = sorted((-score(make, model, year, lead), lead["id"]) for lead in leads)
+    hits = [(-neg, lid) for neg, lid in scored if -neg >= min_score]
+    return hits[:limit] if limit else hits
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    checked = 0
+    for _ in range(args.rounds):
+        leads = [random_lead(rng, lid) for lid in range(1, rng.randint(1, args.leads) + 1)]
+        index = VehicleIndex()
+        index.sync(leads)
+        # Exercise incremental maintenance too: edit and drop some leads
+        for lead in rng.sample(leads, len(leads) // 5):
+            lead.update(random_lead(rng, lead["id"]))
+        leads = [lead for lead in leads if rng.random() > 0.1]
+        index.sync([dict(lead) for lead in leads])
+        for _ in range(args.queries):
+            make, model, year = random_query(rng)
+            limit = rng.choice([1, 8, 0])
+            min_score = rng.choice([10, 15, 30, 40, 45, 55, 60, 70, 80, 90, 110])
+            got = [(s, lead["id"]) for s, lead in index.match(make, model, year, limit, min_score)]
+            want = brute_force(leads, make, model, year, limit, min_score)
+            checked += 1
+            if got != want:
+                print("MISMATCH query={!r} limit={} min_score={}".format((make, model, year), limit, min_score))
+                print("  index: {}".format(got[:10]))
+                print("  brute: {}".format(want[:10]))
+                return 1
+    print("OK — {} queries matched scoring every lead".format(checked))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VehicleIndex vs. brute-force scoring")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--leads", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,787 @@
+"""
+local_supabase.py — A local stand-in for the Supabase REST and Storage APIs.
+
+Speaks the subset of PostgREST and Supabase Storage that db.py and app.py use,
+on top of a SQLite file, so the Supabase data path can be exercised and
+benchmarked without a live project:
+
+    /rest/v1/<table>               GET HEAD POST PATCH DELETE
+        filters   eq neq gt gte lt lte like ilike in is, not.<op>, or=(…), and=(…)
+        select    columns, alias:col, count(), col.sum()/avg()/min()/max(),
+                  alias:table!fk_col(cols) many-to-one embeds
+        paging    order=col.desc.nullslast, limit, offset, Range / Content-Range,
+                  at most --max-rows per response (PostgREST's max-rows)
+        Prefer    return=representation, count=exact,
+                  resolution=merge-duplicates|ignore-duplicates (+ on_conflict=)
+    /storage/v1/object/<bucket>/<path>          GET POST PUT DELETE
+    /storage/v1/object/public/<bucket>/<path>   GET
+
+Tables from setup_crm.sql are created up front and reject unknown columns the
+way PostgREST does. Any other table (appointments, appraisals, …) is created on
+its first write and grows columns as records need them; reading it before then
+returns no rows.
+
+Latency and failures can be injected to measure what pooling, batching and
+retries buy: every request sleeps --latency-ms (+ up to --jitter-ms) and fails
+with a 503 at --error-rate. Both can be changed while running with
+PATCH /_stub {"latency_ms": 80, "error_rate": 0.05}; GET /_stub returns the
+current settings and per-table request counts.
+
+Usage:
+    python execution/local_supabase.py                      # http://127.0.0.1:54321
+    python execution/local_supabase.py --latency-ms=40 --jitter-ms=20 --error-rate=0.02
+    python execution/local_supabase.py --seed=appointments.json   # {"table": [rows]}
+
+    # then, in another terminal
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_ANON_KEY=local python app.py
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_ANON_KEY=local \
+        python execution/bench_db.py queries
+"""
+
+import argparse
+import json
+import mimetypes
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ROOT = Path(__file__).parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+
+# ─── Config ─────────────────────────────────────────────────────────────────
+DATA_DIR = ROOT / "data" / "local_supabase"
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=",
+        "like": "LIKE", "ilike": "LIKE"}
+_AGGS = {"count", "sum", "avg", "min", "max"}
+
+
+class RestError(Exception):
+    """Becomes a PostgREST-style error body: {"code", "message"}."""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status, self.code, self.message = status, code, message
+
+
+# ─── Query Parsing ───────────────────────────────────────────────────────────
+def split_top(text, sep=","):
+    """Split on sep outside parentheses and double quotes."""
+    parts, depth, quoted, buf = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == sep:
+            parts.append("".join(buf))
+            buf = []
+            continue
+        buf.append(ch)
+    parts.append("".join(buf))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def unquote_value(v):
+    v = v.strip()
+    if len(v) >= 2 and v[0] == v[-1] == '"':
+        return v[1:-1].replace('\\"', '"')
+    return v
+
+
+def parse_tree(expr):
+    """`(a.eq.1,and(b.gt.2,c.is.null))` → ("or"/"and", [conditions…])."""
+    return [parse_condition(p) for p in split_top(expr.strip()[1:-1])]
+
+
+def parse_condition(text):
+    m = re.match(r"(not\.)?(or|and)\((.*)\)$", text, re.S)
+    if m:
+        return ("tree", bool(m.group(1)), m.group(2), parse_tree(f"({m.group(3)})"))
+    col, _, rest = text.partition(".")
+    return ("cond", col, rest)
+
+
+class Table:
+    """Column names and declared types of one SQLite table."""
+
+    def __init__(self, name, columns, managed):
+        self.name = name
+        self.columns = columns  # {name: declared type, upper-cased}
+        self.managed = managed  # from setup_crm.sql: unknown columns are an error
+
+    def kind(self, col):
+        return self.columns.get(col, "")
+
+    def check(self, col):
+        if col not in self.columns:
+            raise RestError(400, "42703", f"column {self.name}.{col} does not exist")
+
+
+class Store:
+    """The SQLite side: schema, per-thread connections and the statements."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.tables = {}
+        self.json_cols = self._schema_json_columns()
+        conn = self.conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for stmt in db._sqlite_schema():
+            try:
+                conn.execute(stmt)
+            except sqlite3.OperationalError as e:
+                print(f"[stub] schema: {e}")
+        conn.commit()
+        managed = set(self.json_cols)
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+            self._load_table(name, managed=name in managed)
+
+    @staticmethod
+    def _schema_json_columns():
+        """JSONB columns per table; the SQLite schema keeps them as TEXT."""
+        text = (ROOT / "setup_crm.sql").read_text(encoding="utf-8")
+        out = {}
+        for name, body in re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\);", text, re.S | re.I):
+            out[name] = set(re.findall(r"^\s*(\w+)\s+JSONB", body, re.M | re.I))
+        return out
+
+    def conn(self):
+        c = getattr(self.local, "conn", None)
+        if c is None:
+            c = self.local.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            c.execute("PRAGMA foreign_keys=ON")   # REFERENCES / ON DELETE CASCADE as in Postgres
+        return c
+
+    def _load_table(self, name, managed=None):
+        cols = {}
+        for _, col, decl, *_ in self.conn().execute(f'PRAGMA table_info("{name}")'):
+            decl = (decl or "").upper()
+            if col in self.json_cols.get(name, ()):
+                decl = "JSON"
+            cols[col] = decl
+        if managed is None:
+            managed = name in self.tables and self.tables[name].managed
+        self.tables[name] = Table(name, cols, managed)
+        return self.tables[name]
+
+    def table(self, name):
+        return self.tables.get(name)
+
+    def ensure_table(self, name, records):
+        """Create/extend an unmanaged table so every record key has a column."""
+        t = self.tables.get(name)
+        keys = {}
+        for rec in records:
+            for k, v in rec.items():
+                if v is not None or k not in keys:
+                    keys[k] = _decl_for(v)
+        if t is None:
+            if not re.match(r"^\w+$", name):
+                raise RestError(404, "PGRST205", f"Could not find the table 'public.{name}'")
+            # Supabase-side tables often use uuid keys supplied by the client
+            id_decl = keys.get("id", "INTEGER")
+            cols = ['"id" INTEGER PRIMARY KEY AUTOINCREMENT' if id_decl == "INTEGER" else '"id" TEXT PRIMARY KEY']
+            cols += [f'"{k}" {d}' for k, d in keys.items() if k != "id"]
+            cols.append('"created_at" TEXT DEFAULT CURRENT_TIMESTAMP' if "created_at" not in keys else "")
+            self.conn().execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({", ".join(c for c in cols if c)})')
+            return self._load_table(name, managed=False)
+        missing = [k for k in keys if k not in t.columns]
+        if missing and t.managed:
+            t.check(missing[0])
+        for k in missing:
+            self.conn().execute(f'ALTER TABLE "{name}" ADD COLUMN "{k}" {keys[k]}')
+        return self._load_table(name) if missing else t
+
+
+def _decl_for(v):
+    if isinstance(v, bool):
+        return "BOOLEAN"
+    if isinstance(v, int):
+        return "INTEGER"
+    if isinstance(v, float):
+        return "REAL"
+    if isinstance(v, (dict, list)):
+        return "JSON"
+    return "TEXT"
+
+
+def to_sql_value(t, col, v):
+    """A JSON value or filter string, as SQLite should store/compare it."""
+    kind = t.kind(col)
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, str) and kind == "BOOLEAN" and v in ("true", "false"):
+        return int(v == "true")
+    return v
+
+
+def from_sql_row(t, cols, values):
+    row = {}
+    for col, v in zip(cols, values):
+        kind = t.kind(col) if t else ""
+        if v is not None and kind == "BOOLEAN":
+            v = bool(v)
+        elif isinstance(v, str) and kind == "JSON":
+            try:
+                v = json.loads(v)
+            except ValueError:
+                pass
+        row[col] = v
+    return row
+
+
+# ─── SQL Builder ─────────────────────────────────────────────────────────────
+class Query:
+    """One PostgREST request translated into WHERE / ORDER / LIMIT pieces."""
+
+    def __init__(self, table, params):
+        self.t = table
+        self.where, self.args = [], []
+        for key, values in params.items():
+            if key in _RESERVED:
+                continue
+            for value in values:
+                if key in ("or", "and", "not.or", "not.and"):
+                    neg = key.startswith("not.")
+                    node = ("tree", neg, key.rpartition(".")[2], parse_tree(value))
+                else:
+                    node = ("cond", key, value)
+                self.where.append(self.node_sql(node, self.args))
+
+    def node_sql(self, node, args):
+        if node[0] == "tree":
+            _, neg, op, children = node
+            sql = "(" + f" {op.upper()} ".join(self.node_sql(c, args) for c in children) + ")"
+            return f"NOT {sql}" if neg else sql
+        _, col, rest = node
+        col = col.split("->", 1)[0]
+        self.t.check(col)
+        neg = rest.startswith("not.")
+        if neg:
+            rest = rest[4:]
+        op, _, value = rest.partition(".")
+        qcol = f'"{col}"'
+        if op == "is":
+            sql = {"null": f"{qcol} IS NULL", "true": f"{qcol} = 1",
+                   "false": f"{qcol} = 0", "unknown": f"{qcol} IS NULL"}.get(value.lower())
+            if sql is None:
+                raise RestError(400, "PGRST100", f"failed to parse filter (is.{value})")
+        elif op == "in":
+            items = [unquote_value(v) for v in split_top(value.strip()[1:-1])]
+            if not items:
+                sql = "0"
+            else:
+                sql = f"{qcol} IN ({', '.join('?' * len(items))})"
+                args.extend(to_sql_value(self.t, col, v) for v in items)
+        elif op in _OPS:
+            value = unquote_value(value)
+            if op in ("like", "ilike"):
+                value = value.replace("*", "%")
+                sql = f"{qcol} LIKE ?" if op == "ilike" else f"{qcol} GLOB ?"
+                if op == "like":
+                    value = value.replace("%", "*").replace("_", "?")
+            else:
+                sql = f"{qcol} {_OPS[op]} ?"
+            args.append(to_sql_value(self.t, col, value))
+        else:
+            raise RestError(400, "PGRST100", f"failed to parse filter ({op})")
+        return f"NOT ({sql})" if neg else sql
+
+    def where_sql(self):
+        return (" WHERE " + " AND ".join(self.where)) if self.where else ""
+
+    def order_sql(self, order):
+        if not order:
+            return ""
+        parts = []
+        for item in split_top(order):
+            col, *mods = item.split(".")
+            self.t.check(col)
+            sql = f'"{col}"'
+            for m in mods:
+                sql += {"asc": " ASC", "desc": " DESC",
+                        "nullsfirst": " NULLS FIRST", "nullslast": " NULLS LAST"}.get(m, "")
+            parts.append(sql)
+        return " ORDER BY " + ", ".join(parts)
+
+
+def parse_select(t, select):
+    """
+    → (columns [(out, expr)], aggregates [(out, func, col)], embeds
+    [(out, table, fk_col, cols)]). expr is a column name or "*".
+    """
+    columns, aggs, embeds = [], [], []
+    for item in split_top(select or "*"):
+        alias, sep, body = item.partition(":")
+        if not sep or "(" in alias:
+            alias, body = None, item
+        body = body.split("::", 1)[0]
+        m = re.match(r"(\w+)(?:!(\w+))?\((.*)\)$", body, re.S)
+        if m and m.group(1) == "count" and not m.group(3):
+            aggs.append((alias or "count", "count", "*"))
+        elif m:
+            table, fk, cols = m.groups()
+            embeds.append((alias or table, table, fk, cols))
+        elif re.match(r"\w+\.\w+\(\)$", body):
+            col, func = body[:-2].split(".")
+            if func not in _AGGS:
+                raise RestError(400, "PGRST100", f"unknown aggregate {func}")
+            t.check(col)
+            aggs.append((alias or func, func, col))
+        elif body == "*":
+            columns.append(("*", "*"))
+        else:
+            t.check(body)
+            columns.append((alias or body, body))
+    return columns, aggs, embeds
+
+
+# ─── REST Handlers ───────────────────────────────────────────────────────────
+class Rest:
+    def __init__(self, store, max_rows=None):
+        self.store = store
+        self.max_rows = max_rows
+
+    def select(self, name, params, headers, head=False):
+        t = self.store.table(name)
+        prefer = headers.get("Prefer", "")
+        if t is None:
+            return 200, {"Content-Range": "*/0"}, []
+        q = Query(t, params)
+        conn = self.store.conn()
+        columns, aggs, embeds = parse_select(t, params.get("select", ["*"])[0])
+
+        total = None
+        if "count=exact" in prefer:
+            total = conn.execute(f'SELECT COUNT(*) FROM "{name}"{q.where_sql()}', q.args).fetchone()[0]
+
+        start, limit = _window(params, headers)
+        if self.max_rows:
+            limit = self.max_rows if limit is None else min(limit, self.max_rows)
+        if aggs:
+            groups = [(out, expr) for out, expr in columns if expr != "*"]
+            sel = [f'"{expr}" AS "{out}"' for out, expr in groups]
+            sel += [f'COUNT(*) AS "{out}"' if col == "*" else f'{func.upper()}("{col}") AS "{out}"'
+                    for out, func, col in aggs]
+            sql = f'SELECT {", ".join(sel)} FROM "{name}"{q.where_sql()}'
+            if groups:
+                sql += " GROUP BY " + ", ".join(f'"{expr}"' for _, expr in groups)
+        else:
+            sel = ["*" if expr == "*" else f'"{expr}" AS "{out}"' for out, expr in columns]
+            for _, _, fk, _ in embeds:
+                if fk and ("*", "*") not in columns:
+                    sel.append(f'"{fk}"')
+            sql = f'SELECT {", ".join(sel) or "*"} FROM "{name}"{q.where_sql()}'
+        sql += q.order_sql(params.get("order", [""])[0])
+        if limit is not None or start:
+            sql += f" LIMIT {limit if limit is not None else -1} OFFSET {start}"
+        cur = conn.execute(sql, q.args)
+        cols = [d[0] for d in cur.description]
+        rows = [from_sql_row(t, cols, r) for r in cur.fetchall()]
+        if embeds:
+            self._embed(t, rows, embeds, columns)
+
+        end = start + len(rows) - 1
+        content_range = f"{start}-{end}" if rows else "*"
+        content_range += f"/{total if total is not None else '*'}"
+        status = 206 if total is not None and len(rows) < total - start else 200
+        return status, {"Content-Range": content_range}, (None if head else rows)
+
+    def _embed(self, t, rows, embeds, columns):
+        """Many-to-one embeds: row[fk_col] → <table>.id."""
+        conn = self.store.conn()
+        keep_fk = ("*", "*") in columns
+        for out, table, fk, cols in embeds:
+            target = self.store.table(table)
+            if fk is None or target is None:
+                raise RestError(400, "PGRST200", f"Could not find a relationship between '{t.name}' and '{table}'")
+            t.check(fk)
+            keys = {r.get(fk) for r in rows if r.get(fk) is not None}
+            found = {}
+            if keys:
+                wanted = [c.strip() for c in split_top(cols or "*")]
+                for c in wanted:
+                    if c != "*":
+                        target.check(c)
+                sel = "*" if "*" in wanted else ", ".join(f'"{c}"' for c in set(wanted) | {"id"})
+                cur = conn.execute(f'SELECT {sel} FROM "{table}" WHERE "id" IN ({", ".join("?" * len(keys))})',
+                                   list(keys))
+                names = [d[0] for d in cur.description]
+                for r in cur.fetchall():
+                    rec = from_sql_row(target, names, r)
+                    found[rec["id"]] = {k: rec[k] for k in (names if "*" in wanted else wanted)}
+            for r in rows:
+                r[out] = found.get(r.get(fk))
+                if not keep_fk and fk not in [e for _, e in columns]:
+                    r.pop(fk, None)
+
+    def insert(self, name, params, headers, body):
+        records = body if isinstance(body, list) else [body]
+        if not records:
+            return 201, {}, []
+        if not all(isinstance(r, dict) for r in records):
+            raise RestError(400, "PGRST102", "All object keys must match")
+        prefer = headers.get("Prefer", "")
+        resolution = re.search(r"resolution=(merge|ignore)-duplicates", prefer)
+        conflict = params.get("on_conflict", ["id"])[0].split(",") if resolution else None
+
+        out_ids = []
+        with self.store.write_lock:
+            conn = self.store.conn()
+            t = self.store.ensure_table(name, records)
+            try:
+                for rec in records:
+                    for k in rec:
+                        t.check(k)
+                    rowid = None
+                    if conflict and all(c in rec for c in conflict):
+                        where = " AND ".join(f'"{c}" = ?' for c in conflict)
+                        hit = conn.execute(f'SELECT rowid FROM "{name}" WHERE {where}',
+                                           [to_sql_value(t, c, rec[c]) for c in conflict]).fetchone()
+                        if hit and resolution.group(1) == "ignore":
+                            continue
+                        if hit:
+                            rowid = hit[0]
+                            sets = ", ".join(f'"{k}" = ?' for k in rec)
+                            conn.execute(f'UPDATE "{name}" SET {sets} WHERE rowid = ?',
+                                         [to_sql_value(t, k, v) for k, v in rec.items()] + [rowid])
+                    if rowid is None:
+                        if rec:
+                            cols = ", ".join(f'"{k}"' for k in rec)
+                            cur = conn.execute(f'INSERT INTO "{name}" ({cols}) VALUES ({", ".join("?" * len(rec))})',
+                                               [to_sql_value(t, k, v) for k, v in rec.items()])
+                        else:
+                            cur = conn.execute(f'INSERT INTO "{name}" DEFAULT VALUES')
+                        rowid = cur.lastrowid
+                    out_ids.append(rowid)
+                conn.commit()
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                code = "23505" if "UNIQUE" in str(e) else "23502"
+                raise RestError(409 if code == "23505" else 400, code, str(e))
+        if "return=representation" not in prefer:
+            return 201, {}, None
+        return 201, {}, self._rows_by_rowid(t, out_ids, params)
+
+    def update(self, name, params, headers, body):
+        t = self.store.table(name)
+        if t is None:
+            return 200, {}, []
+        if not isinstance(body, dict):
+            raise RestError(400, "PGRST102", "PATCH body must be a JSON object")
+        for k in body:
+            t.check(k)
+        q = Query(t, params)
+        with self.store.write_lock:
+            conn = self.store.conn()
+            ids = [r[0] for r in conn.execute(f'SELECT rowid FROM "{name}"{q.where_sql()}', q.args)]
+            if ids and body:
+                sets = ", ".join(f'"{k}" = ?' for k in body)
+                conn.execute(f'UPDATE "{name}" SET {sets} WHERE rowid IN ({", ".join("?" * len(ids))})',
+                             [to_sql_value(t, k, v) for k, v in body.items()] + ids)
+                conn.commit()
+        if "return=representation" not in headers.get("Prefer", ""):
+            return 204, {}, None
+        return 200, {}, self._rows_by_rowid(t, ids, params)
+
+    def delete(self, name, params, headers):
+        t = self.store.table(name)
+        if t is None:
+            return 204, {}, None
+        q = Query(t, params)
+        with self.store.write_lock:
+            conn = self.store.conn()
+            ids = [r[0] for r in conn.execute(f'SELECT rowid FROM "{name}"{q.where_sql()}', q.args)]
+            rows = self._rows_by_rowid(t, ids, params) if "return=representation" in headers.get("Prefer", "") else None
+            if ids:
+                conn.execute(f'DELETE FROM "{name}" WHERE rowid IN ({", ".join("?" * len(ids))})', ids)
+                conn.commit()
+        return (204, {}, None) if rows is None else (200, {}, rows)
+
+    def _rows_by_rowid(self, t, ids, params):
+        if not ids:
+            return []
+        columns, _, _ = parse_select(t, params.get("select", ["*"])[0])
+        sel = ", ".join("*" if e == "*" else f'"{e}" AS "{o}"' for o, e in columns) or "*"
+        cur = self.store.conn().execute(
+            f'SELECT {sel}, rowid AS "__rowid" FROM "{t.name}" WHERE rowid IN ({", ".join("?" * len(ids))})', ids)
+        cols = [d[0] for d in cur.description]
+        by_id = {}
+        for r in cur.fetchall():
+            row = from_sql_row(t, cols, r)
+            by_id[row.pop("__rowid")] = row
+        return [by_id[i] for i in ids if i in by_id]
+
+
+def _window(params, headers):
+    """(offset, limit) from ?offset=&limit= and a Range: a-b header."""
+    start = int(params.get("offset", ["0"])[0] or 0)
+    limit = params.get("limit", [None])[0]
+    limit = int(limit) if limit not in (None, "") else None
+    m = re.match(r"\s*(\d+)-(\d*)\s*$", headers.get("Range", ""))
+    if m:
+        start += int(m.group(1))
+        if m.group(2):
+            span = int(m.group(2)) - int(m.group(1)) + 1
+            limit = span if limit is None else min(limit, span)
+    return start, limit
+
+
+# ─── Storage ─────────────────────────────────────────────────────────────────
+class Storage:
+    """Buckets are directories under root; object keys are relative paths."""
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+
+    def path(self, bucket, key):
+        p = (self.root / bucket / key).resolve()
+        if self.root not in p.parents or not key:
+            raise RestError(400, "InvalidKey", f"Invalid key: {key}")
+        return p
+
+    def get(self, bucket, key):
+        p = self.path(bucket, key)
+        if not p.is_file():
+            return 404, {"Content-Type": "application/json"}, {"statusCode": "404", "error": "not_found",
+                                                               "message": "Object not found"}
+        mime = mimetypes.guess_type(p.name)[0] or "application/octet-stream"
+        return 200, {"Content-Type": mime}, p.read_bytes()
+
+    def put(self, bucket, key, data, upsert):
+        p = self.path(bucket, key)
+        if p.exists() and not upsert:
+            return 400, {}, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"}
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(data)
+        return 200, {}, {"Key": f"{bucket}/{key}"}
+
+    def delete(self, bucket, key):
+        p = self.path(bucket, key)
+        if not p.is_file():
+            return 404, {}, {"statusCode": "404", "error": "not_found", "message": "Object not found"}
+        p.unlink()
+        return 200, {}, {"message": "Successfully deleted"}
+
+
+# ─── HTTP Server ─────────────────────────────────────────────────────────────
+class Stub:
+    """Shared state for the handler threads: backends, fault injection, counters."""
+
+    def __init__(self, db_path, storage_dir, latency_ms=0, jitter_ms=0, error_rate=0.0, max_rows=1000):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.rest = Rest(Store(db_path), max_rows)
+        self.storage = Storage(storage_dir)
+        self.config = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def inject(self):
+        """Sleep for the configured latency; True if this request should fail."""
+        cfg = self.config
+        delay = cfg["latency_ms"] + random.uniform(0, cfg["jitter_ms"])
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return random.random() < cfg["error_rate"]
+
+    def seed(self, path):
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        for table, rows in data.items():
+            self.rest.insert(table, {}, {}, rows)
+            print(f"[stub] seeded {table}: {len(rows)} rows")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in two writes; without TCP_NODELAY a keep-alive
+    # client waits out the delayed ACK (~40 ms) on every response
+    disable_nagle_algorithm = True
+    stub = None  # set by make_server
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        stub = self.stub
+        try:
+            if parts[:1] == ["_stub"]:
+                return self.control(method, raw)
+            with stub.lock:
+                stub.requests[f"{method} {'/'.join(parts[:3])}"] += 1
+            if stub.inject():
+                return self.send(503, {}, {"code": "PGRST000", "message": "local_supabase: injected failure"})
+            params = parse_qs(url.query, keep_blank_values=True)
+            if parts[:2] == ["rest", "v1"] and len(parts) == 3:
+                status, headers, body = self.rest_call(method, parts[2], params, raw)
+            elif parts[:3] == ["storage", "v1", "object"] and len(parts) >= 5:
+                status, headers, body = self.storage_call(method, parts[3:], raw)
+            else:
+                status, headers, body = 404, {}, {"message": f"no route for {url.path}"}
+        except RestError as e:
+            status, headers, body = e.status, {}, {"code": e.code, "message": e.message,
+                                                   "details": None, "hint": None}
+        except sqlite3.Error as e:
+            status, headers, body = 400, {}, {"code": "PGRST100", "message": str(e),
+                                              "details": None, "hint": None}
+        except Exception as e:
+            print(f"[stub] {method} {url.path} failed: {e!r}")
+            status, headers, body = 500, {}, {"code": "XX000", "message": str(e)}
+        self.send(status, headers, None if method == "HEAD" else body)
+
+    def rest_call(self, method, table, params, raw):
+        rest = self.stub.rest
+        if method in ("GET", "HEAD"):
+            return rest.select(table, params, self.headers, head=method == "HEAD")
+        body = None
+        if raw:
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                raise RestError(400, "PGRST102", "Empty or invalid json")
+        if method == "POST":
+            return rest.insert(table, params, self.headers, body if body is not None else {})
+        if method == "PATCH":
+            return rest.update(table, params, self.headers, body or {})
+        if method == "DELETE":
+            return rest.delete(table, params, self.headers)
+        return 405, {}, {"message": f"{method} not supported"}
+
+    def storage_call(self, method, parts, raw):
+        storage = self.stub.storage
+        if parts[0] in ("public", "authenticated", "sign"):
+            if method != "GET":
+                return 405, {}, {"message": f"{method} not supported"}
+            parts = parts[1:]
+        bucket, key = parts[0], "/".join(parts[1:])
+        if method == "GET":
+            return storage.get(bucket, key)
+        if method in ("POST", "PUT"):
+            upsert = method == "PUT" or self.headers.get("x-upsert", "").lower() == "true"
+            return storage.put(bucket, key, raw, upsert)
+        if method == "DELETE":
+            return storage.delete(bucket, key)
+        return 405, {}, {"message": f"{method} not supported"}
+
+    def control(self, method, raw):
+        stub = self.stub
+        if method == "PATCH" and raw:
+            changes = json.loads(raw)
+            for k, v in changes.items():
+                if k in stub.config:
+                    stub.config[k] = float(v)
+        elif method == "DELETE":
+            with stub.lock:
+                stub.requests.clear()
+        with stub.lock:
+            body = {"config": dict(stub.config), "requests": dict(stub.requests)}
+        self.send(200, {}, body)
+
+    def send(self, status, headers, body):
+        if isinstance(body, (bytes, bytearray)):
+            payload = bytes(body)
+        elif body is None:
+            payload = b""
+        else:
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode()
+            headers.setdefault("Content-Type", "application/json; charset=utf-8")
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if payload and self.command != "HEAD":
+            self.wfile.write(payload)
+
+
+def make_server(host="127.0.0.1", port=54321, db_path=None, storage_dir=None,
+                latency_ms=0, jitter_ms=0, error_rate=0.0, verbose=False, max_rows=1000):
+    """Build (not start) the server; port=0 picks a free one."""
+    stub = Stub(db_path or DATA_DIR / "rest.db", storage_dir or DATA_DIR / "storage",
+                latency_ms, jitter_ms, error_rate, max_rows)
+    handler = type("BoundHandler", (Handler,), {"stub": stub})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.stub = stub
+    return server
+
+
+def serve_in_thread(**kwargs):
+    """Start a server on a background thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────────
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local PostgREST + Storage stand-in backed by SQLite.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--db", default=str(DATA_DIR / "rest.db"), help="SQLite file for /rest/v1")
+    parser.add_argument("--storage-dir", default=str(DATA_DIR / "storage"), help="Directory for /storage/v1")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra latency, 0..N ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with 503")
+    parser.add_argument("--max-rows", type=int, default=1000,
+                        help="Rows per response at most, like PostgREST's max-rows (0 = no cap)")
+    parser.add_argument("--seed", help='JSON file {"table": [rows]} inserted at startup')
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = make_server(args.host, args.port, args.db, args.storage_dir,
+                         args.latency_ms, args.jitter_ms, args.error_rate, args.verbose,
+                         args.max_rows)
+    if args.seed:
+        server.stub.seed(args.seed)
+    print(f"[stub] PostgREST + Storage on http://{args.host}:{server.server_address[1]} "
+          f"(db={args.db}, latency={args.latency_ms}±{args.jitter_ms} ms, errors={args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,244 @@
+"""
+vehicle_matching.py — Match an appointment's car against Funnels leads.
+
+Scoring (unchanged from the original calendar loop):
+    +40  appointment make found in the lead's make/model text
+    +40  appointment model and lead model contain one another
+    +30  same year (or +15 when one year apart)
+    A lead is suggested from 60 points up.
+
+Funnels often stores a title like "2017 Mazda CX-5" as car_make="2017",
+car_model="Mazda CX-5", which is why the make is searched in both fields.
+
+VehicleIndex keeps the leads in an inverted index (word → leads, year →
+leads), so a lookup only scores the leads that can still reach the minimum
+score instead of every lead, and keeps the best few with a heap rather than
+sorting all hits. Since the scoring uses substring tests in both directions,
+a query word finds the indexed words containing it and the indexed words
+contained in it. sync() applies a fresh candidate list incrementally: only
+leads whose make/model/year changed are re-indexed.
+
+execution/check_vehicle_matching.py compares match() with scoring every lead.
+
+Used by the calendar suggestions and consignación creation in app.py, and by
+the Funnels dashboard for parsing listing titles.
+
+Usage (as module):
+    from execution.vehicle_matching import VehicleIndex, parse_title
+    index = VehicleIndex()
+    index.sync(rows)                         # dicts with id, car_make, car_model, car_year
+    index.match("Toyota", "Yaris", 2019)     # → [(score, lead), ...] best first
+    index.match_many([("Mazda", "CX-5", 2017), ...])
+    parse_title("2017 Mazda CX-5")           # → ("Mazda", "CX-5", 2017)
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+
+MIN_SCORE = 60
+MAKE_POINTS, MODEL_POINTS, YEAR_POINTS, NEAR_YEAR_POINTS = 40, 40, 30, 15
+
+_WORD_RE = re.compile(r"\w+")
+_TITLE_YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+
+
+def _year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _words(text):
+    return set(_WORD_RE.findall(text))
+
+
+def parse_title(title):
+    """
+    (make, model, year) from a FB Marketplace title like "2025 Hyundai Creta".
+    The year may also appear later in the title; missing parts are None.
+    """
+    if not title:
+        return None, None, None
+    parts = title.split()
+    year_match = _TITLE_YEAR_RE.search(title)
+    year = int(year_match.group()) if year_match else None
+    if parts and parts[0].isdigit() and len(parts[0]) == 4:
+        parts = parts[1:]
+    make = parts[0] if parts else None
+    model = " ".join(parts[1:]) if len(parts) > 1 else None
+    return make, model, year
+
+
+def score(make, model, year, lead):
+    """Points for one lead; make/model are lower-cased and stripped."""
+    c_make = (lead.get("car_make") or "").lower().strip()
+    c_model = (lead.get("car_model") or "").lower().strip()
+    c_year = _year(lead.get("car_year"))
+    points = 0
+    if make and make in c_make + " " + c_model:
+        points += MAKE_POINTS
+    if model and c_model and (model in c_model or c_model in model):
+        points += MODEL_POINTS
+    if year and c_year:
+        if year == c_year:
+            points += YEAR_POINTS
+        elif abs(year - c_year) <= 1:
+            points += NEAR_YEAR_POINTS
+    return points
+
+
+class VehicleIndex:
+    """Funnels leads indexed by the words of make + model and by year."""
+
+    def __init__(self):
+        self.leads = {}      # id → lead dict
+        self._keys = {}      # id → (make, model, year) as indexed
+        self._by_word = {}   # word → {ids}
+        self._by_year = {}   # year → {ids}
+        self._wordless = set()   # ids whose model has no word characters
+        self._expand_memo = {}
+
+    def __len__(self):
+        return len(self.leads)
+
+    # ── Maintenance ──
+    def add(self, lead):
+        lid = lead["id"]
+        key = (lead.get("car_make"), lead.get("car_model"), _year(lead.get("car_year")))
+        if self._keys.get(lid) == key:
+            self.leads[lid] = lead   # other fields (price, url…) may have changed
+            return
+        self.remove(lid)
+        self.leads[lid] = lead
+        self._keys[lid] = key
+        text = "{} {}".format(key[0] or "", key[1] or "").lower()
+        for w in _words(text):
+            if w not in self._by_word:
+                self._expand_memo.clear()   # a new word can satisfy old substrings
+            self._by_word.setdefault(w, set()).add(lid)
+        if key[2] is not None:
+            self._by_year.setdefault(key[2], set()).add(lid)
+        if (key[1] or "").strip() and not _words((key[1] or "").lower()):
+            self._wordless.add(lid)
+
+    def remove(self, lid):
+        key = self._keys.pop(lid, None)
+        self.leads.pop(lid, None)
+        self._wordless.discard(lid)
+        if key is None:
+            return
+        text = "{} {}".format(key[0] or "", key[1] or "").lower()
+        for w in _words(text):
+            ids = self._by_word.get(w)
+            if ids is not None:
+                ids.discard(lid)
+                if not ids:
+                    del self._by_word[w]
+                    self._expand_memo.clear()
+        if key[2] is not None:
+            ids = self._by_year.get(key[2])
+            if ids is not None:
+                ids.discard(lid)
+
+    def sync(self, rows):
+        """Make the index hold exactly rows, touching only what changed."""
+        seen = set()
+        for row in rows:
+            seen.add(row["id"])
+            self.add(row)
+        for lid in [lid for lid in self.leads if lid not in seen]:
+            self.remove(lid)
+
+    # ── Lookup ──
+    def _expand(self, word):
+        """Indexed words containing word (the scoring uses substring tests)."""
+        found = self._expand_memo.get(word)
+        if found is None:
+            found = self._expand_memo[word] = [w for w in self._by_word if word in w]
+        return found
+
+    def _posting(self, text, contained=False):
+        """
+        Leads with an indexed word containing a word of text — and, with
+        contained, also those with an indexed word inside a word of text.
+        """
+        ids = set()
+        for word in _words(text):
+            for w in self._expand(word):
+                ids |= self._by_word[w]
+            if contained:
+                for i in range(len(word)):
+                    for j in range(i + 1, len(word) + 1):
+                        ids |= self._by_word.get(word[i:j], set())
+        return ids
+
+    def _years(self, year, spread):
+        ids = set()
+        for y in range(year - spread, year + spread + 1):
+            ids |= self._by_year.get(y, set())
+        return ids
+
+    def candidates(self, make, model, year, min_score=MIN_SCORE):
+        """
+        Leads that can reach min_score. A make hit means each word of the
+        query make sits inside a word of the lead; a model hit means that, or
+        (lead model inside query model) the other way round. So only those
+        words' postings and the year buckets within reach are looked at.
+        """
+        if min_score <= 0 or (make and not _words(make)):
+            return set(self.leads)   # nothing to narrow by
+        by_make = self._posting(make) if make else set()
+        by_model = set()
+        if model:
+            by_model = self._posting(model, contained=True) | self._wordless
+            if not _words(model):
+                by_model |= set(self.leads)
+        either = by_make | by_model
+        best_hit = max(MAKE_POINTS if make else 0, MODEL_POINTS if model else 0)
+        if best_hit >= min_score:
+            found = either
+        else:
+            found = by_make & by_model
+            if year is not None and best_hit + NEAR_YEAR_POINTS >= min_score:
+                found |= either & self._years(year, 1)
+            elif year is not None and best_hit + YEAR_POINTS >= min_score:
+                found |= either & self._years(year, 0)
+        # A year alone only qualifies when min_score is set very low
+        if year is not None and NEAR_YEAR_POINTS >= min_score:
+            found |= self._years(year, 1)
+        elif year is not None and YEAR_POINTS >= min_score:
+            found |= self._years(year, 0)
+        return found
+
+    def match(self, make, model, year, limit=8, min_score=MIN_SCORE):
+        """[(score, lead), ...] best first, ties in id order."""
+        make = (make or "").lower().strip()
+        model = (model or "").lower().strip()
+        if not make and not model:
+            return []
+        year = _year(year)
+        scored = []
+        for lid in self.candidates(make, model, year, min_score):
+            lead = self.leads[lid]
+            points = score(make, model, year, lead)
+            if points >= min_score:
+                scored.append((-points, lid))
+        best = heapq.nsmallest(limit, scored) if limit else sorted(scored)
+        return [(-neg, self.leads[lid]) for neg, lid in best]
+
+    def match_many(self, queries, limit=8, min_score=MIN_SCORE):
+        """
+        match() for a batch of (make, model, year) queries, in order. Repeats
+        of the same car (common within a month of appointments) are scored once.
+        """
+        memo = {}
+        out = []
+        for make, model, year in queries:
+            key = ((make or "").lower().strip(), (model or "").lower().strip(), _year(year))
+            if key not in memo:
+                memo[key] = self.match(*key, limit=limit, min_score=min_score)
+            out.append(memo[key])
+        return out
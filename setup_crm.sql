@@ -144,6 +144,17 @@ CREATE TABLE IF NOT EXISTS crm_leads (
 CREATE INDEX IF NOT EXISTS idx_crm_leads_stage ON crm_leads(stage);
 CREATE INDEX IF NOT EXISTS idx_crm_leads_plate ON crm_leads(plate);
 
+-- Trigram indexes so the CRM search box (or=(col.ilike.*x*,...)) is
+-- answered with a BitmapOr over these instead of a sequential scan
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_crm_leads_full_name_trgm ON crm_leads USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_plate_trgm ON crm_leads USING gin (plate gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_phone_trgm ON crm_leads USING gin (phone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_email_trgm ON crm_leads USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_rut_trgm ON crm_leads USING gin (rut gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_car_make_trgm ON crm_leads USING gin (car_make gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_crm_leads_car_model_trgm ON crm_leads USING gin (car_model gin_trgm_ops);
+
 -- ─── CRM Activities ───────────────────────────────────────────
 CREATE TABLE IF NOT EXISTS crm_activities (
   id SERIAL PRIMARY KEY,
@@ -268,3 +279,9 @@ CREATE INDEX IF NOT EXISTS idx_compradores_consig ON compradores(consignacion_id
 ALTER TABLE compradores ENABLE ROW LEVEL SECURITY;
 DROP POLICY IF EXISTS "Service role full access" ON compradores;
 CREATE POLICY "Service role full access" ON compradores USING (true) WITH CHECK (true);
+
+-- ─── PostgREST aggregates ─────────────────────────────────────
+-- Lets db.py push GROUP BY / COUNT / SUM down as aggregate selects
+-- (select=stage,count()). Without it the adapter aggregates locally.
+ALTER ROLE authenticator SET pgrst.db_aggregates_enabled = 'true';
+NOTIFY pgrst, 'reload config';
@@ -38,3 +38,7 @@ CREATE POLICY "Public read listings" ON listings
 DROP POLICY IF EXISTS "Service role write listings" ON listings;
 CREATE POLICY "Service role write listings" ON listings
   USING (true) WITH CHECK (true);
+
+-- One listing per consignación: lets the CRM publish with a single upsert
+-- (POST ?on_conflict=consignacion_id, Prefer: resolution=merge-duplicates)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_listings_consignacion_id ON listings(consignacion_id);